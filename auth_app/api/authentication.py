@@ -0,0 +1,22 @@
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+
+
+class CookieJWTAuthentication(JWTStatelessUserAuthentication):
+    """
+    Authenticate with the access token from the ``Authorization`` header
+    or, if there is none, from the ``access_token`` cookie set at login.
+
+    Stateless: the user is built from the token's claims without a database
+    query, which is all the media endpoints need to know.
+    """
+
+    def authenticate(self, request):
+        if self.get_header(request) is not None:
+            return super().authenticate(request)
+
+        raw_token = request.COOKIES.get("access_token")
+        if not raw_token:
+            return None
+
+        validated_token = self.get_validated_token(raw_token.encode())
+        return self.get_user(validated_token), validated_token
@@ -17,6 +17,9 @@ echo "PostgreSQL ist bereit - fahre fort..."
 python manage.py collectstatic --noinput
 python manage.py makemigrations
 python manage.py migrate
+python manage.py rebuild_playable_index
+python manage.py build_segment_indexes
+python manage.py expire_uploads
 
 # Create a superuser using environment variables
 # (Dein Superuser-Erstellungs-Code bleibt gleich)
@@ -40,4 +43,16 @@ EOF
 
 python manage.py rqworker default &
 
+# One transcode worker per ffmpeg slot of this host unless set explicitly.
+TRANSCODE_WORKERS="${TRANSCODE_WORKERS:-$(python manage.py transcode_budget --processes)}"
+for i in $(seq 1 "$TRANSCODE_WORKERS"); do
+  python manage.py rqworker transcode &
+done
+
+if [ "${SERVER_INTERFACE:-wsgi}" = "asgi" ]; then
+  # Event-loop workers: a slow client holds a coroutine, not a process.
+  exec gunicorn core.asgi:application --bind 0.0.0.0:8000 \
+    --worker-class uvicorn_worker.UvicornWorker --workers "${WEB_WORKERS:-2}"
+fi
+
 exec gunicorn core.wsgi:application --bind 0.0.0.0:8000 --reload
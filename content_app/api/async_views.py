@@ -0,0 +1,143 @@
+import asyncio
+import os
+from django.http import JsonResponse
+from django.utils.cache import patch_vary_headers
+from django.views import View
+from rest_framework.exceptions import AuthenticationFailed
+from auth_app.api.authentication import CookieJWTAuthentication
+from content_app.models import Video
+from core import settings
+from .delivery import SEGMENT_CONTENT_TYPES, aserve_file
+from .manifest_cache import load_manifest, manifest_cache
+from .playable_index import ais_playable
+from .segment_index import load_rendition_playlist
+from .signing import playlist_response, verify_segment_token
+from .thumbnails import requested_width, select_thumbnail
+
+
+def playlist_access_denied(request):
+    """
+    Return a 401 response if signed URLs are on and the request carries no
+    valid access token, else None. Stateless, so no database query runs.
+    """
+    if not settings.SIGNED_MEDIA_URLS:
+        return None
+    try:
+        if CookieJWTAuthentication().authenticate(request) is not None:
+            return None
+    except AuthenticationFailed:
+        pass
+    return JsonResponse(
+        {"detail": "Authentication credentials were not provided or are invalid."}, status=401
+    )
+
+
+class AsyncVideoManifestView(View):
+    """
+    Async variant of ``VideoManifestView`` for the ASGI deployment profile.
+
+    Cache hits are answered without leaving the event loop; the playable
+    index lookup and the playlist read of a miss run on worker threads.
+    """
+
+    async def get(self, request, movie_id, resolution, *args, **kwargs):
+        if denied := playlist_access_denied(request):
+            return denied
+
+        key = (movie_id, resolution)
+        entry = manifest_cache.get(key)
+        if entry is None:
+            generation = manifest_cache.generation
+            if not await ais_playable(movie_id, resolution):
+                return JsonResponse({"error": "Video not found"}, status=404)
+
+            rendition_dir = os.path.join(settings.MEDIA_ROOT, "videos", str(movie_id), resolution)
+
+            try:
+                entry = await asyncio.to_thread(load_rendition_playlist, rendition_dir)
+            except OSError:
+                manifest_path = os.path.join(rendition_dir, "index.m3u8")
+                return JsonResponse({"error": "Manifest not found", "path": manifest_path}, status=404)
+            manifest_cache.put(key, entry, generation)
+
+        return playlist_response(request, entry, movie_id, resolution)
+
+
+class AsyncVideoMasterPlaylistView(View):
+    """
+    Async variant of ``VideoMasterPlaylistView``.
+    """
+
+    async def get(self, request, movie_id, *args, **kwargs):
+        if denied := playlist_access_denied(request):
+            return denied
+
+        key = (movie_id, "master")
+        entry = manifest_cache.get(key)
+        if entry is None:
+            generation = manifest_cache.generation
+            if not await ais_playable(movie_id):
+                return JsonResponse({"error": "Video not found"}, status=404)
+
+            master_path = os.path.join(settings.MEDIA_ROOT, "videos", str(movie_id), "master.m3u8")
+
+            try:
+                entry = await asyncio.to_thread(load_manifest, master_path)
+            except OSError:
+                return JsonResponse({"error": "Manifest not found", "path": master_path}, status=404)
+            manifest_cache.put(key, entry, generation)
+
+        return playlist_response(request, entry, movie_id, "master")
+
+
+class AsyncVideoSegmentView(View):
+    """
+    Async variant of ``VideoSegmentView``.
+
+    The segment is streamed in chunks read on worker threads, so a slow
+    client holds a suspended coroutine rather than a worker process. Hot
+    segments are streamed from the shared-memory ``segment_cache`` instead
+    of the disk. With ``MEDIA_DELIVERY_MODE`` set to an offload mode, the
+    proxy sends the file with sendfile instead.
+    """
+
+    async def get(self, request, movie_id, resolution, segment, *args, **kwargs):
+        if settings.SIGNED_MEDIA_URLS and not verify_segment_token(movie_id, resolution, request.GET):
+            return JsonResponse({"error": "Invalid or expired segment token"}, status=403)
+
+        if not await ais_playable(movie_id, resolution):
+            return JsonResponse({"error": "Video not found"}, status=404)
+
+        segment_path = os.path.join(
+            settings.MEDIA_ROOT, "videos", str(movie_id), resolution, segment
+        )
+
+        content_type = SEGMENT_CONTENT_TYPES.get(os.path.splitext(segment)[1])
+        if content_type is None:
+            return JsonResponse({"error": "Segment not found", "path": segment_path}, status=404)
+        try:
+            return await aserve_file(request, segment_path, content_type, hot_cache=True, versioned=True)
+        except FileNotFoundError:
+            return JsonResponse({"error": "Segment not found", "path": segment_path}, status=404)
+
+
+class AsyncThumbnailView(View):
+    """
+    Async variant of ``ThumbnailView``.
+    """
+
+    async def get(self, request, movie_id, *args, **kwargs):
+        if not await Video.objects.filter(id=movie_id).aexists():
+            return JsonResponse({"error": "Video not found"}, status=404)
+
+        base_output_dir = os.path.join(settings.MEDIA_ROOT, "videos", str(movie_id))
+        thumbnail_path, content_type = await asyncio.to_thread(
+            select_thumbnail, base_output_dir, request.headers.get("Accept"), requested_width(request)
+        )
+
+        try:
+            response = await aserve_file(request, thumbnail_path, content_type)
+        except FileNotFoundError:
+            return JsonResponse({"error": "Thumbnail not found", "path": str(thumbnail_path)}, status=404)
+        patch_vary_headers(response, ("Accept",))
+        return response
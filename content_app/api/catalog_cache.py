@@ -0,0 +1,222 @@
+import hashlib
+import logging
+import secrets
+import time
+from urllib.parse import urlencode
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+from .compression import ENCODINGS, variant_etag
+from .delivery import REVALIDATE_CACHE_CONTROL
+from .fast_json import render_json
+
+
+logger = logging.getLogger(__name__)
+
+# All keys share the ``{catalog}`` hash tag, so the keys of a script are
+# in one slot on a Redis Cluster too.
+VERSION_KEY = "videoflix:{catalog}:version"
+MODIFIED_KEY = "videoflix:{catalog}:modified"
+ENTRY_PREFIX = "videoflix:{catalog}:entry:"
+LOCK_PREFIX = "videoflix:{catalog}:lock:"
+
+# A rebuild holding the lock longer than this is presumed dead.
+REBUILD_LOCK_SECONDS = 10
+# How long and how often a request waits for a concurrent rebuild.
+REBUILD_WAIT_SECONDS = 5
+REBUILD_POLL_SECONDS = 0.05
+
+# Reads the current version, the time it was set and the request's entry
+# in one round trip. A catalog never bumped (or whose keys Redis lost) is
+# taken as modified now. Every key is passed in KEYS, as scripts must
+# declare the keys they access: the entry key is therefore not versioned,
+# and the entry names its version instead (see ``entry_body``).
+FETCH_SCRIPT = """
+local version = redis.call('GET', KEYS[1]) or '0'
+local modified = redis.call('GET', KEYS[2])
+if not modified then
+    modified = ARGV[1]
+    redis.call('SET', KEYS[2], modified)
+end
+return {version, modified, redis.call('GET', KEYS[3])}
+"""
+
+
+# Deletes a rebuild lock only if it still holds the caller's token, so a
+# request whose lock expired never removes one taken over by another.
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def bump_catalog_version():
+    """
+    Move every catalog response out of the cache by switching to a new
+    version; entries of older versions are rebuilt on their next request
+    or expire after ``CATALOG_CACHE_TTL``.
+    The time of the switch is the catalog's ``Last-Modified``.
+
+    Called whenever a video is saved, deleted or changes status. Best
+    effort: if Redis is down, nothing is served from it either.
+    """
+    try:
+        pipeline = get_redis_connection("default").pipeline()
+        pipeline.incr(VERSION_KEY)
+        pipeline.set(MODIFIED_KEY, int(time.time()))
+        pipeline.execute()
+    except RedisError:
+        logger.warning("Could not bump the catalog version", exc_info=True)
+
+
+def request_key(request):
+    """
+    Return the cache key part of a catalog request: a hash of its path,
+    host (``next`` links are absolute) and normalised query.
+    """
+    query = urlencode(sorted(request.GET.lists()), doseq=True)
+    return hashlib.blake2b(
+        f"{request.scheme}://{request.get_host()}{request.path}?{query}".encode("utf-8"), digest_size=16
+    ).hexdigest()
+
+
+def entry_body(entry, version):
+    """
+    Return the body of a cached ``<version>:<body>`` entry if it was built
+    under ``version``, else None.
+    """
+    if entry is None:
+        return None
+    entry_version, _, body = entry.partition(b":")
+    return body if entry_version == version else None
+
+
+def catalog_validators(version, modified, key):
+    """
+    Return the ``(ETag, Last-Modified timestamp)`` of a catalog response.
+
+    The ETag names the request and the catalog version; the bump time is
+    part of it too, so versions counted again after Redis lost its data
+    never reuse an old tag.
+    """
+    return f'"{version.decode()}.{modified.decode()}-{key}"', int(modified)
+
+
+def not_modified_response(request, etag, last_modified):
+    """
+    Return a 304 if the client's copy of the catalog response is current,
+    else None.
+
+    The ETags of every coding of the current version match: depending on
+    its size and compressibility, ``compress_response`` sends a body as is
+    or compressed, so the client may hold either. The 304 carries the tag
+    the client holds.
+    """
+    held = {tag.removeprefix("W/") for tag in parse_etags(request.headers.get("If-None-Match", ""))}
+    candidates = [etag, *(variant_etag(etag, encoding) for encoding in ENCODINGS)]
+    etag = next((candidate for candidate in candidates if candidate in held), etag)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        add_validators(response, etag, last_modified)
+    return response
+
+
+def add_validators(response, etag, last_modified):
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    response["Cache-Control"] = REVALIDATE_CACHE_CONTROL
+    return response
+
+
+def json_response(body, etag, last_modified):
+    return add_validators(HttpResponse(body, content_type="application/json"), etag, last_modified)
+
+
+def wait_for_rebuild(connection, entry_key, lock_key, version):
+    """
+    Poll for the entry of ``version`` a concurrent request is building.
+
+    Returns None on timeout, or as soon as the lock is released without an
+    entry (the build was not a cacheable 200), so the caller builds itself.
+    """
+    deadline = time.monotonic() + REBUILD_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(REBUILD_POLL_SECONDS)
+        entry, locked = connection.mget(entry_key, lock_key)
+        body = entry_body(entry, version)
+        if body is not None or locked is None:
+            return body
+    return None
+
+
+def release_lock(connection, lock_key, token):
+    try:
+        connection.eval(RELEASE_SCRIPT, 1, lock_key, token)
+    except RedisError:
+        logger.warning("Could not release a catalog rebuild lock", exc_info=True)
+
+
+def cached_catalog_response(request, build):
+    """
+    Serve a catalog response from Redis, or build and cache it.
+
+    Entries are keyed by the request (see ``request_key``) and hold the
+    catalog version they were built under, so a hit is a single Redis
+    round trip: a script reads the version and the entry together, and an
+    entry of an older version is a miss.
+
+    Responses carry an ``ETag`` and ``Last-Modified`` derived from the
+    version (see ``catalog_validators``), so a client polling an unchanged
+    catalog gets a 304 without anything being built or sent.
+
+    On a miss, one request takes a short lock and runs ``build``; concurrent
+    misses of the same key wait for its entry instead of all querying the
+    database. The lock is released however ``build`` ends, and only by
+    the request holding it. Only 200 responses are cached; ``build``
+    returns a DRF ``Response``. If Redis is unreachable, ``build`` is
+    served directly, without validators.
+    """
+    key = request_key(request)
+    entry_key = f"{ENTRY_PREFIX}{key}"
+    try:
+        connection = get_redis_connection("default")
+        version, modified, entry = connection.eval(
+            FETCH_SCRIPT, 3, VERSION_KEY, MODIFIED_KEY, entry_key, int(time.time())
+        )
+        body = entry_body(entry, version)
+        etag, last_modified = catalog_validators(version, modified, key)
+        not_modified = not_modified_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        if body is not None:
+            return json_response(body, etag, last_modified)
+
+        lock_key = f"{LOCK_PREFIX}{version.decode()}:{key}"
+        token = secrets.token_hex(16)
+        if not connection.set(lock_key, token, nx=True, ex=REBUILD_LOCK_SECONDS):
+            token = None
+            body = wait_for_rebuild(connection, entry_key, lock_key, version)
+            if body is not None:
+                return json_response(body, etag, last_modified)
+    except RedisError:
+        logger.warning("Catalog cache unavailable, querying the database", exc_info=True)
+        return build()
+
+    try:
+        response = build()
+        if response.status_code != 200:
+            return response
+        body = render_json(response.data)
+        try:
+            connection.set(entry_key, version + b":" + body, ex=settings.CATALOG_CACHE_TTL)
+        except RedisError:
+            logger.warning("Could not cache a catalog response", exc_info=True)
+    finally:
+        if token is not None:
+            release_lock(connection, lock_key, token)
+    return json_response(body, etag, last_modified)
@@ -0,0 +1,162 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+
+# Bodies smaller than this are sent as is; the encoding overhead would eat
+# most of the gain.
+MIN_COMPRESS_SIZE = 256
+
+# Content codings in order of preference.
+ENCODINGS = ("br", "gzip") if brotli else ("gzip",)
+
+# Compression levels: the best ratio for bodies compressed once and sent
+# many times, a fast one for short-lived bodies compressed on the request
+# path.
+BEST_LEVELS = {"br": 11, "gzip": 9}
+FAST_LEVELS = {"br": 5, "gzip": 6}
+
+
+def compress(body, encoding, fast=False):
+    """
+    Compress ``body`` with the given content coding.
+
+    By default at its best ratio, for bodies that are compressed once and
+    sent many times, so the slower highest levels pay off. ``fast`` uses
+    ``FAST_LEVELS`` instead.
+    """
+    level = (FAST_LEVELS if fast else BEST_LEVELS)[encoding]
+    if encoding == "br":
+        return brotli.compress(body, mode=brotli.MODE_TEXT, quality=level)
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+def compressed_variants(body, fast=False):
+    """
+    Return ``{encoding: compressed body}`` for every supported coding that
+    makes ``body`` smaller; see ``compress`` for ``fast``.
+    """
+    if len(body) < MIN_COMPRESS_SIZE:
+        return {}
+    variants = {encoding: compress(body, encoding, fast) for encoding in ENCODINGS}
+    return {encoding: variant for encoding, variant in variants.items() if len(variant) < len(body)}
+
+
+def accepted_encodings(request):
+    """
+    Return the codings of ``Accept-Encoding`` the client accepts (q > 0).
+    """
+    accepted = set()
+    for item in request.headers.get("Accept-Encoding", "").split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def negotiate_encoding(request, variants):
+    """
+    Return the preferred coding among ``variants`` the client accepts, or
+    None to send the identity body.
+    """
+    if not variants:
+        return None
+    accepted = accepted_encodings(request)
+    return next(
+        (encoding for encoding in ENCODINGS if encoding in variants and (encoding in accepted or "*" in accepted)),
+        None,
+    )
+
+
+def variant_etag(etag, encoding):
+    """
+    Return the strong ETag of an encoded representation; each coding gets
+    its own, as their bytes differ.
+    """
+    return f'{etag[:-1]}-{encoding}"' if encoding else etag
+
+
+class CompressionCache:
+    """
+    Per-process LRU of compressed response bodies keyed by a hash of the
+    uncompressed body and the coding.
+
+    Catalog payloads change rarely but are rendered per request; hashing
+    the rendered body is far cheaper than compressing it again, so every
+    distinct payload is compressed once per worker.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, body, encoding):
+        key = (hashlib.blake2b(body, digest_size=16).digest(), encoding)
+        with self._lock:
+            compressed = self._entries.get(key)
+            if compressed is not None:
+                self._entries.move_to_end(key)
+                return compressed
+        compressed = compress(body, encoding)
+        with self._lock:
+            self._entries[key] = compressed
+            while len(self._entries) > settings.COMPRESSION_CACHE_SIZE:
+                self._entries.popitem(last=False)
+        return compressed
+
+
+compression_cache = CompressionCache()
+
+
+def compress_response(request, response):
+    """
+    Replace the body of a rendered 200 response with its cached compressed
+    form if the client accepts one, adding ``Vary: Accept-Encoding``.
+    """
+    patch_vary_headers(response, ("Accept-Encoding",))
+    if (
+        response.status_code != 200 or response.streaming or response.has_header("Content-Encoding")
+        or len(response.content) < MIN_COMPRESS_SIZE
+    ):
+        return response
+    encoding = negotiate_encoding(request, ENCODINGS)
+    if encoding is None:
+        return response
+
+    compressed = compression_cache.get(response.content, encoding)
+    if len(compressed) >= len(response.content):
+        return response
+    response.content = compressed
+    response["Content-Encoding"] = encoding
+    response["Content-Length"] = str(len(compressed))
+    if response.has_header("ETag"):
+        response["ETag"] = variant_etag(response["ETag"], encoding)
+    return response
+
+
+class CompressedResponseMixin:
+    """
+    APIView mixin sending JSON responses compressed per ``Accept-Encoding``,
+    from the ``compression_cache``.
+    """
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if hasattr(response, "render") and not response.is_rendered:
+            response.render()
+        return compress_response(request, response)
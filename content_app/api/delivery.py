@@ -0,0 +1,431 @@
+import asyncio
+import os
+import re
+import secrets
+from functools import partial
+from pathlib import Path
+from urllib.parse import quote, urlencode
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe
+from .compression import negotiate_encoding, variant_etag
+from .segment_cache import segment_cache
+
+
+RANGE_SPEC_PATTERN = re.compile(r"^(\d*)-(\d*)$")
+STREAM_CHUNK_SIZE = 64 * 1024
+# More ranges than this in one request are answered with the whole file.
+MAX_RANGES = 16
+
+SEGMENT_CONTENT_TYPES = {
+    ".ts": "video/mp2t",
+    ".m4s": "video/iso.segment",
+    ".mp4": "video/mp4",
+}
+
+# Segments and sprite sheets are written once into a staging directory and
+# published complete, but keep their names when a title is re-transcoded.
+# Playlists and the trickplay track name each of them with a VERSION_PARAM,
+# the file's ETag, so caches may keep a URL for good once it names the file's
+# current version; other URLs are revalidated. Playlists and posters are
+# rewritten in place (progressive publish, re-transcodes) and must be
+# revalidated, which the stat-based validators make a cheap 304.
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+PRIVATE_REVALIDATE_CACHE_CONTROL = "private, no-cache"
+VERSION_PARAM = "v"
+
+
+class UnsatisfiableRange(ValueError):
+    """
+    Raised when a ``Range`` header lies completely outside the file.
+    """
+
+
+def parse_ranges(header, size):
+    """
+    Parse a ``Range: bytes=<start>-<end>[, ...]`` header.
+
+    Ranges lying outside the file are dropped and the others are clipped to
+    it, in request order.
+
+    Returns
+    -------
+    list | None
+        Inclusive ``(start, end)`` offsets, or None if there is no usable
+        header and the whole file should be sent.
+
+    Raises
+    ------
+    UnsatisfiableRange
+        If no range overlaps the file.
+    """
+    unit, _, specs = (header or "").partition("=")
+    if unit.strip() != "bytes" or not specs:
+        return None
+
+    ranges = []
+    for spec in specs.split(","):
+        match = RANGE_SPEC_PATTERN.match(spec.strip())
+        if not match or match.groups() == ("", ""):
+            return None
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+            if last and int(last) < start:
+                return None
+        else:
+            start = max(0, size - int(last))
+            end = size - 1
+        if start <= end and start < size:
+            ranges.append((start, end))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+    if not ranges:
+        raise UnsatisfiableRange(header)
+    return ranges
+
+
+def file_slice(path, start, length):
+    """
+    Yield ``length`` bytes of a file starting at ``start`` in small chunks.
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(STREAM_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def file_validators(stat):
+    """
+    Return the ``(ETag, Last-Modified timestamp)`` of a file from its stat
+    data alone, without reading it.
+
+    The ETag is strong since size and nanosecond mtime change with every
+    rewrite, and files are only ever replaced whole.
+    """
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"', int(stat.st_mtime)
+
+
+def file_version(stat):
+    """
+    Return the ``VERSION_PARAM`` value naming a file's current content: its
+    ETag without the quotes.
+    """
+    return file_validators(stat)[0].strip('"')
+
+
+def versioned_uri(uri, version):
+    """
+    Return ``uri`` with the ``VERSION_PARAM`` query of a file version.
+    """
+    return f"{uri}?{urlencode({VERSION_PARAM: version})}"
+
+
+def published_cache_control(request, etag, cache_control):
+    """
+    Return ``IMMUTABLE_CACHE_CONTROL`` if the request URL names the served
+    file's current version, else ``cache_control``.
+
+    The version is compared with the file itself, so a URL with a stale or
+    made-up version can never pin other bytes in a shared cache.
+    """
+    if request.GET.get(VERSION_PARAM) == etag.strip('"'):
+        return IMMUTABLE_CACHE_CONTROL
+    return cache_control
+
+
+def if_range_matches(request, etag, last_modified):
+    """
+    Return True if a ``Range`` request should be honoured under its
+    ``If-Range`` precondition (or if it has none).
+    """
+    if_range = request.headers.get("If-Range")
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/"')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def multipart_ranges(path, ranges, size, content_type, boundary):
+    """
+    Return the ``multipart/byteranges`` body of several ranges as a
+    generator, together with its length.
+    """
+    parts = [
+        (
+            f"--{boundary}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode("ascii")
+        for start, end in ranges
+    ]
+    closing = f"--{boundary}--\r\n".encode("ascii")
+    length = len(closing) + sum(
+        len(part) + end - start + 1 + 2 for part, (start, end) in zip(parts, ranges)
+    )
+
+    def body():
+        for part, (start, end) in zip(parts, ranges):
+            yield part
+            yield from file_slice(path, start, end - start + 1)
+            yield b"\r\n"
+        yield closing
+
+    return body(), length
+
+
+def offload_response(path, content_type):
+    """
+    Return an empty response telling the front proxy to send ``path``.
+
+    ``"x-accel"`` (nginx) maps the file below ``MEDIA_ROOT`` to the internal
+    ``MEDIA_ACCEL_PREFIX`` location; ``"x-sendfile"`` (Apache, lighttpd)
+    passes the absolute path. The proxy then handles ranges and the
+    transfer itself, so no worker is held while the file is sent.
+
+    Raises
+    ------
+    Http404
+        If the path does not resolve to a file below ``MEDIA_ROOT``.
+    """
+    media_root = Path(settings.MEDIA_ROOT).resolve()
+    resolved = Path(path).resolve()
+    if not resolved.is_relative_to(media_root):
+        raise Http404("File not found")
+
+    response = HttpResponse(content_type=content_type)
+    if settings.MEDIA_DELIVERY_MODE == "x-accel":
+        relative = resolved.relative_to(media_root).as_posix()
+        response["X-Accel-Redirect"] = settings.MEDIA_ACCEL_PREFIX.rstrip("/") + "/" + quote(relative)
+    elif settings.MEDIA_DELIVERY_MODE == "x-sendfile":
+        response["X-Sendfile"] = str(resolved)
+    else:
+        raise ImproperlyConfigured(f"Unknown MEDIA_DELIVERY_MODE: {settings.MEDIA_DELIVERY_MODE}")
+    return response
+
+
+async def iterate_in_thread(iterable):
+    """
+    Yield the chunks of a blocking iterator, advancing it on a worker thread
+    so the event loop never waits on a disk read.
+    """
+    iterator = iter(iterable)
+    done = object()
+    try:
+        while (chunk := await asyncio.to_thread(next, iterator, done)) is not done:
+            yield chunk
+    finally:
+        if hasattr(iterator, "close"):
+            await asyncio.to_thread(iterator.close)
+
+
+def range_response(path, content_type, size, ranges, asynchronous=False):
+    """
+    Build the body response for the whole file (``ranges`` None), a single
+    range or several ranges.
+
+    With ``asynchronous`` the body is an async iterator, as ASGI servers
+    need it to stream without holding a thread per response.
+    """
+    stream = iterate_in_thread if asynchronous else iter
+    if ranges is None:
+        if not asynchronous:
+            return FileResponse(open(path, "rb"), content_type=content_type)
+        response = StreamingHttpResponse(stream(file_slice(path, 0, size)), content_type=content_type)
+        response["Content-Length"] = str(size)
+        return response
+
+    if len(ranges) == 1:
+        (start, end), = ranges
+        response = StreamingHttpResponse(
+            stream(file_slice(path, start, end - start + 1)), status=206, content_type=content_type
+        )
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = str(end - start + 1)
+        return response
+
+    boundary = secrets.token_hex(16)
+    body, length = multipart_ranges(path, ranges, size, content_type, boundary)
+    response = StreamingHttpResponse(
+        stream(body), status=206, content_type=f"multipart/byteranges; boundary={boundary}"
+    )
+    response["Content-Length"] = str(length)
+    return response
+
+
+def serve_file(request, path, content_type, cache_control=REVALIDATE_CACHE_CONTROL, hot_cache=False,
+               versioned=False):
+    """
+    Return a response for a media file with HTTP caching semantics.
+
+    - ``ETag`` and ``Last-Modified`` come from the file's stat data;
+      matching ``If-None-Match``/``If-Modified-Since`` requests get a 304
+      without the file being opened.
+    - ``Range`` requests get one range, or several as
+      ``multipart/byteranges``, subject to ``If-Range``. Byte ranges are
+      what players send for ``EXT-X-BYTERANGE`` playlists, where every
+      segment is a slice of one fMP4 file.
+    - ``Cache-Control`` is ``cache_control``, or with ``versioned``
+      immutable if the URL names the file's current version; see
+      ``published_cache_control``.
+
+    With ``hot_cache``, whole-file and single-range bodies are served from
+    the shared ``segment_cache`` once the file is requested often enough.
+
+    Unless ``MEDIA_DELIVERY_MODE`` is ``"django"``, the file is not read here
+    at all once the preconditions passed; see ``offload_response``.
+
+    Returns
+    -------
+    - 200 streaming the whole file.
+    - 206 streaming the requested range(s).
+    - 304 if the client's copy is current.
+    - 416 if no range is satisfiable.
+    """
+    stat = os.stat(path)
+    etag, last_modified = file_validators(stat)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = build_file_response(request, path, content_type, stat, etag, last_modified, hot_cache=hot_cache)
+    if versioned:
+        cache_control = published_cache_control(request, etag, cache_control)
+    return cache_headers(response, etag, last_modified, cache_control)
+
+
+async def aserve_file(request, path, content_type, cache_control=REVALIDATE_CACHE_CONTROL, hot_cache=False,
+                      versioned=False):
+    """
+    Async variant of ``serve_file`` for views running under ASGI: the file
+    is stat'ed and read on worker threads and streamed in chunks, so a slow
+    client only costs a suspended coroutine.
+
+    With ``hot_cache``, the ``segment_cache`` lookup (and the copy of a
+    segment that just became hot) runs on a worker thread too; hits are
+    streamed from the shared memory on the event loop.
+
+    Raises
+    ------
+    OSError
+        If the file cannot be stat'ed.
+    """
+    stat = await asyncio.to_thread(os.stat, path)
+    etag, last_modified = file_validators(stat)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        build = partial(
+            build_file_response, request, path, content_type, stat, etag, last_modified,
+            asynchronous=True, hot_cache=hot_cache,
+        )
+        response = await asyncio.to_thread(build) if hot_cache else build()
+    if versioned:
+        cache_control = published_cache_control(request, etag, cache_control)
+    return cache_headers(response, etag, last_modified, cache_control)
+
+
+def serve_bytes(request, body, content_type, etag, last_modified, cache_control=REVALIDATE_CACHE_CONTROL,
+                variants=None):
+    """
+    Return a response for file contents held in memory, with the same
+    validators and conditional handling as ``serve_file``.
+
+    ``variants`` maps content codings to precompressed bodies; the one the
+    client prefers per ``Accept-Encoding`` is sent, under its own ETag.
+    """
+    encoding = negotiate_encoding(request, variants)
+    etag = variant_etag(etag, encoding)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = HttpResponse(variants[encoding] if encoding else body, content_type=content_type)
+        if encoding:
+            response["Content-Encoding"] = encoding
+    if variants:
+        patch_vary_headers(response, ("Accept-Encoding",))
+    return cache_headers(response, etag, last_modified, cache_control)
+
+
+def cache_headers(response, etag, last_modified, cache_control):
+    """
+    Attach the validators and, to cacheable responses, ``Cache-Control``.
+    """
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    if response.status_code in (200, 206, 304):
+        response["Cache-Control"] = cache_control
+    return response
+
+
+async def arena_chunks(body):
+    """
+    Yield a body from the shared segment cache in chunks. The arena is in
+    shared memory, so reading it never waits on a disk and is done on the
+    event loop.
+    """
+    try:
+        while chunk := body.read(STREAM_CHUNK_SIZE):
+            yield chunk
+    finally:
+        body.close()
+
+
+def cached_response(path, stat, content_type, ranges, asynchronous=False):
+    """
+    Return the whole-file or single-range response of a file from the
+    shared segment cache, or None if it is not cached (and not hot enough).
+
+    The body is a file object over the shared arena, so gunicorn sends it
+    with sendfile from memory; with ``asynchronous`` it is streamed by
+    ``arena_chunks``.
+    """
+    size = stat.st_size
+    start, end = ranges[0] if ranges else (0, size - 1)
+    body = segment_cache.open_slice(path, stat, start, end - start + 1)
+    if body is None:
+        return None
+
+    status = 206 if ranges else 200
+    if asynchronous:
+        response = StreamingHttpResponse(arena_chunks(body), status=status, content_type=content_type)
+    else:
+        response = FileResponse(body, status=status, content_type=content_type)
+    response["Content-Length"] = str(end - start + 1)
+    if ranges:
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return response
+
+
+def build_file_response(request, path, content_type, stat, etag, last_modified, asynchronous=False, hot_cache=False):
+    """
+    Return the body-carrying response of ``serve_file`` once the
+    conditional checks passed.
+    """
+    if settings.MEDIA_DELIVERY_MODE != "django":
+        return offload_response(path, content_type)
+
+    size = stat.st_size
+    ranges = None
+    if request.method in ("GET", "HEAD") and if_range_matches(request, etag, last_modified):
+        try:
+            ranges = parse_ranges(request.headers.get("Range"), size)
+        except UnsatisfiableRange:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+
+    response = None
+    if hot_cache and (ranges is None or len(ranges) == 1):
+        response = cached_response(path, stat, content_type, ranges, asynchronous)
+    if response is None:
+        response = range_response(path, content_type, size, ranges, asynchronous)
+    response["Accept-Ranges"] = "bytes"
+    return response
@@ -0,0 +1,26 @@
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # DRF's renderer only
+    orjson = None
+
+
+def render_json(data):
+    """
+    Render ``data`` to the exact bytes DRF's ``JSONRenderer`` produces
+    (compact, UTF-8, U+2028/U+2029 escaped), with orjson when available.
+
+    Only for plain data: dicts, lists, strings, numbers, booleans and None.
+    Anything orjson encodes differently from the renderer (such as
+    datetimes) must be converted before; see ``serialize_video_rows``.
+    """
+    if orjson is None:
+        return JSONRenderer().render(data)
+    try:
+        body = orjson.dumps(data)
+    except TypeError:  # e.g. lone surrogates, which DRF escapes
+        return JSONRenderer().render(data)
+    if b"\xe2\x80\xa8" in body or b"\xe2\x80\xa9" in body:
+        body = body.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+    return body
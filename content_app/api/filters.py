@@ -0,0 +1,81 @@
+import re
+import django_filters
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Cast
+from content_app.models import Video
+
+
+# Words of a search text; anything else, tsquery syntax included, only
+# separates them.
+SEARCH_TERM_PATTERN = re.compile(r"[^\W_]+")
+# Terms beyond this are ignored, bounding the work of one query.
+MAX_SEARCH_TERMS = 8
+# A last term shorter than this is matched as a whole word; a one-letter
+# prefix would match, and rank, most of the catalog.
+MIN_PREFIX_LENGTH = 2
+
+
+class VideoFilter(django_filters.FilterSet):
+    """
+    Catalog filters of ``VideoListView``.
+
+    Query parameters:
+        - ``category``: one of ``Video.CATEGORY_CHOICES``
+        - ``created_at_after`` / ``created_at_before``: ISO 8601 bounds
+          (inclusive) on the creation time
+    """
+
+    category = django_filters.ChoiceFilter(choices=Video.CATEGORY_CHOICES)
+    created_at = django_filters.IsoDateTimeFromToRangeFilter()
+
+    class Meta:
+        model = Video
+        fields = ["category", "created_at"]
+
+
+def search_query(text):
+    """
+    Build the full-text query of a search text, or None if it has no words.
+
+    All words must match. The last one also matches as a prefix, for
+    typeahead, unless the text ends after it (a finished word) or it is
+    shorter than ``MIN_PREFIX_LENGTH``.
+    """
+    terms = SEARCH_TERM_PATTERN.findall(text)[:MAX_SEARCH_TERMS]
+    if not terms:
+        return None
+    if len(terms[-1]) >= MIN_PREFIX_LENGTH and not text[-1].isspace():
+        terms[-1] += ":*"
+    return SearchQuery(" & ".join(terms), search_type="raw", config=Video.SEARCH_CONFIG)
+
+
+class VideoSearchFilter(django_filters.FilterSet):
+    """
+    Full-text search of ``VideoSearchView``.
+
+    Query parameters:
+        - ``q``: the search text (required), matched against titles and
+          descriptions; see ``search_query``
+        - ``category``: one of ``Video.CATEGORY_CHOICES``
+
+    Matches are annotated with their ``rank`` (title words weigh more),
+    as double precision so it can serve as an exact keyset cursor.
+    """
+
+    # Whitespace is kept: a trailing space ends the last word (see
+    # ``search_query``), which the form field would otherwise strip.
+    q = django_filters.CharFilter(method="search", required=True, max_length=200, strip=False)
+    category = django_filters.ChoiceFilter(choices=Video.CATEGORY_CHOICES)
+
+    class Meta:
+        model = Video
+        fields = ["category"]
+
+    def search(self, queryset, name, value):
+        query = search_query(value)
+        if query is None:
+            return queryset.annotate(rank=Value(0.0, output_field=FloatField())).none()
+        return queryset.filter(search_vector=query).annotate(
+            rank=Cast(SearchRank(F("search_vector"), query), FloatField())
+        )
@@ -0,0 +1,460 @@
+import json
+import math
+import os
+import re
+import shutil
+import subprocess
+import threading
+from collections import deque
+from fractions import Fraction
+from pathlib import Path
+from django.conf import settings
+from .delivery import file_version, versioned_uri
+
+
+LADDER = {
+    "480p": 480,
+    "720p": 720,
+    "1080p": 1080,
+}
+
+H264_PROFILES = {
+    "Constrained Baseline": "42E0",
+    "Baseline": "4200",
+    "Main": "4D40",
+    "Extended": "5800",
+    "High": "6400",
+}
+
+AAC_PROFILES = {
+    "LC": "mp4a.40.2",
+    "HE-AAC": "mp4a.40.5",
+    "HE-AACv2": "mp4a.40.29",
+}
+
+POSTER_SECONDS = 1.0
+
+STDERR_TAIL_LINES = 40
+
+
+def run_ffmpeg(cmd):
+    """
+    Run an ffmpeg/ffprobe command and raise if it exits with an error.
+
+    Returns
+    -------
+    subprocess.CompletedProcess
+        The finished process with captured text output.
+
+    Raises
+    ------
+    RuntimeError
+        If the command exits with a non-zero status.
+    """
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{cmd[0]} failed: {result.stderr}")
+    return result
+
+
+def run_ffmpeg_streaming(cmd, on_progress=None, preexec_fn=None):
+    """
+    Run an ffmpeg command while parsing its ``-progress`` output incrementally.
+
+    ffmpeg writes ``key=value`` blocks to stdout, each terminated by a
+    ``progress=continue|end`` line; every completed block is passed to
+    ``on_progress`` as a dict. stderr is drained on a thread into a bounded
+    buffer instead of being held in memory whole, and only its tail is kept
+    for the error message. ``preexec_fn`` runs in the child before ffmpeg
+    starts, e.g. to set its priority and CPU affinity.
+
+    Raises
+    ------
+    RuntimeError
+        If ffmpeg exits with a non-zero status.
+    """
+    cmd = [cmd[0], "-progress", "pipe:1", "-nostats", *cmd[1:]]
+    process = subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1,
+        preexec_fn=preexec_fn,
+    )
+    stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+    drain = threading.Thread(target=stderr_tail.extend, args=(process.stderr,), daemon=True)
+    drain.start()
+
+    try:
+        block = {}
+        for line in process.stdout:
+            key, _, value = line.strip().partition("=")
+            block[key] = value
+            if key == "progress":
+                if on_progress:
+                    on_progress(block)
+                block = {}
+        returncode = process.wait()
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+    drain.join()
+
+    if returncode != 0:
+        raise RuntimeError(f"{cmd[0]} exited with {returncode}: {''.join(stderr_tail)}")
+
+
+def ffprobe_streams(path):
+    """
+    Return ffprobe's JSON description (streams and format) of a media file
+    or playlist.
+    """
+    result = run_ffmpeg([
+        "ffprobe", "-v", "error",
+        "-show_entries",
+        "stream=codec_type,codec_name,profile,level,width,height,"
+        "sample_aspect_ratio,avg_frame_rate,r_frame_rate:format=duration",
+        "-of", "json",
+        str(path),
+    ])
+    return json.loads(result.stdout or "{}")
+
+
+def parse_frame_rate(value):
+    """
+    Parse an ffprobe rate such as ``"30000/1001"``; returns None if unknown.
+    """
+    try:
+        rate = Fraction(value)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    return rate if rate > 0 else None
+
+
+def probe_source(source):
+    """
+    Analyse the source video with ffprobe.
+
+    Returns
+    -------
+    dict
+        ``width``/``height`` in pixels, ``display_width`` after applying the
+        sample aspect ratio, ``frame_rate`` as an ffprobe rate string,
+        ``duration`` in seconds and ``has_audio``.
+
+    Raises
+    ------
+    RuntimeError
+        If ffprobe fails or the file has no video stream.
+    """
+    info = ffprobe_streams(source)
+    streams = info.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    if video is None:
+        raise RuntimeError(f"No video stream found in {source}")
+
+    width, height = int(video["width"]), int(video["height"])
+    sample_aspect = parse_frame_rate((video.get("sample_aspect_ratio") or "1:1").replace(":", "/")) or 1
+    frame_rate = (
+        parse_frame_rate(video.get("avg_frame_rate"))
+        or parse_frame_rate(video.get("r_frame_rate"))
+        or Fraction(25)
+    )
+
+    return {
+        "width": width,
+        "height": height,
+        "display_width": round(width * sample_aspect),
+        "frame_rate": f"{frame_rate.numerator}/{frame_rate.denominator}",
+        "duration": float(info.get("format", {}).get("duration") or 0),
+        "has_audio": any(s.get("codec_type") == "audio" for s in streams),
+    }
+
+
+def select_renditions(probe):
+    """
+    Pick the ladder rungs that fit the source.
+
+    Only rungs no taller than the source are kept, so nothing is upscaled.
+    A source shorter than the lowest rung gets a single rendition at its own
+    height. Widths follow the source's display aspect ratio, rounded to even
+    numbers as libx264 requires.
+
+    Returns
+    -------
+    Dict[str, dict]
+        Ordered mapping of rendition name to ``height``, ``width`` and
+        ``frame_rate``.
+    """
+    heights = {name: height for name, height in LADDER.items() if height <= probe["height"]}
+    if not heights:
+        source_height = probe["height"] - probe["height"] % 2
+        heights = {f"{source_height}p": source_height}
+
+    return {
+        name: {
+            "height": height,
+            "width": max(2, round(height * probe["display_width"] / probe["height"] / 2) * 2),
+            "frame_rate": probe["frame_rate"],
+        }
+        for name, height in heights.items()
+    }
+
+
+def parse_byterange(value, next_offset):
+    """
+    Parse an HLS ``<length>[@<offset>]`` byte range; without an offset the
+    range starts where the previous one of the same resource ended.
+    """
+    length, _, offset = value.strip().strip('"').partition("@")
+    return int(length), int(offset) if offset else next_offset
+
+
+def parse_media_playlist(playlist_path):
+    """
+    Return the segments of a media playlist as ``(uri, duration, byterange)``
+    tuples, where ``byterange`` is ``(length, offset)`` for
+    ``EXT-X-BYTERANGE`` playlists and None otherwise.
+    """
+    segments = []
+    duration = None
+    byterange = None
+    next_offset = 0
+    with open(playlist_path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("#EXTINF:"):
+                duration = float(line[len("#EXTINF:"):].split(",", 1)[0])
+            elif line.startswith("#EXT-X-BYTERANGE:"):
+                byterange = parse_byterange(line[len("#EXT-X-BYTERANGE:"):], next_offset)
+                next_offset = byterange[0] + byterange[1]
+            elif line and not line.startswith("#"):
+                segments.append((line, duration or 0.0, byterange))
+                duration = None
+                byterange = None
+    return segments
+
+
+def playlist_map_uri(playlist_path):
+    """
+    Return the ``EXT-X-MAP`` (initialization segment) URI of a media
+    playlist, or None for MPEG-TS playlists.
+    """
+    with open(playlist_path, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#EXT-X-MAP:"):
+                match = re.search(r'URI="([^"]+)"', line)
+                return match.group(1) if match else None
+    return None
+
+
+def playlist_files(playlist_path):
+    """
+    Return every file a media playlist references, in first-use order:
+    the initialization segment (if any) and each distinct segment file.
+    """
+    files = [playlist_map_uri(playlist_path)]
+    files += [uri for uri, _duration, _byterange in parse_media_playlist(playlist_path)]
+    return list(dict.fromkeys(uri for uri in files if uri))
+
+
+def codecs_string(streams):
+    """
+    Build the RFC 6381 ``CODECS`` value from ffprobe stream descriptions.
+    """
+    codecs = []
+    for stream in streams:
+        if stream.get("codec_name") == "h264":
+            profile = H264_PROFILES.get(stream.get("profile"), "6400")
+            codecs.append(f"avc1.{profile}{int(stream.get('level') or 40):02X}")
+        elif stream.get("codec_name") == "aac":
+            codecs.append(AAC_PROFILES.get(stream.get("profile"), "mp4a.40.2"))
+    return ",".join(codecs)
+
+
+def measure_rendition(output_dir):
+    """
+    Measure a finished rendition from its playlist and segments.
+
+    Returns
+    -------
+    dict
+        ``bandwidth`` (peak segment bitrate) and ``average_bandwidth`` in
+        bits per second, plus ``codecs``, ``resolution`` and ``frame_rate``
+        as read back from the produced media.
+    """
+    output_dir = Path(output_dir)
+    playlist_path = output_dir / "index.m3u8"
+
+    peak = 0
+    total_bits = 0
+    total_duration = 0.0
+    for uri, duration, byterange in parse_media_playlist(playlist_path):
+        size = byterange[0] if byterange else (output_dir / uri).stat().st_size
+        bits = size * 8
+        total_bits += bits
+        total_duration += duration
+        if duration > 0:
+            peak = max(peak, bits / duration)
+
+    streams = ffprobe_streams(playlist_path).get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), {})
+    frame_rate = parse_frame_rate(video.get("avg_frame_rate"))
+
+    return {
+        "bandwidth": int(peak),
+        "average_bandwidth": int(total_bits / total_duration) if total_duration else int(peak),
+        "codecs": codecs_string(streams),
+        "resolution": f"{video.get('width')}x{video.get('height')}",
+        "frame_rate": f"{float(frame_rate):.3f}" if frame_rate else None,
+    }
+
+
+def write_master_playlist(base_output_dir, names):
+    """
+    Measure the given renditions and write ``master.m3u8`` for them.
+
+    The playlist is replaced atomically, so it can be rewritten while
+    players are reading it as further renditions are published.
+
+    Variants are listed in ascending bandwidth order with measured
+    ``BANDWIDTH``, ``AVERAGE-BANDWIDTH``, ``CODECS``, ``RESOLUTION`` and
+    ``FRAME-RATE`` attributes.
+
+    Returns
+    -------
+    Path
+        Path of the written master playlist.
+    """
+    base_output_dir = Path(base_output_dir)
+    variants = sorted(
+        ((name, measure_rendition(base_output_dir / name)) for name in names),
+        key=lambda item: item[1]["bandwidth"],
+    )
+
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-INDEPENDENT-SEGMENTS"]
+    for name, measured in variants:
+        attributes = [
+            f"BANDWIDTH={measured['bandwidth']}",
+            f"AVERAGE-BANDWIDTH={measured['average_bandwidth']}",
+            f'CODECS="{measured["codecs"]}"',
+            f"RESOLUTION={measured['resolution']}",
+        ]
+        if measured["frame_rate"]:
+            attributes.append(f"FRAME-RATE={measured['frame_rate']}")
+        lines.append("#EXT-X-STREAM-INF:" + ",".join(attributes))
+        lines.append(f"{name}/index.m3u8")
+
+    master_path = base_output_dir / "master.m3u8"
+    tmp_path = master_path.with_name(f".master.m3u8.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, master_path)
+    return master_path
+
+
+def poster_path(base_output_dir):
+    """
+    Return the path of the poster image inside a video's output directory.
+    """
+    base_output_dir = Path(base_output_dir)
+    return base_output_dir / f"{base_output_dir.name}_thumbnail.jpg"
+
+
+def trickplay_tile_size(probe):
+    """
+    Return ``(width, height)`` of one trickplay tile for the given source.
+    """
+    width = settings.TRICKPLAY_TILE_WIDTH
+    height = max(2, round(width * probe["height"] / probe["display_width"] / 2) * 2)
+    return width, height
+
+
+def preview_filters(probe, poster_input, sprite_input):
+    """
+    Return filtergraph chains that turn two branches of the decoded video
+    into the poster frame (``[poster]``) and trickplay sprite sheets
+    (``[sprites]``).
+
+    Lets the transcode that already decodes the source produce the previews
+    instead of a separate ffmpeg pass.
+    """
+    tile_width, tile_height = trickplay_tile_size(probe)
+    poster_at = min(POSTER_SECONDS, probe["duration"] / 2)
+    return [
+        f"[{poster_input}]trim=start={poster_at:.3f},setpts=PTS-STARTPTS[poster]",
+        f"[{sprite_input}]fps=1/{settings.TRICKPLAY_INTERVAL},"
+        f"scale={tile_width}:{tile_height},setsar=1,"
+        f"tile={settings.TRICKPLAY_COLUMNS}x{settings.TRICKPLAY_ROWS}[sprites]",
+    ]
+
+
+def preview_output_args(base_output_dir):
+    """
+    Return the ffmpeg output arguments writing ``[poster]`` and ``[sprites]``
+    next to the renditions. Sprites of an earlier run are removed first.
+    """
+    trickplay_dir = Path(base_output_dir) / "trickplay"
+    shutil.rmtree(trickplay_dir, ignore_errors=True)
+    trickplay_dir.mkdir(parents=True)
+    return [
+        "-map", "[poster]", "-frames:v", "1", "-update", "1",
+        str(poster_path(base_output_dir)),
+        "-map", "[sprites]", "-q:v", "5",
+        str(trickplay_dir / "sprite_%03d.jpg"),
+    ]
+
+
+def format_vtt_timestamp(seconds):
+    """
+    Format seconds as a WebVTT ``HH:MM:SS.mmm`` timestamp.
+    """
+    milliseconds = round(seconds * 1000)
+    hours, milliseconds = divmod(milliseconds, 3_600_000)
+    minutes, milliseconds = divmod(milliseconds, 60_000)
+    secs, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}.{milliseconds:03d}"
+
+
+def write_trickplay_track(base_output_dir, probe):
+    """
+    Write ``trickplay/thumbnails.vtt`` indexing the sprite sheets.
+
+    Each cue covers one ``TRICKPLAY_INTERVAL`` and points at its tile with a
+    media fragment, e.g. ``sprite_001.jpg?v=...#xywh=160,0,160,90``. The
+    ``v`` query is the version of the sheet written (see
+    ``delivery.file_version``), since re-transcodes reuse the names.
+
+    Returns
+    -------
+    Path
+        Path of the written WebVTT file.
+    """
+    interval = settings.TRICKPLAY_INTERVAL
+    columns, rows = settings.TRICKPLAY_COLUMNS, settings.TRICKPLAY_ROWS
+    tile_width, tile_height = trickplay_tile_size(probe)
+    duration = probe["duration"]
+
+    trickplay_dir = Path(base_output_dir) / "trickplay"
+    sheet_uris = {}
+    lines = ["WEBVTT", ""]
+    for index in range(max(1, math.ceil(duration / interval))):
+        sheet, position = divmod(index, columns * rows)
+        row, column = divmod(position, columns)
+        start = index * interval
+        end = min(start + interval, duration) if duration else start + interval
+        if sheet not in sheet_uris:
+            name = f"sprite_{sheet + 1:03d}.jpg"
+            try:
+                sheet_uris[sheet] = versioned_uri(name, file_version(os.stat(trickplay_dir / name)))
+            except FileNotFoundError:
+                sheet_uris[sheet] = name
+        lines.append(f"{format_vtt_timestamp(start)} --> {format_vtt_timestamp(end)}")
+        lines.append(
+            f"{sheet_uris[sheet]}#xywh="
+            f"{column * tile_width},{row * tile_height},{tile_width},{tile_height}"
+        )
+        lines.append("")
+
+    track_path = trickplay_dir / "thumbnails.vtt"
+    with open(track_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines))
+    return track_path
@@ -0,0 +1,184 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django_rq import get_connection
+from redis.exceptions import RedisError
+from .delivery import file_validators
+
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "videoflix:manifest-invalidate"
+STATS_KEY = "videoflix:manifest-cache:stats"
+STATS_FLUSH_SECONDS = 10
+RECONNECT_SECONDS = 5
+
+
+def load_manifest(path):
+    """
+    Read a playlist into a cache entry.
+
+    Returns
+    -------
+    dict
+        ``body`` bytes plus the ``etag`` and ``last_modified`` validators of
+        the file that was read.
+
+    Raises
+    ------
+    OSError
+        If the playlist cannot be read.
+    """
+    with open(path, "rb") as f:
+        etag, last_modified = file_validators(os.fstat(f.fileno()))
+        return {"body": f.read(), "etag": etag, "last_modified": last_modified}
+
+
+def invalidate_manifests(video_id):
+    """
+    Tell every web worker to drop its cached playlists of a video.
+
+    Called by the transcode pipeline after it rewrote a playlist and when a
+    video is deleted. Best effort: if Redis is unreachable, the workers'
+    listeners are disconnected too and do not serve from cache.
+    """
+    try:
+        get_connection("default").publish(INVALIDATION_CHANNEL, str(video_id))
+    except RedisError:
+        logger.warning("Could not invalidate cached manifests of video %s", video_id, exc_info=True)
+
+
+class ManifestCache:
+    """
+    Bounded per-process LRU of playlist bytes keyed by
+    ``(movie_id, resolution)``, with ``"master"`` as the resolution of the
+    master playlist.
+
+    A daemon thread subscribed to ``INVALIDATION_CHANNEL`` drops a video's
+    entries when the pipeline rewrites its playlists. The cache only serves
+    entries while that subscription is up: when it drops, invalidations
+    could be missed, so the cache is emptied and bypassed until it is back.
+
+    Hit and miss counts are kept per process and added to the
+    ``STATS_KEY`` Redis hash every ``STATS_FLUSH_SECONDS`` by the same
+    thread, so lookups never wait on Redis.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._listener_pid = None
+        self._listening = False
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._flushed = {"hits": 0, "misses": 0}
+
+    def get(self, key):
+        """
+        Return the cached entry for ``key`` or None, counting the lookup.
+        """
+        self._ensure_listener()
+        with self._lock:
+            entry = self._entries.get(key) if self._listening else None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry, generation):
+        """
+        Store an entry read after ``get`` missed.
+
+        ``generation`` is the value of ``self.generation`` taken before the
+        file was read; if an invalidation arrived meanwhile, the possibly
+        stale entry is not stored.
+        """
+        with self._lock:
+            if not self._listening or generation != self.generation:
+                return
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.MANIFEST_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, video_id):
+        """
+        Drop every cached playlist of a video.
+        """
+        with self._lock:
+            self.generation += 1
+            for key in [key for key in self._entries if key[0] == video_id]:
+                del self._entries[key]
+
+    def stats(self):
+        """
+        Return this process' counters and entry count.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+    def _reset(self, listening):
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+            self._listening = listening
+
+    def _ensure_listener(self):
+        # Started lazily and per process, so forked web workers each run
+        # their own subscriber instead of inheriting a dead thread.
+        if self._listener_pid == os.getpid():
+            return
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+            self._listening = False
+            self._entries.clear()
+        threading.Thread(target=self._listen, name="manifest-cache-listener", daemon=True).start()
+
+    def _listen(self):
+        while True:
+            pubsub = get_connection("default").pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                self._reset(listening=True)
+                next_flush = time.monotonic() + STATS_FLUSH_SECONDS
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message["type"] == "message":
+                        self.invalidate(int(message["data"]))
+                    if time.monotonic() >= next_flush:
+                        self._flush_stats()
+                        next_flush = time.monotonic() + STATS_FLUSH_SECONDS
+            except (RedisError, ValueError):
+                logger.warning("Manifest cache listener disconnected", exc_info=True)
+                self._reset(listening=False)
+                pubsub.close()
+                time.sleep(RECONNECT_SECONDS)
+
+    def _flush_stats(self):
+        stats = self.stats()
+        delta = {name: stats[name] - self._flushed[name] for name in ("hits", "misses")}
+        if any(delta.values()):
+            pipeline = get_connection("default").pipeline()
+            for name, value in delta.items():
+                pipeline.hincrby(STATS_KEY, name, value)
+            pipeline.execute()
+            self._flushed = {name: stats[name] for name in ("hits", "misses")}
+
+
+def cluster_stats():
+    """
+    Return the hit and miss totals flushed by all workers.
+    """
+    raw = get_connection("default").hgetall(STATS_KEY)
+    return {key.decode(): int(value) for key, value in raw.items()}
+
+
+manifest_cache = ManifestCache()
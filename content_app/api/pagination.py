@@ -0,0 +1,147 @@
+import base64
+import math
+from datetime import datetime
+from django.conf import settings
+from django.db.models import F, Field, Func, Value
+from django.db.models.lookups import LessThan
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+# Range of the ``bigint`` primary key; ids outside it would make the
+# database reject the seek query.
+MIN_ID = -(2 ** 63)
+MAX_ID = 2 ** 63 - 1
+
+class RowValue(Func):
+    """
+    SQL row value constructor, ``(a, b)``; row values compare
+    lexicographically.
+    """
+
+    template = "(%(expressions)s)"
+    output_field = Field()
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination over ``(created_at, id)``, newest first.
+
+    The cursor is the position of the last item sent, and the next page is
+    the rows strictly after it in ``(-created_at, -id)`` order. The seek is a
+    single row value comparison, ``(created_at, id) < (cursor)``, which the
+    database uses as a bound on an index in that order: every page costs
+    the same index range scan however deep it is, unlike ``OFFSET``, and
+    rows inserted meanwhile never shift a page.
+
+    Query parameters:
+        - ``cursor``: opaque position taken from ``next``
+        - ``page_size``: up to ``VIDEO_PAGE_SIZE_MAX`` (default
+          ``VIDEO_PAGE_SIZE``)
+
+    Works on model querysets and on ``.values()`` querysets alike.
+    Subclasses seek on another descending ``key`` by overriding it and its
+    cursor text conversions.
+
+    Responses are ``{"next": <url or null>, "results": [...]}``.
+    """
+
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    key = "created_at"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+        if position is not None:
+            value, pk = position
+            # Typed like the key, so the value is adapted as the column is.
+            key_field = queryset.query.resolve_ref(self.key).output_field
+            queryset = queryset.filter(LessThan(
+                RowValue(F(self.key), F("id")),
+                RowValue(Value(value, output_field=key_field), Value(pk)),
+            ))
+
+        page = list(queryset.order_by(f"-{self.key}", "-id")[:self.page_size + 1])
+        self.next_position = None
+        if len(page) > self.page_size:
+            page = page[:self.page_size]
+            last = page[-1]
+            if isinstance(last, dict):
+                self.next_position = (last[self.key], last["id"])
+            else:
+                self.next_position = (getattr(last, self.key), last.id)
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return settings.VIDEO_PAGE_SIZE
+        return min(max(page_size, 1), settings.VIDEO_PAGE_SIZE_MAX)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def key_to_text(self, value):
+        return value.isoformat()
+
+    def key_from_text(self, text):
+        return datetime.fromisoformat(text)
+
+    def encode_cursor(self, position):
+        value, pk = position
+        return base64.urlsafe_b64encode(f"{self.key_to_text(value)}|{pk}".encode("ascii")).decode("ascii")
+
+    def decode_cursor(self, request):
+        """
+        Return the ``(key, id)`` position of the ``cursor`` parameter, or
+        None on the first page.
+
+        Raises
+        ------
+        NotFound
+            If the cursor is malformed or its id is out of the ``bigint``
+            range.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            value, _, pk = base64.urlsafe_b64decode(encoded.encode("ascii")).decode("ascii").rpartition("|")
+            position = self.key_from_text(value), int(pk)
+        except (ValueError, UnicodeError):
+            raise NotFound("Invalid cursor")
+        if not MIN_ID <= position[1] <= MAX_ID:
+            raise NotFound("Invalid cursor")
+        return position
+
+
+class RankedKeysetPagination(KeysetPagination):
+    """
+    Keyset pagination over ``(rank, id)``, best match first, for querysets
+    annotated with a double precision ``rank``.
+
+    Cursors hold the rank's shortest round-trip ``repr``, so the seek
+    compares exactly the value the database returned.
+    """
+
+    key = "rank"
+
+    def key_to_text(self, value):
+        return repr(value)
+
+    def key_from_text(self, text):
+        value = float(text)
+        if not math.isfinite(value):
+            raise ValueError(text)
+        return value
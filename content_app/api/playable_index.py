@@ -0,0 +1,199 @@
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django_rq import get_connection
+from redis.exceptions import RedisError
+from content_app.models import Video
+from .manifest_cache import invalidate_manifests
+
+
+logger = logging.getLogger(__name__)
+
+# Set of the ids of indexed videos; each of them has a set of its published
+# renditions under ``video_key``, so a video is (un)indexed in
+# O(renditions) without scanning the others.
+INDEX_KEY = "videoflix:playable"
+# Member marking that a video's master playlist lists at least one rendition.
+MASTER = "master"
+
+
+def video_key(video_id):
+    """
+    Return the key of the set of a video's published renditions.
+    """
+    return f"{INDEX_KEY}:{video_id}"
+
+
+def member(video_id, name):
+    """
+    Return the local cache key of a published rendition (or ``MASTER``).
+    """
+    return f"{video_id}:{name}"
+
+
+def published_renditions(video_id):
+    """
+    Return the names of a video's rendition directories holding an
+    ``index.m3u8``.
+    """
+    base_output_dir = Path(settings.MEDIA_ROOT) / "videos" / str(video_id)
+    try:
+        names = os.listdir(base_output_dir)
+    except OSError:
+        return []
+    return [
+        name for name in sorted(names)
+        if not name.startswith(".") and os.path.exists(base_output_dir / name / "index.m3u8")
+    ]
+
+
+def add_playable(video_id, names):
+    """
+    Record published renditions of a video, plus its master playlist.
+
+    Called by the transcode pipeline after it published renditions. Best
+    effort like the other status writes: if Redis is down, lookups fall back
+    to the database and ``rebuild_playable_index`` restores the index.
+    """
+    try:
+        pipeline = get_connection("default").pipeline()
+        pipeline.sadd(video_key(video_id), MASTER, *names)
+        pipeline.sadd(INDEX_KEY, video_id)
+        pipeline.execute()
+    except RedisError:
+        logger.warning("Could not index playable renditions of video %s", video_id, exc_info=True)
+
+
+def remove_playable(video_id):
+    """
+    Remove a video and all its renditions from the index, e.g. when it is
+    deleted or no longer playable.
+    """
+    try:
+        pipeline = get_connection("default").pipeline()
+        pipeline.srem(INDEX_KEY, video_id)
+        pipeline.delete(video_key(video_id))
+        pipeline.execute()
+    except RedisError:
+        logger.warning("Could not unindex video %s", video_id, exc_info=True)
+    local_index.clear()
+
+
+def sync_playable(video_id, status):
+    """
+    Bring the index in line with a video's ``status`` after a status change.
+
+    A playable video gets its published renditions indexed; any other
+    status removes the video from the index and drops its playlists from
+    the manifest caches, so it stops being served at once.
+    """
+    if status in Video.PLAYABLE_STATUSES:
+        names = published_renditions(video_id)
+        if names:
+            add_playable(video_id, names)
+    else:
+        remove_playable(video_id)
+        invalidate_manifests(video_id)
+
+
+class LocalIndex:
+    """
+    Per-process TTL cache in front of the Redis index.
+
+    Positive and negative answers are both kept for
+    ``PLAYABLE_INDEX_TTL`` seconds, so a player fetching segments every few
+    seconds costs at most one Redis round trip per rendition and TTL.
+    """
+
+    def __init__(self, max_entries=10000):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.max_entries = max_entries
+
+    def get(self, key):
+        with self._lock:
+            value, expires = self._entries.get(key, (None, 0))
+        return value if expires > time.monotonic() else None
+
+    def put(self, key, value):
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries.clear()
+            self._entries[key] = (value, time.monotonic() + settings.PLAYABLE_INDEX_TTL)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+local_index = LocalIndex()
+
+
+def is_playable(video_id, name=MASTER):
+    """
+    Return True if rendition ``name`` of a video is published.
+
+    Answered from the local TTL cache or the Redis index without touching
+    the database. If Redis is unreachable, the Video's status is checked
+    instead.
+    """
+    key = member(video_id, name)
+    playable = local_index.get(key)
+    if playable is not None:
+        return playable
+    try:
+        playable = bool(get_connection("default").sismember(video_key(video_id), name))
+    except RedisError:
+        logger.warning("Playable index unavailable, checking the database", exc_info=True)
+        return Video.objects.filter(id=video_id, status__in=Video.PLAYABLE_STATUSES).exists()
+    local_index.put(key, playable)
+    return playable
+
+
+async def ais_playable(video_id, name=MASTER):
+    """
+    Async variant of ``is_playable``: answered inline on a local cache hit,
+    otherwise on a worker thread.
+    """
+    playable = local_index.get(member(video_id, name))
+    if playable is not None:
+        return playable
+    return await sync_to_async(is_playable, thread_sensitive=False)(video_id, name)
+
+
+def rebuild_index(entries):
+    """
+    Replace the whole index with ``entries`` (video id -> rendition names).
+
+    Videos no longer in ``entries`` are dropped, as are members of other
+    formats, such as the ``<id>:<rendition>`` members of the earlier
+    single-set index. All writes run in one MULTI/EXEC transaction, so
+    readers never see the index half-built.
+
+    Returns
+    -------
+    int
+        Number of members indexed, master playlists included.
+    """
+    connection = get_connection("default")
+    indexed = {video_id: names for video_id, names in entries.items() if names}
+    stale = [
+        value for value in connection.smembers(INDEX_KEY)
+        if not value.isdigit() or int(value) not in indexed
+    ]
+    stale_keys = [video_key(int(value)) for value in stale if value.isdigit()]
+    pipeline = connection.pipeline()
+    if stale:
+        pipeline.srem(INDEX_KEY, *stale)
+    if stale_keys:
+        pipeline.delete(*stale_keys)
+    for video_id, names in indexed.items():
+        pipeline.delete(video_key(video_id))
+        pipeline.sadd(video_key(video_id), MASTER, *names)
+        pipeline.sadd(INDEX_KEY, video_id)
+    pipeline.execute()
+    return sum(1 + len(names) for names in indexed.values())
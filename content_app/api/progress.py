@@ -0,0 +1,119 @@
+import json
+import logging
+import time
+from contextlib import contextmanager
+from django_rq import get_connection
+from redis.exceptions import RedisError
+
+
+logger = logging.getLogger(__name__)
+
+STATUS_TTL_SECONDS = 7 * 24 * 3600
+
+
+def status_key(video_id):
+    """
+    Return the Redis hash holding a video's transcode status.
+    """
+    return f"videoflix:transcode:status:{video_id}"
+
+
+def publish_status(video_id, **fields):
+    """
+    Store JSON-encoded fields in the video's status hash.
+
+    Status is best effort: a Redis outage is logged but never fails the
+    transcode itself.
+    """
+    try:
+        connection = get_connection("transcode")
+        pipeline = connection.pipeline()
+        pipeline.hset(status_key(video_id), mapping={k: json.dumps(v) for k, v in fields.items()})
+        pipeline.expire(status_key(video_id), STATUS_TTL_SECONDS)
+        pipeline.execute()
+    except RedisError:
+        logger.warning("Could not publish transcode status of video %s", video_id, exc_info=True)
+
+
+def progress_reporter(video_id, scope, duration):
+    """
+    Return an ``on_progress`` callback for ``run_ffmpeg_streaming`` that
+    publishes percent done, fps and speed under ``progress:<scope>``.
+
+    Parameters
+    ----------
+    video_id : int
+        Video being transcoded.
+    scope : str
+        Rendition name, or ``"single_pass"``/``"previews"``.
+    duration : float
+        Source duration in seconds, used to compute the percentage.
+    """
+    def on_progress(block):
+        try:
+            out_seconds = int(block.get("out_time_us") or 0) / 1_000_000
+            fps = float(block.get("fps") or 0)
+        except ValueError:
+            return
+        finished = block.get("progress") == "end"
+        percent = 100.0 if finished else min(99.9, out_seconds / duration * 100) if duration else None
+        publish_status(video_id, **{f"progress:{scope}": {
+            "percent": round(percent, 1) if percent is not None else None,
+            "out_time": round(out_seconds, 2),
+            "fps": fps,
+            "speed": block.get("speed", "").rstrip("x").strip() or None,
+            "finished": finished,
+            "updated_at": time.time(),
+        }})
+
+    return on_progress
+
+
+@contextmanager
+def stage_timer(video_id, stage):
+    """
+    Time a pipeline stage and publish its duration under ``stage:<stage>``.
+
+    A failing stage is published as the video's ``error`` before the
+    exception propagates, so the RQ job fails with it.
+    """
+    publish_status(video_id, state="running", current_stage=stage)
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as exc:
+        publish_status(video_id, state="failed", error={"stage": stage, "message": str(exc)[-2000:]})
+        raise
+    finally:
+        publish_status(video_id, **{f"stage:{stage}": round(time.perf_counter() - started, 3)})
+
+
+def get_transcode_status(video_id):
+    """
+    Return a video's transcode status as a nested dict.
+
+    Returns
+    -------
+    dict
+        ``state``, ``current_stage`` and ``error`` at the top level, plus
+        ``progress`` and ``stages`` mappings keyed by scope and stage name.
+        Empty if nothing was recorded, or if Redis is unreachable: the
+        caller then only has the video's database status.
+    """
+    try:
+        raw = get_connection("transcode").hgetall(status_key(video_id))
+    except RedisError:
+        logger.warning("Could not read transcode status of video %s", video_id, exc_info=True)
+        return {}
+    status = {"progress": {}, "stages": {}}
+    for key, value in raw.items():
+        key = key.decode() if isinstance(key, bytes) else key
+        value = json.loads(value)
+        prefix, _, name = key.partition(":")
+        if prefix == "progress" and name:
+            status["progress"][name] = value
+        elif prefix == "stage" and name:
+            status["stages"][name] = value
+        else:
+            status[key] = value
+    return status if raw else {}
@@ -0,0 +1,109 @@
+import fcntl
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from django.conf import settings
+
+
+SLOT_POLL_SECONDS = 1.0
+
+
+def available_cpus():
+    """
+    Return the CPUs this process may run on, honouring container cpusets.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return tuple(sorted(os.sched_getaffinity(0)))
+    return tuple(range(os.cpu_count() or 1))
+
+
+def encode_budget():
+    """
+    Derive the ffmpeg budget of this host from its CPUs and the settings.
+
+    ``TRANSCODE_CPU_BUDGET`` cores (default: all but
+    ``TRANSCODE_RESERVED_CPUS``) are split into processes of
+    ``TRANSCODE_THREADS`` threads; at least one process with one thread is
+    always allowed. The CPUs left out are kept for web traffic.
+
+    Returns
+    -------
+    dict
+        ``cpus`` ffmpeg may run on, the number of concurrent ``processes``
+        and ``threads`` per process.
+    """
+    cpus = available_cpus()
+    budget = settings.TRANSCODE_CPU_BUDGET or len(cpus) - settings.TRANSCODE_RESERVED_CPUS
+    budget = max(1, min(budget, len(cpus)))
+    threads = max(1, min(settings.TRANSCODE_THREADS, budget))
+    return {"cpus": cpus[-budget:], "processes": max(1, budget // threads), "threads": threads}
+
+
+@contextmanager
+def ffmpeg_slot(poll_seconds=SLOT_POLL_SECONDS):
+    """
+    Block until one of the host's ffmpeg slots is free and hold it.
+
+    Slots are lock files under ``TRANSCODE_SLOT_DIR`` held with ``flock``,
+    so every worker process on the host shares the same budget and a slot
+    is released by the kernel even if its worker is killed. Queued
+    renditions are admitted in turn as running encodes finish.
+
+    Yields
+    ------
+    dict
+        The held slot: its ``index``, the ``cpus`` its process is pinned to
+        and its ``threads``.
+    """
+    budget = encode_budget()
+    slot_dir = Path(settings.TRANSCODE_SLOT_DIR)
+    slot_dir.mkdir(parents=True, exist_ok=True)
+    while True:
+        for index in range(budget["processes"]):
+            fd = os.open(slot_dir / f"slot-{index}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            try:
+                first = index * budget["threads"]
+                cpus = budget["cpus"][first:first + budget["threads"]]
+                yield {"index": index, "cpus": cpus, "threads": budget["threads"]}
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+            return
+        time.sleep(poll_seconds)
+
+
+def slot_command(cmd, slot):
+    """
+    Limit ffmpeg's decoder and filter threads to the slot's thread count.
+
+    The encoders size their thread pools from the CPU affinity set by
+    ``slot_preexec``.
+    """
+    threads = str(slot["threads"])
+    ffmpeg, *options = cmd
+    return [
+        ffmpeg,
+        "-filter_threads", threads,
+        "-filter_complex_threads", threads,
+        "-threads", threads,
+        *options,
+    ]
+
+
+def slot_preexec(slot):
+    """
+    Return a ``preexec_fn`` that lowers ffmpeg's priority below the web
+    processes and pins it to the slot's CPUs.
+    """
+    def preexec():
+        os.nice(settings.TRANSCODE_NICE)
+        if slot["cpus"] and hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, slot["cpus"])
+
+    return preexec
@@ -0,0 +1,495 @@
+import fcntl
+import hashlib
+import io
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"VFXSEG01"
+
+# The data region is split into pages, each handed lazily to one slab class
+# and cut into equal chunks of that class. A segment lives in the smallest
+# chunk it fits, so one class only ever evicts entries of similar size.
+PAGE_SIZE = 8 * 1024 * 1024
+CHUNK_SIZES = tuple((64 * 1024) << shift for shift in range(8))  # 64 KiB .. 8 MiB
+MAX_CHUNKS = PAGE_SIZE // CHUNK_SIZES[0]
+UNASSIGNED = 0xFF
+
+# Count-min sketch of request frequencies; counters are halved every
+# SKETCH_WIDTH * SKETCH_AGING requests so old popularity fades.
+SKETCH_ROWS = 4
+SKETCH_WIDTH = 8192
+SKETCH_AGING = 4
+HALVE = bytes(value >> 1 for value in range(256))
+
+INDEX_WAYS = 8
+INDEX_BUCKETS_PER_PAGE = 32
+
+# A slot still being filled after this many seconds belongs to a dead worker.
+FILL_TIMEOUT = 60
+
+HEADER = struct.Struct("<8sIIQQQQQ")  # magic, pages, -, sketch ops, then COUNTERS
+COUNTERS = ("hits", "misses", "admitted", "evicted")
+INDEX_ENTRY = struct.Struct("<16si")  # key, slot (-1 = empty)
+SLOT = struct.Struct("<16sQddB7x")  # key, length, last access, lease until, state
+FREE, FILLING, READY = 0, 1, 2
+
+
+def align(offset, boundary=mmap.PAGESIZE):
+    return -(-offset // boundary) * boundary
+
+
+def arena_layout(pages):
+    """
+    Return the offsets of the arena's regions and its total size for a data
+    region of ``pages`` pages.
+    """
+    layout = {"page_classes": HEADER.size}
+    layout["sketch"] = align(layout["page_classes"] + pages, 64)
+    layout["buckets"] = pages * INDEX_BUCKETS_PER_PAGE
+    layout["index"] = layout["sketch"] + SKETCH_ROWS * SKETCH_WIDTH
+    layout["slots"] = layout["index"] + layout["buckets"] * INDEX_WAYS * INDEX_ENTRY.size
+    layout["data"] = align(layout["slots"] + pages * MAX_CHUNKS * SLOT.size)
+    layout["size"] = layout["data"] + pages * PAGE_SIZE
+    return layout
+
+
+def chunk_class(length):
+    """
+    Return the slab class holding ``length`` bytes, or None if the entry is
+    empty or larger than the largest chunk.
+    """
+    for index, chunk_size in enumerate(CHUNK_SIZES):
+        if 0 < length <= chunk_size:
+            return index
+    return None
+
+
+def cache_key(path, stat, start, length):
+    """
+    Return the 16-byte key of ``length`` bytes from ``start`` of a file
+    version. Inode, size and nanosecond mtime change with every rewrite, so
+    a replaced file is never served from a stale copy.
+    """
+    version = f"{path}\0{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}\0{start}+{length}"
+    return hashlib.blake2b(version.encode(), digest_size=16).digest()
+
+
+class ArenaSlice(io.RawIOBase):
+    """
+    Read-only file object over ``length`` bytes of the arena at ``offset``.
+
+    It has its own file description positioned at ``offset``, so a WSGI
+    server's ``wsgi.file_wrapper`` (gunicorn) sends a hit with sendfile
+    straight from the shared pages; other servers read it in chunks with
+    ``preadv`` into the response buffers.
+    """
+
+    def __init__(self, arena_fd, offset, length):
+        super().__init__()
+        self._fd = os.open(f"/proc/self/fd/{arena_fd}", os.O_RDONLY)
+        os.lseek(self._fd, offset, os.SEEK_SET)
+        self._position = offset
+        self._remaining = length
+
+    def readable(self):
+        return True
+
+    def fileno(self):
+        return self._fd
+
+    def readinto(self, buffer):
+        length = min(len(buffer), self._remaining)
+        if length <= 0:
+            return 0
+        read = os.preadv(self._fd, [memoryview(buffer)[:length]], self._position)
+        self._position += read
+        self._remaining -= read
+        return read
+
+    def close(self):
+        if not self.closed:
+            os.close(self._fd)
+        super().close()
+
+
+class SegmentCache:
+    """
+    Hot segment cache shared by all web workers of a host.
+
+    Entries live in a memory-mapped arena file (on tmpfs by default) that
+    every worker maps, so a segment read from disk once is served by all of
+    them. All metadata lives in the arena as well:
+
+    - a count-min sketch of request counts; a segment is only admitted once
+      it was requested ``SEGMENT_CACHE_ADMIT_HITS`` times, so one-off
+      requests do not wash out hot segments;
+    - a set-associative index from file version to slot;
+    - slab classes of chunk sizes; a full class evicts its least recently
+      used entry, and if it has none to spare, the least recently used page
+      of another class is taken over.
+
+    Metadata is changed under an ``flock`` on ``<path>.lock``; the segment
+    is copied into its slot outside of it. Hits are leased for
+    ``SEGMENT_CACHE_LEASE`` seconds and leased entries are never evicted,
+    as the response still reads them after the view returned.
+    """
+
+    def __init__(self):
+        self._pid = None
+        self._thread_lock = threading.Lock()
+        self._mm = None
+        self._fd = None
+        self._lock_fd = None
+        self._layout = None
+        self._pages = 0
+
+    @property
+    def enabled(self):
+        return settings.SEGMENT_CACHE_MB > 0
+
+    def open_slice(self, path, stat, start, length):
+        """
+        Return an ``ArenaSlice`` over ``length`` bytes from ``start`` of the
+        cached file version, caching it first if it became hot, or None if
+        the file is served from disk.
+
+        Files up to the largest chunk are cached whole and every range is
+        cut from the one copy. Larger files, such as the single ``media.m4s``
+        of a CMAF rendition, are cached per requested range instead: players
+        fetch exactly the ``EXT-X-BYTERANGE`` slices of the playlist, so the
+        same ranges recur across viewers. Ranges larger than the largest
+        chunk are served from disk.
+        """
+        if not self.enabled:
+            return None
+        if chunk_class(stat.st_size) is not None:
+            (entry_start, entry_length), offset = (0, stat.st_size), start
+        else:
+            (entry_start, entry_length), offset = (start, length), 0
+        cls = chunk_class(entry_length)
+        if cls is None:
+            return None
+
+        key = cache_key(path, stat, entry_start, entry_length)
+        now = time.time()
+        with self._locked() as locked:
+            if not locked:
+                return None
+            slot = self._find(key)
+            if slot is not None:
+                self._touch(slot, now)
+                self._count(hits=1)
+                return ArenaSlice(self._fd, self._slot_offset(slot) + offset, length)
+
+            self._count(misses=1)
+            if self._record(key) < settings.SEGMENT_CACHE_ADMIT_HITS:
+                return None
+            slot = self._allocate(cls, key, entry_length, now)
+            if slot is None:
+                return None
+            self._count(admitted=1)
+
+        if not self._fill(slot, path, key, entry_start, entry_length):
+            return None
+        return ArenaSlice(self._fd, self._slot_offset(slot) + offset, length)
+
+    def stats(self):
+        """
+        Return the arena-wide counters and occupancy, or None if disabled.
+        """
+        if not self.enabled:
+            return None
+        with self._locked() as locked:
+            if not locked:
+                return None
+            _, pages, _, _, hits, misses, admitted, evicted = HEADER.unpack_from(self._mm, 0)
+            entries = cached_bytes = 0
+            for slot in self._all_slots():
+                _, length, _, _, state = self._slot(slot)
+                if state == READY:
+                    entries += 1
+                    cached_bytes += length
+        return {
+            "hits": hits,
+            "misses": misses,
+            "admitted": admitted,
+            "evicted": evicted,
+            "entries": entries,
+            "bytes": cached_bytes,
+            "capacity": pages * PAGE_SIZE,
+        }
+
+    @contextmanager
+    def _locked(self):
+        # Threads of one worker share its flock, so they also take a
+        # thread lock.
+        with self._thread_lock:
+            if not self._attach():
+                yield False
+                return
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            try:
+                yield True
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _attach(self):
+        # Mapped lazily per process, like the manifest cache listener, so
+        # forked workers never share a lock file description.
+        if self._pid == os.getpid():
+            return self._mm is not None
+        self._pid = os.getpid()
+        self._mm = None
+        try:
+            self._lock_fd = os.open(f"{settings.SEGMENT_CACHE_PATH}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            try:
+                self._map_arena()
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+        except OSError:
+            logger.warning("Segment cache unavailable, serving segments from disk", exc_info=True)
+            self._mm = None
+        return self._mm is not None
+
+    def _map_arena(self):
+        path = settings.SEGMENT_CACHE_PATH
+        pages = max(1, settings.SEGMENT_CACHE_MB * 1024 * 1024 // PAGE_SIZE)
+        layout = arena_layout(pages)
+
+        try:
+            fd = os.open(path, os.O_RDWR)
+        except FileNotFoundError:
+            fd = None
+        if fd is not None:
+            magic, mapped_pages = HEADER.unpack_from(os.pread(fd, HEADER.size, 0).ljust(HEADER.size, b"\0"))[:2]
+            if magic != MAGIC or mapped_pages != pages or os.fstat(fd).st_size != layout["size"]:
+                os.close(fd)
+                fd = None
+
+        if fd is None:
+            # Built under a temporary name and renamed, so a worker never
+            # maps a half-initialised arena. posix_fallocate reserves the
+            # tmpfs pages up front: running out of space later would raise
+            # SIGBUS on access instead of an error here.
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            fd = os.open(tmp_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+            try:
+                os.posix_fallocate(fd, 0, layout["size"])
+                header = HEADER.pack(MAGIC, pages, 0, 0, 0, 0, 0, 0)
+                os.pwrite(fd, header + bytes([UNASSIGNED]) * pages, 0)
+                os.replace(tmp_path, path)
+            except OSError:
+                os.close(fd)
+                os.unlink(tmp_path)
+                raise
+
+        self._fd = fd
+        self._mm = mmap.mmap(fd, layout["size"])
+        self._layout = layout
+        self._pages = pages
+
+    def _count(self, **deltas):
+        fields = list(HEADER.unpack_from(self._mm, 0))
+        for name, delta in deltas.items():
+            fields[COUNTERS.index(name) + 4] += delta
+        HEADER.pack_into(self._mm, 0, *fields)
+
+    def _record(self, key):
+        """
+        Count one request of ``key`` in the sketch and return its estimate.
+        """
+        base = self._layout["sketch"]
+        estimate = 255
+        for row in range(SKETCH_ROWS):
+            position = base + row * SKETCH_WIDTH + int.from_bytes(key[2 * row:2 * row + 2], "little") % SKETCH_WIDTH
+            count = min(self._mm[position] + 1, 255)
+            self._mm[position] = count
+            estimate = min(estimate, count)
+
+        fields = list(HEADER.unpack_from(self._mm, 0))
+        fields[3] += 1
+        if fields[3] >= SKETCH_WIDTH * SKETCH_AGING:
+            fields[3] = 0
+            end = base + SKETCH_ROWS * SKETCH_WIDTH
+            self._mm[base:end] = self._mm[base:end].translate(HALVE)
+        HEADER.pack_into(self._mm, 0, *fields)
+        return estimate
+
+    def _page_class(self, page):
+        return self._mm[self._layout["page_classes"] + page]
+
+    def _set_page_class(self, page, cls):
+        self._mm[self._layout["page_classes"] + page] = cls
+
+    def _slot(self, slot):
+        return SLOT.unpack_from(self._mm, self._layout["slots"] + slot * SLOT.size)
+
+    def _set_slot(self, slot, key, length, last_access, lease_until, state):
+        SLOT.pack_into(self._mm, self._layout["slots"] + slot * SLOT.size, key, length, last_access, lease_until, state)
+
+    def _slot_offset(self, slot):
+        page, chunk = divmod(slot, MAX_CHUNKS)
+        return self._layout["data"] + page * PAGE_SIZE + chunk * CHUNK_SIZES[self._page_class(page)]
+
+    def _page_slots(self, page):
+        cls = self._page_class(page)
+        if cls == UNASSIGNED:
+            return range(0)
+        return range(page * MAX_CHUNKS, page * MAX_CHUNKS + PAGE_SIZE // CHUNK_SIZES[cls])
+
+    def _all_slots(self):
+        for page in range(self._pages):
+            yield from self._page_slots(page)
+
+    def _touch(self, slot, now):
+        key, length, _, lease_until, state = self._slot(slot)
+        self._set_slot(slot, key, length, now, max(lease_until, now + settings.SEGMENT_CACHE_LEASE), state)
+
+    def _bucket_entries(self, key):
+        bucket = int.from_bytes(key[8:], "little") % self._layout["buckets"]
+        first = self._layout["index"] + bucket * INDEX_WAYS * INDEX_ENTRY.size
+        return [first + way * INDEX_ENTRY.size for way in range(INDEX_WAYS)]
+
+    def _find(self, key):
+        for position in self._bucket_entries(key):
+            entry_key, slot = INDEX_ENTRY.unpack_from(self._mm, position)
+            if entry_key == key and slot >= 0:
+                slot_key, _, _, _, state = self._slot(slot)
+                if slot_key == key and state == READY:
+                    return slot
+        return None
+
+    def _evictable(self, slot, now):
+        _, _, last_access, lease_until, state = self._slot(slot)
+        if state == FREE:
+            return True
+        if state == FILLING:
+            return last_access < now - FILL_TIMEOUT
+        return lease_until < now
+
+    def _release(self, slot):
+        key, _, _, _, state = self._slot(slot)
+        if state == FREE:
+            return
+        for position in self._bucket_entries(key):
+            if INDEX_ENTRY.unpack_from(self._mm, position) == (key, slot):
+                INDEX_ENTRY.pack_into(self._mm, position, b"\0" * 16, -1)
+        self._set_slot(slot, b"\0" * 16, 0, 0.0, 0.0, FREE)
+        if state == READY:
+            self._count(evicted=1)
+
+    def _index_insert(self, key, slot, now):
+        """
+        Point ``key`` at ``slot`` in its index bucket, evicting the bucket's
+        least recently used entry if all ways are taken.
+        """
+        victim = None
+        for position in self._bucket_entries(key):
+            entry_key, entry_slot = INDEX_ENTRY.unpack_from(self._mm, position)
+            if entry_slot < 0 or self._slot(entry_slot)[0] != entry_key or self._slot(entry_slot)[4] == FREE:
+                INDEX_ENTRY.pack_into(self._mm, position, key, slot)
+                return True
+            if self._evictable(entry_slot, now) and (
+                victim is None or self._slot(entry_slot)[2] < self._slot(victim[1])[2]
+            ):
+                victim = (position, entry_slot)
+        if victim is None:
+            return False
+        self._release(victim[1])
+        INDEX_ENTRY.pack_into(self._mm, victim[0], key, slot)
+        return True
+
+    def _allocate(self, cls, key, length, now):
+        """
+        Claim a chunk of class ``cls`` for ``key`` and mark it as filling.
+
+        Prefers a free chunk, then a fresh page, then the class' least
+        recently used entry, then the least recently used page of any other
+        class. Returns None if everything is leased.
+        """
+        slot = victim = None
+        victim_access = None
+        for page in range(self._pages):
+            if self._page_class(page) != cls:
+                continue
+            for candidate in self._page_slots(page):
+                _, _, last_access, _, state = self._slot(candidate)
+                if state != READY and self._evictable(candidate, now):
+                    slot = candidate
+                    break
+                if self._evictable(candidate, now) and (victim_access is None or last_access < victim_access):
+                    victim, victim_access = candidate, last_access
+            if slot is not None:
+                break
+
+        if slot is None:
+            page = next((page for page in range(self._pages) if self._page_class(page) == UNASSIGNED), None)
+            if page is None and victim is None:
+                page = self._coldest_page(now)
+                if page is not None:
+                    for candidate in self._page_slots(page):
+                        self._release(candidate)
+            if page is not None:
+                self._set_page_class(page, cls)
+                for candidate in self._page_slots(page):
+                    self._set_slot(candidate, b"\0" * 16, 0, 0.0, 0.0, FREE)
+                slot = page * MAX_CHUNKS
+            elif victim is not None:
+                slot = victim
+
+        if slot is None:
+            return None
+        self._release(slot)
+        if not self._index_insert(key, slot, now):
+            return None
+        self._set_slot(slot, key, length, now, now + settings.SEGMENT_CACHE_LEASE, FILLING)
+        return slot
+
+    def _coldest_page(self, now):
+        coldest = coldest_access = None
+        for page in range(self._pages):
+            slots = self._page_slots(page)
+            if not slots or not all(self._evictable(slot, now) for slot in slots):
+                continue
+            newest = max(self._slot(slot)[2] for slot in slots)
+            if coldest_access is None or newest < coldest_access:
+                coldest, coldest_access = page, newest
+        return coldest
+
+    def _fill(self, slot, path, key, start, length):
+        offset = self._slot_offset(slot)
+        try:
+            with open(path, "rb") as f:
+                if cache_key(path, os.fstat(f.fileno()), start, length) != key:
+                    raise OSError(f"{path} changed while being cached")
+                f.seek(start)
+                read = f.readinto(memoryview(self._mm)[offset:offset + length])
+            complete = read == length
+        except OSError:
+            logger.warning("Could not cache segment %s", path, exc_info=True)
+            complete = False
+
+        with self._locked() as locked:
+            if not locked:
+                return False
+            slot_key, length, last_access, lease_until, state = self._slot(slot)
+            if slot_key != key or state != FILLING:
+                return False
+            if not complete:
+                self._release(slot)
+                return False
+            self._set_slot(slot, key, length, last_access, lease_until, READY)
+        return True
+
+
+segment_cache = SegmentCache()
@@ -0,0 +1,211 @@
+import os
+import struct
+from pathlib import Path
+from .delivery import file_validators, file_version, versioned_uri
+from .hls import parse_media_playlist, playlist_map_uri
+
+
+INDEX_FILENAME = "segments.idx"
+MAGIC = b"VFSI"
+VERSION = 2
+
+HAS_BYTERANGES = 1
+HAS_ENDLIST = 2
+
+# magic, version, flags, segment count, then the byte lengths of the header
+# tags, the EXT-X-MAP URI, the NUL-separated segment file names and the
+# NUL-separated versions of the EXT-X-MAP file and the segment files.
+HEADER = struct.Struct("<4sHHIIIII")
+# duration, length, offset, index into the file names
+SEGMENT = struct.Struct("<dQQI")
+
+
+def build_segment_index(output_dir):
+    """
+    Read a rendition's ``index.m3u8`` once and return its segment index.
+
+    Returns
+    -------
+    dict
+        ``header`` (the playlist tags before the first segment, without
+        ``EXT-X-MAP``), ``map_uri``, ``byteranges``, ``endlist``,
+        ``segments`` as ``(uri, duration, length, offset)`` tuples and
+        ``versions``, the ``delivery.file_version`` of every file named.
+        Sizes of whole-file segments are taken from the files.
+    """
+    output_dir = Path(output_dir)
+    playlist_path = output_dir / "index.m3u8"
+
+    header = []
+    endlist = False
+    with open(playlist_path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("#EXTINF:"):
+                break
+            if line and not line.startswith("#EXT-X-MAP:"):
+                header.append(line)
+        for line in f:
+            endlist = endlist or line.strip() == "#EXT-X-ENDLIST"
+
+    parsed = parse_media_playlist(playlist_path)
+    map_uri = playlist_map_uri(playlist_path)
+    segments = []
+    for uri, duration, byterange in parsed:
+        length, offset = byterange or ((output_dir / uri).stat().st_size, 0)
+        segments.append((uri, duration, length, offset))
+    files = dict.fromkeys([map_uri] if map_uri else [])
+    files.update(dict.fromkeys(uri for uri, _duration, _byterange in parsed))
+    versions = {name: file_version((output_dir / name).stat()) for name in files}
+
+    return {
+        "header": "\n".join(header) + "\n",
+        "map_uri": map_uri,
+        "byteranges": any(byterange for _uri, _duration, byterange in parsed),
+        "endlist": endlist,
+        "segments": segments,
+        "versions": versions,
+    }
+
+
+def write_segment_index(output_dir):
+    """
+    Write ``segments.idx`` for the rendition in ``output_dir``.
+
+    The pipeline calls this on the staged rendition, so the index is
+    published together with the playlist it was built from.
+
+    Returns
+    -------
+    Path
+        Path of the written index.
+    """
+    index = build_segment_index(output_dir)
+    names = list(dict.fromkeys(uri for uri, _duration, _length, _offset in index["segments"]))
+    positions = {name: position for position, name in enumerate(names)}
+
+    header = index["header"].encode("utf-8")
+    map_uri = (index["map_uri"] or "").encode("utf-8")
+    names_blob = "\0".join(names).encode("utf-8")
+    files = [index["map_uri"], *names] if index["map_uri"] else names
+    versions_blob = "\0".join(index["versions"][name] for name in files).encode("ascii")
+    flags = (HAS_BYTERANGES if index["byteranges"] else 0) | (HAS_ENDLIST if index["endlist"] else 0)
+
+    index_path = Path(output_dir) / INDEX_FILENAME
+    tmp_path = index_path.with_name(f".{INDEX_FILENAME}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(
+            MAGIC, VERSION, flags, len(index["segments"]),
+            len(header), len(map_uri), len(names_blob), len(versions_blob),
+        ))
+        f.write(header + map_uri + names_blob + versions_blob)
+        f.write(b"".join(
+            SEGMENT.pack(duration, length, offset, positions[uri])
+            for uri, duration, length, offset in index["segments"]
+        ))
+    os.replace(tmp_path, index_path)
+    return index_path
+
+
+def parse_segment_index(data):
+    """
+    Decode the bytes of a ``segments.idx`` file into the dict returned by
+    ``build_segment_index``.
+
+    Raises
+    ------
+    ValueError
+        If the data is not a segment index of this version.
+    """
+    try:
+        (
+            magic, version, flags, count, header_length, map_length, names_length, versions_length,
+        ) = HEADER.unpack_from(data)
+    except struct.error as exc:
+        raise ValueError("Truncated segment index") from exc
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a segment index of this version")
+
+    position = HEADER.size
+    header = data[position:position + header_length].decode("utf-8")
+    position += header_length
+    map_uri = data[position:position + map_length].decode("utf-8") or None
+    position += map_length
+    names = data[position:position + names_length].decode("utf-8").split("\0")
+    position += names_length
+    versions = data[position:position + versions_length].decode("ascii").split("\0")
+    position += versions_length
+
+    records = data[position:position + count * SEGMENT.size]
+    if len(records) != count * SEGMENT.size:
+        raise ValueError("Truncated segment index")
+    return {
+        "header": header,
+        "map_uri": map_uri,
+        "byteranges": bool(flags & HAS_BYTERANGES),
+        "endlist": bool(flags & HAS_ENDLIST),
+        "segments": [
+            (names[name], duration, length, offset)
+            for duration, length, offset, name in SEGMENT.iter_unpack(records)
+        ],
+        "versions": dict(zip([map_uri, *names] if map_uri else names, versions)),
+    }
+
+
+def playlist_template(index):
+    """
+    Render a segment index into a media playlist split after every URI.
+
+    Every segment URI and the ``EXT-X-MAP`` URI carry the version of their
+    file (see ``delivery.versioned_uri``). The parts joined with an empty
+    string are the playlist as published; joined with further query
+    parameters such as ``&expires=...&token=...``, every URI carries them
+    too. Rewriting URLs per request is thus a single ``bytes.join``.
+
+    Returns
+    -------
+    list
+        Byte strings to be joined with the URI suffix.
+    """
+    parts = []
+    text = index["header"]
+    if index["map_uri"]:
+        map_uri = versioned_uri(index["map_uri"], index["versions"][index["map_uri"]])
+        parts.append(f'{text}#EXT-X-MAP:URI="{map_uri}'.encode("utf-8"))
+        text = '"\n'
+    for uri, duration, length, offset in index["segments"]:
+        text += f"#EXTINF:{duration:.6f},\n"
+        if index["byteranges"]:
+            text += f"#EXT-X-BYTERANGE:{length}@{offset}\n"
+        parts.append(f"{text}{versioned_uri(uri, index['versions'][uri])}".encode("utf-8"))
+        text = "\n"
+    if index["endlist"]:
+        text += "#EXT-X-ENDLIST\n"
+    parts.append(text.encode("utf-8"))
+    return parts
+
+
+def load_rendition_playlist(output_dir):
+    """
+    Return the manifest cache entry of a rendition's playlist.
+
+    Rendered from ``segments.idx`` when the rendition has one, with the
+    ``template`` parts kept so URIs can be rewritten without parsing the
+    text. Renditions without an index of this version are indexed in
+    memory from ``index.m3u8`` until ``build_segment_indexes`` writes one.
+
+    Raises
+    ------
+    OSError
+        If neither the index nor the playlist can be read.
+    """
+    output_dir = Path(output_dir)
+    try:
+        with open(output_dir / INDEX_FILENAME, "rb") as f:
+            etag, last_modified = file_validators(os.fstat(f.fileno()))
+            index = parse_segment_index(f.read())
+    except (FileNotFoundError, ValueError):
+        etag, last_modified = file_validators(os.stat(output_dir / "index.m3u8"))
+        index = build_segment_index(output_dir)
+    template = playlist_template(index)
+    return {"body": b"".join(template), "template": template, "etag": etag, "last_modified": last_modified}
@@ -1,29 +1,51 @@
-import os
-import queue
+from functools import partial
+from django.db import transaction
 from django.dispatch import receiver
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from content_app.models import Video
-from .tasks import convert_video_to_hls, thumbnail_video
-from django_rq import get_queue
+from .catalog_cache import bump_catalog_version
+from .manifest_cache import invalidate_manifests
+from .playable_index import remove_playable, sync_playable
+from .tasks import enqueue_hls_transcode
 
 
 @receiver(post_save, sender=Video)
 def video_post_save(sender, instance, created, *args, **kwargs):
     """
-    Handles post-save events when a new Video is created.
+    Handles post-save events of a Video.
 
-    Enqueues background tasks to:
-    - Convert the uploaded video to HLS format.
-    - Generate a thumbnail for the video.
+    Every save bumps the catalog version once the transaction commits, so
+    no cached catalog page shows the old state, and brings the playable
+    index in line with the saved status, e.g. after an admin marked a video
+    failed or complete; see ``sync_playable``. A new Video also gets its
+    HLS transcoding enqueued on the ``transcode`` queue once committed, so
+    no worker starts on a row that is not visible yet or is rolled back;
+    the same jobs also produce the poster thumbnail and the trickplay
+    sprites.
+
+    Transcoding runs on its own queue so long encodes never delay the
+    e-mails sent from the ``default`` queue.
 
     Args:
         sender (Model): The model class.
         instance (Video): The actual instance being saved.
         created (bool): Whether this is a new instance.
     """
+    transaction.on_commit(bump_catalog_version)
     if not created:
+        transaction.on_commit(partial(sync_playable, instance.id, instance.status))
         return
 
-    queue_instance = get_queue("default")
-    queue_instance.enqueue(convert_video_to_hls, instance.file.path, instance.id, job_timeout=900)
-    queue_instance.enqueue(thumbnail_video, instance.file.path, instance.id, job_timeout=900)
+    transaction.on_commit(partial(enqueue_hls_transcode, instance.file.path, instance.id))
+
+
+@receiver(post_delete, sender=Video)
+def video_post_delete(sender, instance, *args, **kwargs):
+    """
+    Drops the deleted video from the playable index, its playlists from
+    every web worker's manifest cache and it from the cached catalog
+    pages, so none of them is served any longer.
+    """
+    transaction.on_commit(bump_catalog_version)
+    remove_playable(instance.id)
+    invalidate_manifests(instance.id)
@@ -0,0 +1,114 @@
+import base64
+import hashlib
+import hmac
+import time
+from functools import lru_cache
+from urllib.parse import urlencode
+from django.conf import settings
+from .compression import compressed_variants
+from .delivery import PRIVATE_REVALIDATE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, serve_bytes
+
+
+@lru_cache(maxsize=4)
+def signing_key(secret_key):
+    """
+    Derive the segment URL key from ``SECRET_KEY``, so it is not used as is.
+    """
+    return hashlib.sha256(b"videoflix:segment-url:" + secret_key.encode("utf-8")).digest()
+
+
+def segment_token(video_id, rendition, expires):
+    """
+    Return the URL-safe HMAC-SHA256 token of a rendition's segments valid
+    until the unix time ``expires``.
+    """
+    message = f"{video_id}:{rendition}:{expires}".encode("utf-8")
+    digest = hmac.new(signing_key(settings.SECRET_KEY), message, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+
+def current_expiry(now=None):
+    """
+    Return the expiry to sign with now.
+
+    Expiries are rounded up to ``SEGMENT_URL_BUCKET`` seconds, so every
+    playlist signed within one bucket is byte-identical and stays cacheable
+    by browsers and CDNs; tokens live between ``SEGMENT_URL_TTL`` and
+    ``SEGMENT_URL_TTL + SEGMENT_URL_BUCKET`` seconds.
+    """
+    now = int(now if now is not None else time.time())
+    bucket = settings.SEGMENT_URL_BUCKET
+    return (now // bucket + 1) * bucket + settings.SEGMENT_URL_TTL
+
+
+def verify_segment_token(video_id, rendition, params, now=None):
+    """
+    Return True if ``params`` (the query) carry an unexpired token for the
+    rendition. Pure CPU work: no database query and no JWT decoding.
+    """
+    try:
+        expires = int(params.get("expires", ""))
+    except ValueError:
+        return False
+    if expires < (now if now is not None else time.time()):
+        return False
+    return hmac.compare_digest(segment_token(video_id, rendition, expires), params.get("token", ""))
+
+
+def token_query(video_id, rendition, expires):
+    """
+    Return the ``expires=...&token=...`` query of signed segment URIs.
+    """
+    return urlencode({"expires": expires, "token": segment_token(video_id, rendition, expires)})
+
+
+def signed_manifest(entry, video_id, rendition):
+    """
+    Return the signed body, its compressed variants, ETag and
+    Last-Modified of a cached playlist entry.
+
+    The token is appended to every segment URI, including the
+    ``EXT-X-MAP`` init segment of CMAF renditions, by joining the entry's
+    ``template`` parts. The signed body is memoised on the entry for the
+    current expiry bucket, together with its gzip and brotli variants.
+    These are compressed at the fast levels: they are redone per worker,
+    rendition and bucket on the request path, and the token-bearing lines
+    gain little from the slow ones. The validators change with the bucket
+    too, so a client never revalidates its way into keeping expired tokens.
+    """
+    expires = current_expiry()
+    signed = entry.get("signed")
+    if signed is None or signed[0] != expires:
+        body = f"&{token_query(video_id, rendition, expires)}".encode("ascii").join(entry["template"])
+        signed = (expires, body, compressed_variants(body, fast=True))
+        entry["signed"] = signed
+    bucket_start = expires - settings.SEGMENT_URL_TTL - settings.SEGMENT_URL_BUCKET
+    return signed[1], signed[2], f'{entry["etag"][:-1]}-{expires:x}"', max(entry["last_modified"], bucket_start)
+
+
+def playlist_response(request, entry, video_id, rendition):
+    """
+    Serve a cached playlist (``rendition`` ``"master"`` for the master
+    playlist).
+
+    If ``SIGNED_MEDIA_URLS`` is on, media playlists get signed segment URIs
+    and all playlists are private to the authenticated client, so shared
+    caches never hand them to anyone else.
+
+    Playlists are sent gzip or brotli compressed per ``Accept-Encoding``;
+    the variants are compressed once per cache entry at the best ratio, or
+    per signing bucket at a fast level.
+    """
+    if rendition == "master" or not settings.SIGNED_MEDIA_URLS:
+        variants = entry.get("variants")
+        if variants is None:
+            variants = entry["variants"] = compressed_variants(entry["body"])
+        body, etag, last_modified = entry["body"], entry["etag"], entry["last_modified"]
+    else:
+        body, variants, etag, last_modified = signed_manifest(entry, video_id, rendition)
+
+    cache_control = PRIVATE_REVALIDATE_CACHE_CONTROL if settings.SIGNED_MEDIA_URLS else REVALIDATE_CACHE_CONTROL
+    return serve_bytes(
+        request, body, "application/vnd.apple.mpegurl", etag, last_modified,
+        cache_control=cache_control, variants=variants,
+    )
@@ -1,18 +1,430 @@
-import subprocess
+import math
+from contextlib import ExitStack
+from fractions import Fraction
 from pathlib import Path
 from django.conf import settings
+from django_rq import get_queue
+from rq import Callback
+from content_app.models import Video
+from .catalog_cache import bump_catalog_version
+from .hls import (
+    POSTER_SECONDS,
+    preview_filters,
+    preview_output_args,
+    probe_source,
+    run_ffmpeg_streaming,
+    select_renditions,
+    write_master_playlist,
+    write_trickplay_track,
+)
+from .manifest_cache import invalidate_manifests
+from .playable_index import add_playable, remove_playable
+from .progress import progress_reporter, publish_status, stage_timer
+from .scheduler import ffmpeg_slot, slot_command, slot_preexec
+from .thumbnails import write_thumbnail_variants
+from .transcode_state import (
+    STAGING_DIRNAME,
+    load_state,
+    previews_are_current,
+    publish_staged_rendition,
+    record_previews,
+    record_rendition,
+    rendition_is_current,
+    settings_digest,
+    source_fingerprint,
+    staging_dir,
+    state_lock,
+)
+
+
+HLS_SEGMENT_SECONDS = 4
+
+VIDEO_ENCODER_ARGS = [
+    "-c:v", "libx264", "-crf", "23", "-preset", "veryfast",
+    "-force_key_frames", f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})",
+]
+AUDIO_ENCODER_ARGS = ["-c:a", "aac", "-b:a", "128k", "-ac", "2", "-ar", "48000"]
+HLS_MUXER_ARGS = [
+    "-hls_time", str(HLS_SEGMENT_SECONDS),
+    "-hls_playlist_type", "vod",
+]
+# The source's audio encoded once for the single-pass encode, in staging.
+AUDIO_FILENAME = "audio.m4a"
+# Output pixel rate (1080p30) of one unit of ``TRANSCODE_TIMEOUT_FACTOR``.
+REFERENCE_PIXEL_RATE = 1920 * 1080 * 30
+
+
+def hls_segment_args(output_dir):
+    """
+    Return the muxer arguments naming a rendition's media files.
+
+    ``"ts"`` writes one MPEG-TS file per segment. ``"cmaf"`` writes a single
+    fragmented-MP4 file per rendition plus an init segment, addressed with
+    ``EXT-X-MAP`` and ``EXT-X-BYTERANGE`` in the playlist.
+    """
+    if settings.HLS_SEGMENT_FORMAT == "cmaf":
+        return [
+            "-hls_segment_type", "fmp4",
+            "-hls_flags", "single_file",
+            "-hls_fmp4_init_filename", "init.mp4",
+            "-hls_segment_filename", str(Path(output_dir) / "media.m4s"),
+        ]
+    if settings.HLS_SEGMENT_FORMAT == "ts":
+        return ["-hls_segment_filename", str(Path(output_dir) / "segment_%03d.ts")]
+    raise ValueError(f"Unknown HLS segment format: {settings.HLS_SEGMENT_FORMAT}")
+
+
+def scale_filter(rendition):
+    """
+    Return the filter scaling to the rendition's size with square pixels.
+    """
+    return f"scale={rendition['width']}:{rendition['height']},setsar=1"
+
+
+def rendition_settings_digest(rendition, probe):
+    """
+    Hash everything that shapes a rendition's output, so a change of encoder
+    arguments or target size invalidates it.
+    """
+    return settings_digest({
+        "video": VIDEO_ENCODER_ARGS,
+        "audio": AUDIO_ENCODER_ARGS if probe["has_audio"] else [],
+        "hls": HLS_MUXER_ARGS,
+        "segment_format": settings.HLS_SEGMENT_FORMAT,
+        "rendition": rendition,
+    })
+
+
+def previews_settings_digest():
+    """
+    Hash the settings that shape the poster and trickplay outputs.
+    """
+    return settings_digest({
+        "poster_seconds": POSTER_SECONDS,
+        "interval": settings.TRICKPLAY_INTERVAL,
+        "tile_width": settings.TRICKPLAY_TILE_WIDTH,
+        "grid": [settings.TRICKPLAY_COLUMNS, settings.TRICKPLAY_ROWS],
+        "thumbnail_widths": sorted(settings.THUMBNAIL_WIDTHS),
+        "thumbnail_formats": settings.THUMBNAIL_FORMATS,
+    })
+
+
+def build_rendition_command(source_path, output_dir, rendition, probe, preview_dir=None):
+    """
+    Build the ffmpeg command that encodes a single HLS rendition.
+
+    With a ``preview_dir`` the same decode also writes the poster image and
+    the trickplay sprite sheets there.
+    """
+    has_audio = probe["has_audio"]
+    if preview_dir:
+        filters = [
+            "[0:v]split=3[v][p][s]",
+            f"[v]{scale_filter(rendition)}[vout]",
+            *preview_filters(probe, "p", "s"),
+        ]
+        video_args = ["-filter_complex", ";".join(filters), "-map", "[vout]"]
+    else:
+        video_args = ["-map", "0:v:0", "-vf", scale_filter(rendition)]
+
+    return [
+        "ffmpeg", "-y",
+        "-i", str(source_path),
+        *video_args,
+        *(["-map", "0:a:0"] if has_audio else []),
+        "-r", rendition["frame_rate"],
+        *VIDEO_ENCODER_ARGS,
+        *(AUDIO_ENCODER_ARGS if has_audio else []),
+        *HLS_MUXER_ARGS,
+        *hls_segment_args(output_dir),
+        str(output_dir / "index.m3u8"),
+        *(preview_output_args(preview_dir) if preview_dir else []),
+    ]
+
+
+def build_audio_command(source_path, audio_path):
+    """
+    Build the ffmpeg command that encodes the source's audio track once, for
+    ``build_single_pass_command`` to copy into every rendition.
+    """
+    return [
+        "ffmpeg", "-y",
+        "-i", str(source_path),
+        "-map", "0:a:0", "-vn",
+        *AUDIO_ENCODER_ARGS,
+        str(audio_path),
+    ]
+
+
+def build_single_pass_command(source_path, output_root, renditions, probe, audio_path=None,
+                              preview_dir=None):
+    """
+    Build one ffmpeg command that decodes the source once and writes every
+    rendition below ``output_root`` and, with a ``preview_dir``, the poster
+    image and the trickplay sprite sheets.
+
+    The decoded video is split into one scaler per rendition plus the two
+    preview branches; ffmpeg's HLS muxer then writes ``<name>/index.m3u8``
+    for each entry of ``-var_stream_map``. The master playlist is written
+    afterwards from the measured output.
+
+    Sources with audio need ``audio_path``, their audio encoded once by
+    ``build_audio_command``: every rendition copies that stream rather than
+    encoding the same audio again.
+    """
+    has_audio = probe["has_audio"]
+    if has_audio and audio_path is None:
+        raise ValueError("The single-pass encode of a source with audio needs its encoded audio")
+    names = list(renditions)
+    split_labels = "".join(f"[v{index}]" for index in range(len(names)))
+    if preview_dir:
+        filters = [f"[0:v]split={len(names) + 2}{split_labels}[p][s]"]
+    else:
+        filters = [f"[0:v]split={len(names)}{split_labels}"]
+    filters += [
+        f"[v{index}]{scale_filter(renditions[name])}[v{index}out]"
+        for index, name in enumerate(names)
+    ]
+    if preview_dir:
+        filters += preview_filters(probe, "p", "s")
+
+    cmd = [
+        "ffmpeg", "-y",
+        "-i", str(source_path),
+        *(["-i", str(audio_path)] if has_audio else []),
+        "-filter_complex", ";".join(filters),
+    ]
+    stream_map = []
+    for index, name in enumerate(names):
+        cmd += ["-map", f"[v{index}out]", f"-r:v:{index}", renditions[name]["frame_rate"]]
+        if has_audio:
+            cmd += ["-map", "1:a:0"]
+            stream_map.append(f"v:{index},a:{index},name:{name}")
+        else:
+            stream_map.append(f"v:{index},name:{name}")
+
+    cmd += [
+        *VIDEO_ENCODER_ARGS,
+        *(["-c:a", "copy"] if has_audio else []),
+        "-f", "hls",
+        *HLS_MUXER_ARGS,
+        *hls_segment_args(Path(output_root) / "%v"),
+        "-var_stream_map", " ".join(stream_map),
+        str(Path(output_root) / "%v" / "index.m3u8"),
+        *(preview_output_args(preview_dir) if preview_dir else []),
+    ]
+    return cmd
+
+
+def build_preview_command(source_path, probe, preview_dir):
+    """
+    Build an ffmpeg command that only writes the poster and trickplay sprites.
+
+    Used when every rendition is already valid but the previews are not.
+    """
+    filters = ["[0:v]split=2[p][s]", *preview_filters(probe, "p", "s")]
+    return [
+        "ffmpeg", "-y",
+        "-i", str(source_path),
+        "-filter_complex", ";".join(filters),
+        *preview_output_args(preview_dir),
+    ]
+
+
+def run_encode(cmd, video_id, scope, probe):
+    """
+    Run an encode as the ``encode:<scope>`` stage, streaming its progress.
+
+    The encode first waits for a free ffmpeg slot of this host (the
+    ``wait:<scope>`` stage) and then runs niced and pinned to the slot's
+    CPUs; see ``scheduler.ffmpeg_slot``.
+    """
+    with ExitStack() as stack:
+        with stage_timer(video_id, f"wait:{scope}"):
+            slot = stack.enter_context(ffmpeg_slot())
+        with stage_timer(video_id, f"encode:{scope}"):
+            run_ffmpeg_streaming(
+                slot_command(cmd, slot),
+                progress_reporter(video_id, scope, probe["duration"]),
+                preexec_fn=slot_preexec(slot),
+            )
+
+
+def finish_previews(video_id, base_output_dir, probe, source_hash):
+    """
+    Write the trickplay track for freshly encoded sprites and the responsive
+    thumbnails of the fresh poster, and record them.
+    """
+    write_trickplay_track(base_output_dir, probe)
+    with stage_timer(video_id, "thumbnails"):
+        write_thumbnail_variants(base_output_dir, probe)
+    record_previews(video_id, base_output_dir, source_hash, previews_settings_digest())
+
+
+def set_video_status(video_id, status, only_from):
+    """
+    Move a video to ``status`` if it is currently in one of ``only_from``.
+
+    A conditional UPDATE rather than a read-modify-save, so concurrent
+    rendition jobs never move a video back to an earlier state. The UPDATE
+    sends no ``post_save``, so the catalog version is bumped here, and a
+    video leaving the playable statuses is removed from the playable index;
+    the callers index renditions themselves as they publish them.
+    """
+    updated = Video.objects.filter(id=video_id, status__in=only_from).update(status=status)
+    if updated:
+        bump_catalog_version()
+        if status not in Video.PLAYABLE_STATUSES:
+            remove_playable(video_id)
+    return updated
+
+
+def transcode_failed(job, connection, exc_type, exc_value, traceback):
+    """
+    RQ ``on_failure`` callback marking the job's video as failed.
+
+    A video that is already playable stays playable when a higher rendition
+    fails; the failure is still visible in the transcode status.
+    """
+    set_video_status(job.meta["video_id"], Video.FAILED, (Video.QUEUED, Video.TRANSCODING))
 
-import subprocess
-from pathlib import Path
-from django.conf import settings
 
-def convert_video_to_hls(source, video_id):
+def encode_job_timeout(probe, renditions):
     """
-    Convert a video into HLS at 480p, 720p, and 1080p and write a master playlist.
+    Return the RQ job timeout, in seconds, of encoding ``renditions`` of a
+    probed source.
 
+    The encode time grows with the source's duration and the pixels per
+    second written, so a fixed timeout would kill long or tall encodes on
+    every attempt. The decode and previews count as one more 1080p30 output;
+    ``TRANSCODE_MIN_TIMEOUT`` covers startup and the wait for an ffmpeg slot.
+    """
+    pixel_rate = sum(
+        rendition["width"] * rendition["height"] * Fraction(rendition["frame_rate"])
+        for rendition in renditions
+    )
+    outputs = 1 + pixel_rate / REFERENCE_PIXEL_RATE
+    return settings.TRANSCODE_MIN_TIMEOUT + math.ceil(
+        probe["duration"] * outputs * settings.TRANSCODE_TIMEOUT_FACTOR
+    )
+
+
+def enqueue_transcode_job(queue_instance, func, video_id, *args, **kwargs):
+    """
+    Enqueue a transcode job tagged with its video, so a failure can be
+    recorded on the Video.
+    """
+    return queue_instance.enqueue(
+        func, *args, meta={"video_id": video_id}, on_failure=Callback(transcode_failed), **kwargs
+    )
+
+
+def publish_master(video_id, base_output_dir):
+    """
+    Rewrite the master playlist for every rendition published so far and
+    mark the video playable.
+
+    Called after each rendition lands, so the title can be watched once
+    its lowest rendition is ready while the rest of the ladder is encoded.
+    """
+    with state_lock(video_id):
+        names = list(load_state(base_output_dir)["renditions"])
+        write_master_playlist(base_output_dir, names)
+    add_playable(video_id, names)
+    invalidate_manifests(video_id)
+    set_video_status(video_id, Video.PLAYABLE, (Video.QUEUED, Video.TRANSCODING, Video.FAILED))
+
+
+def encode_rendition(source_path, video_id, base_output_dir, name, rendition, probe, source_hash,
+                     preview_dir=None):
+    """
+    Encode one rendition into staging, move it into place, record it and
+    add it to the master playlist.
+    """
+    run_encode(build_rendition_command(
+        source_path, staging_dir(base_output_dir, name), rendition, probe, preview_dir=preview_dir
+    ), video_id, name, probe)
+    publish_staged_rendition(base_output_dir, name)
+    record_rendition(video_id, base_output_dir, name, source_hash, rendition_settings_digest(rendition, probe))
+    publish_master(video_id, base_output_dir)
+
+
+def analyse_source(source_path, video_id, base_output_dir):
+    """
+    Mark the video as transcoding and run the probe and hashing stages.
+
+    Returns
+    -------
+    tuple
+        ``(probe, renditions, source_hash)``.
+    """
+    set_video_status(video_id, Video.TRANSCODING, (Video.QUEUED, Video.FAILED))
+    with stage_timer(video_id, "probe"):
+        probe = probe_source(source_path)
+        renditions = select_renditions(probe)
+    with stage_timer(video_id, "hash"):
+        source_hash = source_fingerprint(source_path, video_id, base_output_dir)
+    return probe, renditions, source_hash
+
+
+def write_master(video_id, base_output_dir, names):
+    """
+    Run the master playlist stage over the whole ladder and mark the
+    transcode, and the video, as complete.
+    """
+    with stage_timer(video_id, "master"), state_lock(video_id):
+        master_path = write_master_playlist(base_output_dir, names)
+    add_playable(video_id, names)
+    invalidate_manifests(video_id)
+    publish_status(video_id, state="done", current_stage=None)
+    set_video_status(
+        video_id, Video.COMPLETE, (Video.QUEUED, Video.TRANSCODING, Video.PLAYABLE, Video.FAILED)
+    )
+    return master_path
+
+
+def convert_video_to_hls(source, video_id, mode=None):
+    """
+    Convert a video into an HLS ladder fitted to the source and write a
+    measured master playlist.
+
+    The source is analysed with ffprobe first; only rungs of ``LADDER`` no
+    taller than the source are encoded, at its frame rate and aspect ratio.
     The outputs are written under:
-        MEDIA_ROOT/videos/<video_id>/{480p,720p,1080p}/index.m3u8
+        MEDIA_ROOT/videos/<video_id>/<rendition>/index.m3u8
         MEDIA_ROOT/videos/<video_id>/master.m3u8
+        MEDIA_ROOT/videos/<video_id>/<video_id>_thumbnail.jpg
+        MEDIA_ROOT/videos/<video_id>/trickplay/{sprite_NNN.jpg,thumbnails.vtt}
+
+    The poster and sprite sheets come out of the same decode as the lowest
+    rendition.
+
+    Publishing is progressive: the lowest rendition is encoded first, and
+    the master playlist is rewritten as each rendition lands. The video is
+    ``playable`` after the first one and ``complete`` after the last.
+
+    Re-runs are idempotent: ``transcode.json`` records the source's content
+    hash, the encoder settings and a checksum per rendition, and renditions
+    that are still valid are skipped. Renditions are encoded into a staging
+    directory and moved into place when finished, so a crash or job timeout
+    only costs the renditions that were in flight.
+
+    Progress and per-stage durations are published to Redis while the job
+    runs; see ``progress.get_transcode_status``.
+
+    Two in-process encode modes are available (``settings.HLS_ENCODE_MODE``):
+
+    - ``"single_pass"`` decodes the source once and feeds every scaler from a
+      single ffmpeg process. The audio is encoded once beforehand and
+      copied into every rendition. When nothing is playable yet, the lowest
+      rendition is encoded on its own first and the remaining rungs share
+      one decode.
+    - ``"per_rendition"`` runs one ffmpeg process per rendition; kept as a
+      fallback for ffmpeg builds or sources the single-pass graph cannot handle.
+
+    The ``"parallel"`` mode does not go through this function; see
+    ``enqueue_hls_transcode``. Called with it, the rendition-by-rendition
+    path is used.
 
     Parameters
     ----------
@@ -20,6 +432,8 @@ def convert_video_to_hls(source, video_id):
         Absolute path to the input video file.
     video_id : int
         Identifier used for the output directory.
+    mode : str, optional
+        Overrides ``settings.HLS_ENCODE_MODE``.
 
     Returns
     -------
@@ -30,73 +444,198 @@ def convert_video_to_hls(source, video_id):
     Raises
     ------
     RuntimeError
-        If ffmpeg fails for any rendition.
+        If ffprobe or ffmpeg fails.
+    ValueError
+        If ``mode`` is not a known encode mode.
     """
     source_path = Path(source)
     base_output_dir = Path(settings.MEDIA_ROOT) / "videos" / str(video_id)
+    mode = mode or settings.HLS_ENCODE_MODE
+    if mode not in ("single_pass", "per_rendition", "parallel"):
+        raise ValueError(f"Unknown HLS encode mode: {mode}")
 
-    resolutions = {
-        "480p": "480",
-        "720p": "720",
-        "1080p": "1080",
-    }
+    probe, renditions, source_hash = analyse_source(source_path, video_id, base_output_dir)
 
-    manifest_paths = {}
-
-    for folder_name, height in resolutions.items():
-        output_dir = base_output_dir / folder_name
-        output_dir.mkdir(parents=True, exist_ok=True)
-
-        manifest_path = output_dir / "index.m3u8"
-        segment_pattern = output_dir / "segment_%03d.ts"
-
-        cmd = [
-            "ffmpeg", "-y",
-            "-i", str(source_path),
-            "-vf", f"scale=-2:{height}",
-            "-c:v", "libx264", "-crf", "23", "-preset", "veryfast",
-            "-c:a", "aac", "-b:a", "128k", "-ac", "2", "-ar", "48000",
-            "-hls_time", "4",
-            "-hls_playlist_type", "vod",
-            "-hls_segment_filename", str(segment_pattern),
-            str(manifest_path),
-        ]
+    pending = {
+        name: rendition
+        for name, rendition in renditions.items()
+        if not rendition_is_current(
+            base_output_dir, name, source_hash, rendition_settings_digest(rendition, probe)
+        )
+    }
+    previews_pending = not previews_are_current(base_output_dir, source_hash, previews_settings_digest())
+    preview_dir = base_output_dir if previews_pending else None
 
-        subprocess.run(cmd, capture_output=True)
-        manifest_paths[folder_name] = manifest_path
+    # Nothing playable yet: publish the lowest rendition before the long
+    # single-pass encode of the rest.
+    if mode == "single_pass" and len(pending) > 1 and len(pending) == len(renditions):
+        lowest = next(iter(pending))
+        encode_rendition(
+            source_path, video_id, base_output_dir, lowest, pending.pop(lowest), probe, source_hash,
+            preview_dir=preview_dir,
+        )
+        preview_dir = None
 
-    master_path = base_output_dir / "master.m3u8"
-    with open(master_path, "w", encoding="utf-8") as f:
-        f.write("#EXTM3U\n")
-        f.write("#EXT-X-VERSION:3\n")
+    if pending and mode == "single_pass":
+        for name in pending:
+            staging_dir(base_output_dir, name)
+        audio_path = None
+        if probe["has_audio"]:
+            audio_path = base_output_dir / STAGING_DIRNAME / AUDIO_FILENAME
+            run_encode(build_audio_command(source_path, audio_path), video_id, "audio", probe)
+        run_encode(build_single_pass_command(
+            source_path, base_output_dir / STAGING_DIRNAME, pending, probe,
+            audio_path=audio_path, preview_dir=preview_dir,
+        ), video_id, "single_pass", probe)
+        if audio_path:
+            audio_path.unlink()
+        for name, rendition in pending.items():
+            publish_staged_rendition(base_output_dir, name)
+            record_rendition(
+                video_id, base_output_dir, name, source_hash, rendition_settings_digest(rendition, probe)
+            )
+        invalidate_manifests(video_id)
+    else:
+        for index, (name, rendition) in enumerate(pending.items()):
+            encode_rendition(
+                source_path, video_id, base_output_dir, name, rendition, probe, source_hash,
+                preview_dir=preview_dir if index == 0 else None,
+            )
+        if previews_pending and not pending:
+            run_encode(build_preview_command(source_path, probe, base_output_dir), video_id, "previews", probe)
 
-        f.write('#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=854x480\n')
-        f.write("480p/index.m3u8\n")
-        f.write('#EXT-X-STREAM-INF:BANDWIDTH=2800000,RESOLUTION=1280x720\n')
-        f.write("720p/index.m3u8\n")
-        f.write('#EXT-X-STREAM-INF:BANDWIDTH=5000000,RESOLUTION=1920x1080\n')
-        f.write("1080p/index.m3u8\n")
+    if previews_pending:
+        finish_previews(video_id, base_output_dir, probe, source_hash)
 
-    manifest_paths["master"] = master_path
+    manifest_paths = {name: base_output_dir / name / "index.m3u8" for name in renditions}
+    manifest_paths["master"] = write_master(video_id, base_output_dir, renditions)
     return manifest_paths
 
 
-def thumbnail_video(source, video_id):
-    source_path = Path(source)
-    output_dir = Path(settings.MEDIA_ROOT) / "thumbnails"
-    output_dir.mkdir(parents=True, exist_ok=True)
+def transcode_rendition(source, video_id, name, rendition, probe, source_hash, previews=False):
+    """
+    Encode a single rendition of the ladder into
+    ``MEDIA_ROOT/videos/<video_id>/<name>/index.m3u8``.
 
-    thumbnail_path = output_dir / f"{video_id}_thumbnail.jpg"
+    Runs as its own RQ job so renditions of one title can be encoded in
+    parallel by several workers. The job flagged with ``previews`` also
+    writes the poster and the trickplay sprites and track. A rendition that
+    is already valid for this source and settings is not encoded again.
+    A finished rendition is added to the master playlist right away.
 
-    command = [
-        "ffmpeg", "-y",
-        "-ss", "00:00:01.000",
-        "-i", str(source_path),
-        "-vframes", "1",
-        str(thumbnail_path),
+    Returns
+    -------
+    Path
+        Path of the rendition playlist.
+    """
+    base_output_dir = Path(settings.MEDIA_ROOT) / "videos" / str(video_id)
+    digest = rendition_settings_digest(rendition, probe)
+
+    if not rendition_is_current(base_output_dir, name, source_hash, digest):
+        encode_rendition(
+            Path(source), video_id, base_output_dir, name, rendition, probe, source_hash,
+            preview_dir=base_output_dir if previews else None,
+        )
+    elif previews:
+        run_encode(build_preview_command(Path(source), probe, base_output_dir), video_id, "previews", probe)
+
+    if previews:
+        finish_previews(video_id, base_output_dir, probe, source_hash)
+    return base_output_dir / name / "index.m3u8"
+
+
+def generate_previews(source, video_id, probe, source_hash):
+    """
+    Write only the poster and trickplay files, for re-runs where every
+    rendition is still valid.
+    """
+    base_output_dir = Path(settings.MEDIA_ROOT) / "videos" / str(video_id)
+    run_encode(build_preview_command(Path(source), probe, base_output_dir), video_id, "previews", probe)
+    finish_previews(video_id, base_output_dir, probe, source_hash)
+
+
+def finalize_hls(video_id, names):
+    """
+    Write the measured master playlist once every rendition job has succeeded.
+
+    Enqueued with ``depends_on`` all rendition jobs, so RQ only runs it after
+    each of them finished without error.
+    """
+    base_output_dir = Path(settings.MEDIA_ROOT) / "videos" / str(video_id)
+    return write_master(video_id, base_output_dir, names)
+
+
+def plan_hls_transcode(source, video_id):
+    """
+    Analyse the source and enqueue the encode jobs it still needs, with
+    timeouts sized by ``encode_job_timeout``.
+
+    Probing and hashing happen here, on a transcode worker, rather than in
+    the web process that saved the video. In ``"parallel"`` mode the
+    renditions that are not yet valid for the source's content hash are
+    fanned out as one job each, lowest first, so with fewer free workers
+    than renditions the lowest is the first to become playable. The other
+    modes get a single ``convert_video_to_hls`` job.
+
+    Returns
+    -------
+    rq.job.Job
+        The ``finalize_hls`` job that writes the master playlist, or the
+        ``convert_video_to_hls`` job.
+    """
+    base_output_dir = Path(settings.MEDIA_ROOT) / "videos" / str(video_id)
+    probe, renditions, source_hash = analyse_source(source, video_id, base_output_dir)
+
+    pending = [
+        name for name, rendition in renditions.items()
+        if not rendition_is_current(
+            base_output_dir, name, source_hash, rendition_settings_digest(rendition, probe)
+        )
     ]
-    result = subprocess.run(command, capture_output=True, text=True)
-    if result.returncode != 0:
-        raise RuntimeError(f"ffmpeg failed: {result.stderr}")
+    previews_pending = not previews_are_current(base_output_dir, source_hash, previews_settings_digest())
 
-    return settings.MEDIA_URL + f"thumbnails/{video_id}_thumbnail.jpg"
\ No newline at end of file
+    queue_instance = get_queue("transcode")
+    if settings.HLS_ENCODE_MODE != "parallel":
+        return enqueue_transcode_job(
+            queue_instance, convert_video_to_hls, video_id, source, video_id,
+            job_timeout=encode_job_timeout(probe, [renditions[name] for name in pending]),
+        )
+    jobs = [
+        enqueue_transcode_job(
+            queue_instance, transcode_rendition, video_id,
+            source, video_id, name, renditions[name], probe, source_hash,
+            previews=previews_pending and index == 0,
+            job_timeout=encode_job_timeout(probe, [renditions[name]]),
+        )
+        for index, name in enumerate(pending)
+    ]
+    if previews_pending and not pending:
+        jobs.append(enqueue_transcode_job(
+            queue_instance, generate_previews, video_id, source, video_id, probe, source_hash,
+            job_timeout=encode_job_timeout(probe, []),
+        ))
+    return enqueue_transcode_job(
+        queue_instance, finalize_hls, video_id, video_id, list(renditions),
+        depends_on=jobs or None, job_timeout=60,
+    )
+
+
+def enqueue_hls_transcode(source, video_id):
+    """
+    Enqueue HLS transcoding for a video on the ``transcode`` queue.
+
+    A ``plan_hls_transcode`` job probes the source and enqueues the encode
+    jobs, so their timeouts can follow its duration: in ``"parallel"`` mode
+    one job per rendition plus a ``finalize_hls`` job depending on all of
+    them, in the other modes a single ``convert_video_to_hls`` job.
+
+    Returns
+    -------
+    rq.job.Job
+        The enqueued job.
+    """
+    publish_status(video_id, state="queued", error=None)
+    queue_instance = get_queue("transcode")
+    return enqueue_transcode_job(
+        queue_instance, plan_hls_transcode, video_id, source, video_id, job_timeout=300
+    )
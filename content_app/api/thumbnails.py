@@ -0,0 +1,165 @@
+import logging
+import shutil
+from pathlib import Path
+from django.conf import settings
+from .hls import poster_path, run_ffmpeg
+
+
+logger = logging.getLogger(__name__)
+
+THUMBNAILS_DIRNAME = "thumbnails"
+
+# Formats in order of preference when the client accepts several:
+# name -> (content type, file extension, ffmpeg encoder arguments).
+THUMBNAIL_FORMATS = {
+    "avif": ("image/avif", "avif", [
+        "-c:v", "libaom-av1", "-still-picture", "1", "-crf", "32", "-b:v", "0",
+        "-cpu-used", "6", "-pix_fmt", "yuv420p",
+    ]),
+    "webp": ("image/webp", "webp", ["-c:v", "libwebp", "-quality", "75"]),
+    "jpeg": ("image/jpeg", "jpg", ["-q:v", "4"]),
+}
+
+
+def thumbnail_formats():
+    """
+    Return the configured ``THUMBNAIL_FORMATS`` in preference order.
+    """
+    return [name for name in THUMBNAIL_FORMATS if name in settings.THUMBNAIL_FORMATS]
+
+
+def thumbnail_widths(probe=None):
+    """
+    Return the configured widths in ascending order, without those wider
+    than the source when its ``probe`` is given, so nothing is upscaled.
+    """
+    widths = sorted(set(settings.THUMBNAIL_WIDTHS))
+    if probe is None:
+        return widths
+    fitting = [width for width in widths if width <= probe["display_width"]]
+    return fitting or widths[:1]
+
+
+def variant_path(base_output_dir, width, format_name):
+    """
+    Return the path of one thumbnail derivative, e.g.
+    ``thumbnails/640.webp``.
+    """
+    extension = THUMBNAIL_FORMATS[format_name][1]
+    return Path(base_output_dir) / THUMBNAILS_DIRNAME / f"{width}.{extension}"
+
+
+def build_thumbnail_command(base_output_dir, probe, widths, format_name):
+    """
+    Build one ffmpeg command scaling the poster to every width in one format.
+    """
+    filters = [f"[0:v]split={len(widths)}" + "".join(f"[t{index}]" for index in range(len(widths)))]
+    outputs = []
+    for index, width in enumerate(widths):
+        height = max(2, round(width * probe["height"] / probe["display_width"] / 2) * 2)
+        filters.append(f"[t{index}]scale={width}:{height},setsar=1[o{index}]")
+        outputs += [
+            "-map", f"[o{index}]", "-frames:v", "1", *THUMBNAIL_FORMATS[format_name][2],
+            str(variant_path(base_output_dir, width, format_name)),
+        ]
+    return [
+        "ffmpeg", "-y",
+        "-i", str(poster_path(base_output_dir)),
+        "-filter_complex", ";".join(filters),
+        *outputs,
+    ]
+
+
+def write_thumbnail_variants(base_output_dir, probe):
+    """
+    Derive the responsive thumbnails from the poster: every configured width
+    (up to the source's) in every configured format.
+
+    A format the local ffmpeg cannot encode (AVIF needs libaom) is skipped
+    with a warning; ``select_thumbnail`` then falls back to the next one,
+    and ultimately to the poster itself.
+
+    Returns
+    -------
+    List[str]
+        The formats that were written.
+    """
+    thumbnails_dir = Path(base_output_dir) / THUMBNAILS_DIRNAME
+    shutil.rmtree(thumbnails_dir, ignore_errors=True)
+    thumbnails_dir.mkdir(parents=True)
+
+    widths = thumbnail_widths(probe)
+    written = []
+    for format_name in thumbnail_formats():
+        try:
+            run_ffmpeg(build_thumbnail_command(base_output_dir, probe, widths, format_name))
+        except RuntimeError:
+            logger.warning("Could not write %s thumbnails in %s", format_name, base_output_dir, exc_info=True)
+            for width in widths:
+                variant_path(base_output_dir, width, format_name).unlink(missing_ok=True)
+            continue
+        written.append(format_name)
+    return written
+
+
+def accepted_formats(accept):
+    """
+    Return the thumbnail formats an ``Accept`` header allows, in preference
+    order. JPEG is always acceptable.
+    """
+    accept = (accept or "").lower()
+    return [
+        name for name in thumbnail_formats()
+        if name == "jpeg" or THUMBNAIL_FORMATS[name][0] in accept
+    ]
+
+
+def requested_width(request):
+    """
+    Return the display width asked for with ``?w=``, or None.
+
+    Only ASCII digits are accepted: ``str.isdigit`` alone lets through
+    characters such as ``²`` that ``int`` rejects. Widths of more than five
+    digits are ignored, as the widest derivative is sent for them anyway.
+    """
+    width = request.GET.get("w", "")
+    if not (width.isascii() and width.isdigit()) or len(width) > 5:
+        return None
+    return int(width) or None
+
+
+def select_thumbnail(base_output_dir, accept, width=None):
+    """
+    Pick the thumbnail file to send for an ``Accept`` header and a requested
+    display ``width``.
+
+    The best accepted format that has derivatives wins; within it, the
+    narrowest derivative at least ``width`` wide (the widest one if none
+    is). Without a ``width`` the widest derivative is picked. Videos
+    without derivatives get their poster.
+
+    Returns
+    -------
+    tuple
+        ``(path, content type)``.
+    """
+    widths = thumbnail_widths()
+    if width is not None:
+        widths = [w for w in widths if w >= width] + [w for w in reversed(widths) if w < width]
+    else:
+        widths = widths[::-1]
+
+    for format_name in accepted_formats(accept):
+        for candidate in widths:
+            path = variant_path(base_output_dir, candidate, format_name)
+            if path.exists():
+                return path, THUMBNAIL_FORMATS[format_name][0]
+    return poster_path(base_output_dir), "image/jpeg"
+
+
+def thumbnail_srcset(url):
+    """
+    Return a ``srcset`` attribute value listing the thumbnail endpoint
+    ``url`` at every configured width.
+    """
+    return ", ".join(f"{url}?w={width} {width}w" for width in thumbnail_widths())
@@ -0,0 +1,316 @@
+import hashlib
+import json
+import os
+import shutil
+from contextlib import contextmanager
+from pathlib import Path
+from django_rq import get_connection
+from .hls import playlist_files, poster_path
+from .segment_index import write_segment_index
+from .thumbnails import THUMBNAILS_DIRNAME
+
+
+STATE_FILENAME = "transcode.json"
+STAGING_DIRNAME = ".staging"
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def file_sha256(path, digest=None):
+    """
+    Hash a file in fixed-size chunks and return the digest object.
+    """
+    digest = digest or hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest
+
+
+def settings_digest(encoder_settings):
+    """
+    Return a stable hash of an encoder settings mapping.
+    """
+    encoded = json.dumps(encoder_settings, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def load_state(base_output_dir):
+    """
+    Read ``transcode.json`` of a video's output tree; empty state if missing
+    or unreadable.
+    """
+    try:
+        with open(Path(base_output_dir) / STATE_FILENAME, encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    state.setdefault("source", {})
+    state.setdefault("renditions", {})
+    return state
+
+
+def save_state(base_output_dir, state):
+    """
+    Atomically replace ``transcode.json`` so a crash never leaves it torn.
+    """
+    state_path = Path(base_output_dir) / STATE_FILENAME
+    tmp_path = state_path.with_name(f".{STATE_FILENAME}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, state_path)
+
+
+@contextmanager
+def state_lock(video_id, timeout=120):
+    """
+    Serialise read-modify-write cycles of one video's state across workers
+    and hosts with a Redis lock.
+    """
+    lock = get_connection("transcode").lock(
+        f"videoflix:transcode-lock:{video_id}", timeout=timeout, blocking_timeout=timeout
+    )
+    if not lock.acquire():
+        raise RuntimeError(f"Could not lock transcode state of video {video_id}")
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+def source_fingerprint(source, video_id, base_output_dir):
+    """
+    Return the source's content hash and record it in the state.
+
+    The hash is reused without reading the file again when size and mtime
+    match the recorded fingerprint. When the content changed, all recorded
+    renditions and previews are dropped from the state since they were
+    encoded from a different file.
+
+    Returns
+    -------
+    str
+        Hex SHA-256 of the source file.
+    """
+    stat = os.stat(source)
+    with state_lock(video_id):
+        state = load_state(base_output_dir)
+        recorded = state["source"]
+        if recorded.get("size") == stat.st_size and recorded.get("mtime_ns") == stat.st_mtime_ns:
+            return recorded["sha256"]
+
+    source_hash = file_sha256(source).hexdigest()
+    with state_lock(video_id):
+        state = load_state(base_output_dir)
+        if state["source"].get("sha256") != source_hash:
+            state["renditions"] = {}
+            state.pop("previews", None)
+        state["source"] = {
+            "sha256": source_hash,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+        }
+        Path(base_output_dir).mkdir(parents=True, exist_ok=True)
+        save_state(base_output_dir, state)
+    return source_hash
+
+
+def files_fingerprint(root, names):
+    """
+    Return ``{name: [size, mtime_ns]}`` of files below ``root``, from their
+    stat data alone.
+
+    Outputs are only ever replaced whole, so a rewritten, truncated or
+    deleted file no longer matches a fingerprint recorded at publish time,
+    without reading any of them.
+
+    Raises
+    ------
+    OSError
+        If a file is missing.
+    """
+    fingerprint = {}
+    for name in names:
+        stat = os.stat(Path(root) / name)
+        fingerprint[name] = [stat.st_size, stat.st_mtime_ns]
+    return fingerprint
+
+
+def rendition_files(output_dir):
+    """
+    Return a rendition's playlist and every file it references, relative to
+    ``output_dir``.
+    """
+    return ["index.m3u8", *playlist_files(Path(output_dir) / "index.m3u8")]
+
+
+def rendition_checksum(output_dir):
+    """
+    Hash a rendition's playlist together with every file it references
+    (MPEG-TS segments, or the fMP4 init segment and media file).
+
+    Raises
+    ------
+    OSError
+        If the playlist or a referenced segment is missing.
+    """
+    output_dir = Path(output_dir)
+    playlist_path = output_dir / "index.m3u8"
+    digest = file_sha256(playlist_path)
+    for uri in playlist_files(playlist_path):
+        digest.update(uri.encode("utf-8"))
+        file_sha256(output_dir / uri, digest)
+    return digest.hexdigest()
+
+
+def previews_files(base_output_dir):
+    """
+    Return the poster image, every trickplay file and the responsive
+    thumbnails derived from the poster, relative to ``base_output_dir``.
+
+    Raises
+    ------
+    OSError
+        If the trickplay track, the trickplay or the thumbnails directory
+        is missing.
+    """
+    base_output_dir = Path(base_output_dir)
+    trickplay_names = sorted(os.listdir(base_output_dir / "trickplay"))
+    thumbnail_names = sorted(os.listdir(base_output_dir / THUMBNAILS_DIRNAME))
+    if "thumbnails.vtt" not in trickplay_names:
+        raise FileNotFoundError(base_output_dir / "trickplay" / "thumbnails.vtt")
+    return [
+        poster_path(base_output_dir).name,
+        *(f"trickplay/{name}" for name in trickplay_names),
+        *(f"{THUMBNAILS_DIRNAME}/{name}" for name in thumbnail_names),
+    ]
+
+
+def previews_checksum(base_output_dir):
+    """
+    Hash the files of ``previews_files``.
+
+    Raises
+    ------
+    OSError
+        If one of them is missing.
+    """
+    base_output_dir = Path(base_output_dir)
+    poster, *others = previews_files(base_output_dir)
+    digest = file_sha256(base_output_dir / poster)
+    for name in others:
+        digest.update(Path(name).name.encode("utf-8"))
+        file_sha256(base_output_dir / name, digest)
+    return digest.hexdigest()
+
+
+def is_current(entry, source_hash, digest, fingerprint_of, checksum_of):
+    """
+    Return True if a recorded entry belongs to this source and settings and
+    its outputs are still the ones published.
+
+    Outputs are compared with the stat fingerprint recorded at publish
+    time, so a check reads no media. Entries recorded before fingerprints
+    existed are checked once against their checksum instead.
+    """
+    if not entry or entry.get("source") != source_hash or entry.get("settings") != digest:
+        return False
+    try:
+        if "files" in entry:
+            return fingerprint_of() == entry["files"]
+        return checksum_of() == entry.get("checksum")
+    except OSError:
+        return False
+
+
+def rendition_is_current(base_output_dir, name, source_hash, digest):
+    """
+    Return True if rendition ``name`` is complete and valid for this source
+    and encoder settings, so it can be skipped.
+    """
+    entry = load_state(base_output_dir)["renditions"].get(name)
+    output_dir = Path(base_output_dir) / name
+    return is_current(
+        entry, source_hash, digest,
+        lambda: files_fingerprint(output_dir, rendition_files(output_dir)),
+        lambda: rendition_checksum(output_dir),
+    )
+
+
+def previews_are_current(base_output_dir, source_hash, digest):
+    """
+    Return True if the poster and trickplay files are complete and valid for
+    this source and preview settings.
+    """
+    entry = load_state(base_output_dir).get("previews")
+    return is_current(
+        entry, source_hash, digest,
+        lambda: files_fingerprint(base_output_dir, previews_files(base_output_dir)),
+        lambda: previews_checksum(base_output_dir),
+    )
+
+
+def staging_dir(base_output_dir, name):
+    """
+    Return an empty staging directory for rendition ``name``.
+
+    Leftovers of an encode interrupted by a crash or a job timeout are
+    discarded here.
+    """
+    path = Path(base_output_dir) / STAGING_DIRNAME / name
+    shutil.rmtree(path, ignore_errors=True)
+    path.mkdir(parents=True)
+    return path
+
+
+def publish_staged_rendition(base_output_dir, name):
+    """
+    Move a finished rendition from staging into place and return its path.
+
+    Its segment index is written into the staged tree first, so it lands
+    together with the playlist. The previous rendition directory, if any, is
+    swapped out before being removed, so readers see either the old or the
+    new tree.
+    """
+    base_output_dir = Path(base_output_dir)
+    staged = base_output_dir / STAGING_DIRNAME / name
+    write_segment_index(staged)
+    target = base_output_dir / name
+    retired = base_output_dir / STAGING_DIRNAME / f"{name}.old"
+    shutil.rmtree(retired, ignore_errors=True)
+    if target.exists():
+        os.replace(target, retired)
+    os.replace(staged, target)
+    shutil.rmtree(retired, ignore_errors=True)
+    return target
+
+
+def record_rendition(video_id, base_output_dir, name, source_hash, digest):
+    """
+    Record the checksum and stat fingerprint of a published rendition in
+    the state. Its files are hashed here once, while still in the page
+    cache; later checks only compare the fingerprint.
+    """
+    output_dir = Path(base_output_dir) / name
+    files = files_fingerprint(output_dir, rendition_files(output_dir))
+    checksum = rendition_checksum(output_dir)
+    with state_lock(video_id):
+        state = load_state(base_output_dir)
+        state["renditions"][name] = {
+            "source": source_hash, "settings": digest, "checksum": checksum, "files": files,
+        }
+        save_state(base_output_dir, state)
+
+
+def record_previews(video_id, base_output_dir, source_hash, digest):
+    """
+    Record the checksum and stat fingerprint of freshly written previews in
+    the state.
+    """
+    files = files_fingerprint(base_output_dir, previews_files(base_output_dir))
+    checksum = previews_checksum(base_output_dir)
+    with state_lock(video_id):
+        state = load_state(base_output_dir)
+        state["previews"] = {"source": source_hash, "settings": digest, "checksum": checksum, "files": files}
+        save_state(base_output_dir, state)
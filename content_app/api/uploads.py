@@ -0,0 +1,241 @@
+import base64
+import hashlib
+import os
+import tempfile
+from datetime import timedelta
+from functools import partial
+from pathlib import Path
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+from content_app.models import UploadSession, Video
+
+
+TUS_VERSION = "1.0.0"
+UPLOAD_DIRNAME = "uploads"
+READ_SIZE = 1024 * 1024
+CHECKSUM_ALGORITHMS = ("sha256", "sha1", "md5")
+
+
+class ChecksumMismatch(ValueError):
+    """
+    Raised when a chunk does not match its ``Upload-Checksum``.
+    """
+
+
+def upload_path(session):
+    """
+    Return the path of the partially received file of an upload session.
+    """
+    return Path(settings.MEDIA_ROOT) / UPLOAD_DIRNAME / f"{session.id}.part"
+
+
+def create_upload_file(session):
+    """
+    Create the (sparse) target file at its final size so chunks can be
+    written at any offset, in any order.
+    """
+    path = upload_path(session)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as f:
+        f.truncate(session.size)
+    return path
+
+
+def parse_upload_metadata(header):
+    """
+    Parse a tus ``Upload-Metadata`` header (``key base64value,...``).
+
+    Raises
+    ------
+    ValueError
+        If a value is not valid base64 or UTF-8.
+    """
+    metadata = {}
+    for pair in filter(None, (item.strip() for item in header.split(","))):
+        key, _, value = pair.partition(" ")
+        metadata[key] = base64.b64decode(value, validate=True).decode("utf-8") if value else ""
+    return metadata
+
+
+def parse_checksum(header):
+    """
+    Parse a tus ``Upload-Checksum`` header (``<algorithm> <base64 digest>``).
+
+    Returns
+    -------
+    tuple
+        ``(hashlib object, expected digest bytes)``.
+
+    Raises
+    ------
+    ValueError
+        If the algorithm is unsupported or the digest is not base64.
+    """
+    algorithm, _, encoded = header.strip().partition(" ")
+    if algorithm not in CHECKSUM_ALGORITHMS:
+        raise ValueError(f"Unsupported checksum algorithm: {algorithm}")
+    return hashlib.new(algorithm), base64.b64decode(encoded, validate=True)
+
+
+def copy_chunk(stream, length, write, digest=None):
+    """
+    Copy up to ``length`` bytes from ``stream`` in ``READ_SIZE`` pieces,
+    calling ``write(data, position)`` for each and feeding ``digest``.
+
+    Returns
+    -------
+    int
+        Number of bytes copied; less than ``length`` if the stream ended.
+    """
+    copied = 0
+    while copied < length:
+        data = stream.read(min(READ_SIZE, length - copied))
+        if not data:
+            break
+        write(data, copied)
+        if digest is not None:
+            digest.update(data)
+        copied += len(data)
+    return copied
+
+
+def write_chunk(session, offset, stream, length, digest=None, expected=None):
+    """
+    Stream ``length`` bytes from ``stream`` into the upload file at ``offset``.
+
+    The body is copied in ``READ_SIZE`` pieces with ``os.pwrite``, so it is
+    never held in memory as a whole and concurrent chunks of the same upload
+    do not share a file position.
+
+    A chunk with a checksum (``digest`` and its ``expected`` value) is first
+    spooled to a temporary file next to the upload and only written once it
+    matches, so a corrupt retry never overwrites bytes already received.
+
+    Returns
+    -------
+    int
+        Number of bytes written; less than ``length`` if the client
+        disconnected early.
+
+    Raises
+    ------
+    ChecksumMismatch
+        If the chunk does not match its checksum; nothing is written.
+    """
+    path = upload_path(session)
+    if digest is None:
+        fd = os.open(path, os.O_WRONLY)
+        try:
+            return copy_chunk(stream, length, lambda data, position: os.pwrite(fd, data, offset + position))
+        finally:
+            os.close(fd)
+
+    with tempfile.TemporaryFile(dir=path.parent) as spool:
+        received = copy_chunk(stream, length, lambda data, _position: spool.write(data), digest)
+        if received != length:
+            return received
+        if digest.digest() != expected:
+            raise ChecksumMismatch("Chunk does not match its checksum")
+        spool.seek(0)
+        return write_chunk(session, offset, spool, length)
+
+
+def merge_range(ranges, start, end):
+    """
+    Add the half-open byte range ``[start, end)`` to a sorted list of
+    ranges, merging overlapping and adjacent ones.
+    """
+    merged = []
+    for range_start, range_end in sorted([*ranges, [start, end]]):
+        if merged and range_start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], range_end)
+        else:
+            merged.append([range_start, range_end])
+    return merged
+
+
+def contiguous_offset(ranges):
+    """
+    Return the length of the received prefix, i.e. tus' ``Upload-Offset``.
+    """
+    return ranges[0][1] if ranges and ranges[0][0] == 0 else 0
+
+
+def record_chunk(session_id, start, end):
+    """
+    Record a verified chunk and assemble the upload once it is complete.
+
+    The session row is locked so concurrent chunks do not lose each other's
+    ranges and exactly one request assembles the file.
+
+    Returns
+    -------
+    UploadSession
+        The updated session.
+    """
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(id=session_id)
+        session.received_ranges = merge_range(session.received_ranges, start, end)
+        session.save(update_fields=["received_ranges", "updated_at"])
+        if session.video_id is None and session.received_ranges == [[0, session.size]]:
+            session.video = assemble_upload(session)
+            session.save(update_fields=["video"])
+    return session
+
+
+def assemble_upload(session):
+    """
+    Create the Video of a completed upload and move its file into
+    ``MEDIA_ROOT/videos/`` once the transaction commits.
+
+    Until then the file stays where chunks are written, so a rolled back
+    transaction leaves the upload intact for the client to retry. The move
+    is registered before the Video is created, so it runs before the
+    transcode that ``video_post_save`` enqueues on commit.
+    """
+    filename = get_valid_filename(session.filename) or "upload"
+    relative_path = f"videos/{session.id.hex}_{filename}"
+    target = Path(settings.MEDIA_ROOT) / relative_path
+    target.parent.mkdir(parents=True, exist_ok=True)
+    transaction.on_commit(partial(os.replace, upload_path(session), target))
+
+    return Video.objects.create(
+        title=session.title,
+        description=session.description,
+        category=session.category,
+        file=relative_path,
+    )
+
+
+def upload_expires_at(session):
+    """
+    Return when an unfinished upload session expires: ``UPLOAD_EXPIRY_HOURS``
+    after its last received chunk (or its creation).
+    """
+    return session.updated_at + timedelta(hours=settings.UPLOAD_EXPIRY_HOURS)
+
+
+def is_expired(session):
+    return session.video_id is None and upload_expires_at(session) <= timezone.now()
+
+
+def expire_upload_sessions():
+    """
+    Delete the unfinished upload sessions past their expiry together with
+    their partially received files.
+
+    Returns
+    -------
+    int
+        Number of sessions removed.
+    """
+    cutoff = timezone.now() - timedelta(hours=settings.UPLOAD_EXPIRY_HOURS)
+    expired = UploadSession.objects.filter(video__isnull=True, updated_at__lte=cutoff)
+    removed = 0
+    for session in expired:
+        upload_path(session).unlink(missing_ok=True)
+        session.delete()
+        removed += 1
+    return removed
@@ -1,9 +1,44 @@
+from django.conf import settings
 from django.urls import path
-from .views import ThumbnailView, VideoListView, VideoManifestView, VideoSegmentView
+from .async_views import (
+    AsyncThumbnailView,
+    AsyncVideoManifestView,
+    AsyncVideoMasterPlaylistView,
+    AsyncVideoSegmentView,
+)
+from .views import (
+    ManifestCacheStatsView,
+    ThumbnailView,
+    TrickplayView,
+    UploadChunkView,
+    UploadCreateView,
+    VideoListView,
+    VideoManifestView,
+    VideoMasterPlaylistView,
+    VideoSearchView,
+    VideoSegmentView,
+    VideoStatusView,
+)
+
+# Under ASGI the media endpoints are served by their async variants.
+if settings.SERVER_INTERFACE == "asgi":
+    ThumbnailView = AsyncThumbnailView
+    VideoManifestView = AsyncVideoManifestView
+    VideoMasterPlaylistView = AsyncVideoMasterPlaylistView
+    VideoSegmentView = AsyncVideoSegmentView
 
 urlpatterns = [
+    path("upload/", UploadCreateView.as_view(), name="upload-create"),
+    path("upload/<uuid:upload_id>/", UploadChunkView.as_view(), name="upload-detail"),
     path("video/", VideoListView.as_view(), name="video-list"),
+    path("video/search/", VideoSearchView.as_view(), name="video-search"),
+    path("video/manifest-cache/", ManifestCacheStatsView.as_view(), name="manifest-cache-stats"),
+    path("video/<int:movie_id>/master.m3u8", VideoMasterPlaylistView.as_view(), name="video-master"),
+    path("video/<int:movie_id>/status/", VideoStatusView.as_view(), name="video-status"),
+    path("video/<int:movie_id>/thumbnail/", ThumbnailView.as_view(), name="video-thumbnail-variant"),
+    path("video/<int:movie_id>/trickplay/<str:filename>", TrickplayView.as_view(), name="video-trickplay"),
     path("video/<int:movie_id>/<str:resolution>/index.m3u8", VideoManifestView.as_view(), name="video-manifest"),
     path("video/<int:movie_id>/<str:resolution>/<str:segment>/", VideoSegmentView.as_view(), name="video-segment"),
     path("video/<int:movie_id>/<str:resolution>/thumbnail.jpg", ThumbnailView.as_view(), name="video-thumbnail"),
+    path("video/<int:movie_id>/<str:resolution>/<str:segment>", VideoSegmentView.as_view(), name="video-segment-file"),
 ]
@@ -1,21 +1,75 @@
-from django.http import FileResponse
+from django.urls import reverse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from content_app.models import Video
+from content_app.models import UploadSession, Video
+from auth_app.api.authentication import CookieJWTAuthentication
 from core import settings
-from .serializers import VideoSerializer
-from rest_framework.permissions import IsAuthenticated
+from .serializers import VIDEO_ROW_FIELDS, serialize_video_rows
+from .catalog_cache import cached_catalog_response
+from .compression import CompressedResponseMixin
+from .filters import VideoFilter, VideoSearchFilter
+from .pagination import KeysetPagination, RankedKeysetPagination
+from .delivery import (
+    REVALIDATE_CACHE_CONTROL,
+    SEGMENT_CONTENT_TYPES,
+    serve_file,
+)
+from .manifest_cache import cluster_stats, load_manifest, manifest_cache
+from .playable_index import is_playable
+from .segment_cache import segment_cache
+from .segment_index import load_rendition_playlist
+from .thumbnails import requested_width, select_thumbnail
+from .signing import playlist_response, verify_segment_token
+from .progress import get_transcode_status
+from .uploads import (
+    TUS_VERSION,
+    ChecksumMismatch,
+    contiguous_offset,
+    create_upload_file,
+    expire_upload_sessions,
+    is_expired,
+    parse_checksum,
+    parse_upload_metadata,
+    record_chunk,
+    upload_expires_at,
+    write_chunk,
+)
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 import os
+import re
 
+# Playlists require a login once signed segment URLs are on; segments are
+# then authorised by their URL token alone. Without signing, media is public
+# and no credentials are read, so a stale login cookie cannot turn it into a 401.
+MEDIA_AUTHENTICATION_CLASSES = [CookieJWTAuthentication] if settings.SIGNED_MEDIA_URLS else []
+MEDIA_PERMISSION_CLASSES = [IsAuthenticated] if settings.SIGNED_MEDIA_URLS else []
 
-class VideoListView(APIView):
+TRICKPLAY_FILE_PATTERN = re.compile(r"^(thumbnails\.vtt|sprite_\d{3,}\.jpg)$")
+
+class VideoListView(CompressedResponseMixin, APIView):
     """
-    View to list all videos.
+    View to list all playable videos, newest first, one page at a time.
+
+    Pages are cut by keyset pagination on ``(created_at, id)`` (see
+    ``KeysetPagination``) and can be narrowed by category and creation
+    date (see ``VideoFilter``); both are backed by partial indexes over the
+    playable videos, so every page is an index range scan.
+
+    Pages are cached in Redis under the catalog version, which every
+    change of a video bumps, so browsing is a single Redis round trip;
+    see ``catalog_cache``. The version also yields the ``ETag`` and
+    ``Last-Modified``, so clients polling an unchanged catalog get a 304.
+    The JSON is sent gzip or brotli compressed per ``Accept-Encoding``;
+    compressed bodies are cached per worker, see ``compression``.
     """
     permission_classes = []
     def get(self, request, *args, **kwargs):
         """
-        Handle GET requests and return all videos.
+        Handle GET requests and return a page of the videos with at least
+        one published rendition; titles still queued, transcoding or failed
+        are left out. Served from the catalog cache when possible.
 
         Parameters
         ----------
@@ -24,71 +78,238 @@ class VideoListView(APIView):
 
         Returns
         -------
+        - 200 with ``{"next": <url or null>, "results": [...]}``.
+        - 304 if the client's copy (``If-None-Match`` /
+          ``If-Modified-Since``) is current.
+        - 400 JSON if a filter parameter is invalid.
+        - 404 JSON if the cursor is invalid.
+        """
+        return cached_catalog_response(request, lambda: self.catalog_page(request))
+
+    def catalog_page(self, request):
         """
-        videos = Video.objects.all()
-        data = VideoSerializer(videos, many=True).data
-        return Response(data) 
+        Query and serialize the requested catalog page.
+
+        Reads plain ``.values()`` rows and serializes them with
+        ``serialize_video_rows``, which yields exactly what
+        ``VideoSerializer`` would, without its per-field overhead.
+        """
+        videos = Video.objects.filter(status__in=Video.PLAYABLE_STATUSES)
+        filterset = VideoFilter(request.query_params, queryset=videos)
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=400)
+
+        paginator = KeysetPagination()
+        rows = paginator.paginate_queryset(filterset.qs.values(*VIDEO_ROW_FIELDS), request, view=self)
+        data = serialize_video_rows(rows)
+        return paginator.get_paginated_response(data)
     
+class VideoSearchView(CompressedResponseMixin, APIView):
+    """
+    Full-text search over the titles and descriptions of the playable
+    videos, best match first, one page at a time.
+
+    Matching uses the stored ``Video.search_vector`` and its partial GIN
+    index; the last word of the query also matches as a prefix, so the
+    endpoint can back a typeahead (see ``VideoSearchFilter``). Pages are
+    cut by keyset pagination on ``(rank, id)`` (see
+    ``RankedKeysetPagination``).
+
+    Like the catalog, responses are cached in Redis under the catalog
+    version, carry validators for conditional requests and are sent
+    compressed.
+    """
+    permission_classes = []
+    def get(self, request, *args, **kwargs):
+        """
+        Handle GET requests and return a page of the playable videos
+        matching ``?q=``.
+
+        Parameters
+        ----------
+        request : Request
+            Incoming HTTP request.
+
+        Returns
+        -------
+        - 200 with ``{"next": <url or null>, "results": [...]}``, items as
+          in ``VideoListView``.
+        - 304 if the client's copy is current.
+        - 400 JSON if ``q`` is missing or a parameter is invalid.
+        - 404 JSON if the cursor is invalid.
+        """
+        return cached_catalog_response(request, lambda: self.search_page(request))
+
+    def search_page(self, request):
+        """
+        Query and serialize the requested page of search results.
+        """
+        videos = Video.objects.filter(status__in=Video.PLAYABLE_STATUSES)
+        filterset = VideoSearchFilter(request.query_params, queryset=videos)
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=400)
+
+        paginator = RankedKeysetPagination()
+        rows = paginator.paginate_queryset(filterset.qs.values(*VIDEO_ROW_FIELDS, "rank"), request, view=self)
+        data = serialize_video_rows(rows)
+        return paginator.get_paginated_response(data)
+
+
 class VideoManifestView(APIView):
     """
     Serve the HLS playlist (``index.m3u8``) for a given video and resolution.
 
-    Looks for the manifest at:
-        ``MEDIA_ROOT/videos/<movie_id>/<resolution>/index.m3u8``
+    The playlist is rendered from the rendition's segment index at:
+        ``MEDIA_ROOT/videos/<movie_id>/<resolution>/segments.idx``
+    or, for renditions published before indexes existed, read from the
+    ``index.m3u8`` next to it.
+
+    Playlists are kept in the worker's manifest cache, so a hit is served
+    without a database query or a filesystem access; the transcode pipeline
+    invalidates them when it rewrites them. On a miss, the rendition is
+    checked against the playable index rather than the database.
+
+    With ``SIGNED_MEDIA_URLS`` the request must carry a valid access token
+    (header or login cookie, checked without a database query) and every
+    segment URI is signed for this video and rendition; see ``signing``.
 
     Returns
     -------
-    - 200 with a streamed file response if the manifest exists.
+    - 200 with the manifest if it exists.
+    - 304 if the client's cached copy is current.
+    - 401 JSON if signed URLs are on and the request is not authenticated.
     - 404 JSON if the video or manifest cannot be found.
     """
 
-    permission_classes = []
+    authentication_classes = MEDIA_AUTHENTICATION_CLASSES
+    permission_classes = MEDIA_PERMISSION_CLASSES
 
     def get(self, request, movie_id, resolution, *args, **kwargs):
-        try:
-            video = Video.objects.get(id=movie_id)
-        except Video.DoesNotExist:
-            return Response({"error": "Video not found"}, status=404)
+        key = (movie_id, resolution)
+        entry = manifest_cache.get(key)
+        if entry is None:
+            generation = manifest_cache.generation
+            if not is_playable(movie_id, resolution):
+                return Response({"error": "Video not found"}, status=404)
 
-        manifest_path = os.path.join(
-            settings.MEDIA_ROOT, "videos", str(video.id), resolution, "index.m3u8"
-        )
+            rendition_dir = os.path.join(settings.MEDIA_ROOT, "videos", str(movie_id), resolution)
+
+            try:
+                entry = load_rendition_playlist(rendition_dir)
+            except OSError:
+                manifest_path = os.path.join(rendition_dir, "index.m3u8")
+                return Response({"error": "Manifest not found", "path": manifest_path}, status=404)
+            manifest_cache.put(key, entry, generation)
+
+        return playlist_response(request, entry, movie_id, resolution)
+
+
+class VideoMasterPlaylistView(APIView):
+    """
+    Serve the master playlist (``master.m3u8``) of a given video.
+
+    While the ladder is still being encoded, it lists the renditions
+    published so far and is rewritten as further ones land. It is cached
+    like the rendition playlists, under the ``"master"`` resolution, and
+    requires the same authentication.
+
+    Returns
+    -------
+    - 200 with the master playlist if the video is playable.
+    - 304 if the client's cached copy is current.
+    - 401 JSON if signed URLs are on and the request is not authenticated.
+    - 404 JSON if the video or the playlist cannot be found.
+    """
+
+    authentication_classes = MEDIA_AUTHENTICATION_CLASSES
+    permission_classes = MEDIA_PERMISSION_CLASSES
+
+    def get(self, request, movie_id, *args, **kwargs):
+        key = (movie_id, "master")
+        entry = manifest_cache.get(key)
+        if entry is None:
+            generation = manifest_cache.generation
+            if not is_playable(movie_id):
+                return Response({"error": "Video not found"}, status=404)
+
+            master_path = os.path.join(settings.MEDIA_ROOT, "videos", str(movie_id), "master.m3u8")
 
-        if not os.path.exists(manifest_path):
-            return Response({"error": "Manifest not found", "path": manifest_path}, status=404)
+            try:
+                entry = load_manifest(master_path)
+            except OSError:
+                return Response({"error": "Manifest not found", "path": master_path}, status=404)
+            manifest_cache.put(key, entry, generation)
 
-        return FileResponse(open(manifest_path, "rb"), content_type="application/vnd.apple.mpegurl")
+        return playlist_response(request, entry, movie_id, "master")
+
+
+class ManifestCacheStatsView(APIView):
+    """
+    Report manifest cache hits and misses (admin only).
+
+    ``cluster`` holds the totals flushed by every web worker, ``process``
+    the live counters and entry count of the worker answering.
+    ``segment_cache`` holds the counters and occupancy of the shared hot
+    segment cache (null if disabled).
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response({
+            "cluster": cluster_stats(),
+            "process": manifest_cache.stats(),
+            "segment_cache": segment_cache.stats(),
+        })
 
 
 class VideoSegmentView(APIView):
     """
-    Serve a single HLS segment (``*.ts``) for the given video and resolution.
+    Serve a single HLS segment for the given video and resolution: an
+    MPEG-TS segment (``*.ts``), or the fMP4 init segment / media file of a
+    CMAF rendition, of which players request byte ranges.
 
     Looks for the file at:
         ``MEDIA_ROOT/videos/<movie_id>/<resolution>/<segment>``
 
+    Whether the rendition is published is answered by the playable index
+    (a local TTL cache in front of a Redis set), so no SQL query runs here.
+    With ``SIGNED_MEDIA_URLS`` the ``expires``/``token`` query parameters
+    signed into the playlist are verified first, with an HMAC only.
+    Segments requested often enough are served from the shared-memory
+    ``segment_cache`` instead of the disk.
+
     Returns
     -------
-    - 200 with a streamed file response if the segment exists.
+    - 200 with a streamed file response if the segment exists, cacheable
+      as immutable under the versioned URL the playlist names it with.
+    - 206 with the requested slice(s) for a ``Range`` request.
+    - 304 if the client's cached copy is current.
+    - 403 JSON if signed URLs are on and the token is missing or expired.
     - 404 JSON if the video or the segment cannot be found.
     """
+    authentication_classes = []
     permission_classes = []
 
     def get(self, request, movie_id, resolution, segment, *args, **kwargs):
-        try:
-            video = Video.objects.get(id=movie_id)
-        except Video.DoesNotExist:
+        if settings.SIGNED_MEDIA_URLS and not verify_segment_token(movie_id, resolution, request.GET):
+            return Response({"error": "Invalid or expired segment token"}, status=403)
+
+        if not is_playable(movie_id, resolution):
             return Response({"error": "Video not found"}, status=404)
 
         segment_path = os.path.join(
-            settings.MEDIA_ROOT, "videos", str(video.id), resolution, segment
+            settings.MEDIA_ROOT, "videos", str(movie_id), resolution, segment
         )
 
 
-        if not os.path.exists(segment_path):
+        content_type = SEGMENT_CONTENT_TYPES.get(os.path.splitext(segment)[1])
+        if content_type is None or not os.path.exists(segment_path):
             return Response({"error": "Segment not found", "path": segment_path}, status=404)
 
-        return FileResponse(open(segment_path, "rb"), content_type="video/mp2t")
+        return serve_file(
+            request, segment_path, content_type, hot_cache=True, versioned=True
+        )
     
 
 
@@ -96,21 +317,227 @@ class VideoSegmentView(APIView):
 class ThumbnailView(APIView):
     """
     Serve the thumbnail image for a given video.
+
+    Picks one of the responsive derivatives written by the pipeline: the
+    best format the ``Accept`` header allows (AVIF, WebP, then JPEG) in the
+    narrowest width of at least ``?w=`` pixels; see
+    ``thumbnails.select_thumbnail``. Videos without derivatives get their
+    full-size poster.
+
+    Returns
+    -------
+    - 200 with the image, ``Vary: Accept``.
+    - 304 if the client's cached copy is current.
+    - 404 JSON if the video or its thumbnail cannot be found.
     """
 
     permission_classes = []
 
     def get(self, request, movie_id, *args, **kwargs):
+        if not Video.objects.filter(id=movie_id).exists():
+            return Response({"error": "Video not found"}, status=404)
+
+        base_output_dir = os.path.join(settings.MEDIA_ROOT, "videos", str(movie_id))
+        thumbnail_path, content_type = select_thumbnail(
+            base_output_dir, request.headers.get("Accept"), requested_width(request)
+        )
+
+        if not os.path.exists(thumbnail_path):
+            return Response({"error": "Thumbnail not found", "path": str(thumbnail_path)}, status=404)
+
+        response = serve_file(request, thumbnail_path, content_type)
+        patch_vary_headers(response, ("Accept",))
+        return response
+
+
+class TrickplayView(APIView):
+    """
+    Serve the trickplay WebVTT track (``thumbnails.vtt``) or one of its
+    sprite sheets (``sprite_NNN.jpg``) for a given video.
+
+    Looks for the file at:
+        ``MEDIA_ROOT/videos/<movie_id>/trickplay/<filename>``
+
+    Returns
+    -------
+    - 200 with a streamed file response if the file exists.
+    - 404 JSON if the video or the file cannot be found.
+    """
+
+    permission_classes = []
+
+    def get(self, request, movie_id, filename, *args, **kwargs):
+        if not TRICKPLAY_FILE_PATTERN.match(filename):
+            return Response({"error": "Trickplay file not found"}, status=404)
+
         try:
             video = Video.objects.get(id=movie_id)
         except Video.DoesNotExist:
             return Response({"error": "Video not found"}, status=404)
 
-        thumbnail_path = os.path.join(
-            settings.MEDIA_ROOT, "videos", str(video.id), f"{video.id}_thumbnail.jpg"
+        file_path = os.path.join(
+            settings.MEDIA_ROOT, "videos", str(video.id), "trickplay", filename
         )
 
-        if not os.path.exists(thumbnail_path):
-            return Response({"error": "Thumbnail not found", "path": thumbnail_path}, status=404)
+        if not os.path.exists(file_path):
+            return Response({"error": "Trickplay file not found", "path": file_path}, status=404)
+
+        if filename.endswith(".vtt"):
+            return serve_file(request, file_path, "text/vtt", cache_control=REVALIDATE_CACHE_CONTROL)
+        return serve_file(request, file_path, "image/jpeg", versioned=True)
+
+
+class VideoStatusView(APIView):
+    """
+    Report the transcode status of a video.
+
+    Returns the video's processing status (``queued``/``transcoding``/
+    ``playable``/``complete``/``failed``), the job state
+    (``queued``/``running``/``done``/``failed``), the current stage, live
+    ffmpeg progress per rendition (percent, fps, speed), per-stage durations
+    in seconds and the error of a failed stage. If Redis is unreachable,
+    only the status is reported, with the job state ``unknown``.
+
+    Returns
+    -------
+    - 200 JSON with the status.
+    - 404 JSON if the video does not exist.
+    """
+
+    def get(self, request, movie_id, *args, **kwargs):
+        video_status = Video.objects.filter(id=movie_id).values_list("status", flat=True).first()
+        if video_status is None:
+            return Response({"error": "Video not found"}, status=404)
+
+        status = get_transcode_status(movie_id) or {"state": "unknown"}
+        return Response({"id": movie_id, "status": video_status, **status})
+
+
+def upload_headers(response, session):
+    """
+    Attach the tus offset headers describing an upload session.
+    """
+    response["Tus-Resumable"] = TUS_VERSION
+    response["Upload-Length"] = str(session.size)
+    response["Upload-Offset"] = str(contiguous_offset(session.received_ranges))
+    response["Upload-Ranges"] = ",".join(f"{start}-{end - 1}" for start, end in session.received_ranges)
+    if session.video_id:
+        response["Upload-Video-Id"] = str(session.video_id)
+    else:
+        response["Upload-Expires"] = http_date(upload_expires_at(session).timestamp())
+    return response
+
+
+class UploadCreateView(APIView):
+    """
+    Create a chunked upload session for a source video (tus "creation").
+
+    Expects ``Upload-Length`` and ``Upload-Metadata`` (base64 ``filename``,
+    ``title``, ``description``, ``category``) headers. Expired sessions of
+    abandoned uploads are cleaned up on the way (tus "expiration").
+
+    Returns
+    -------
+    - 201 with the session URL in ``Location``.
+    - 400 JSON if the headers are missing or malformed.
+    - 413 JSON if the upload exceeds ``UPLOAD_MAX_SIZE``.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def post(self, request, *args, **kwargs):
+        try:
+            size = int(request.headers["Upload-Length"])
+            metadata = parse_upload_metadata(request.headers.get("Upload-Metadata", ""))
+        except (KeyError, ValueError):
+            return Response({"error": "Valid Upload-Length and Upload-Metadata headers are required"}, status=400)
+
+        if size <= 0:
+            return Response({"error": "Upload-Length must be positive"}, status=400)
+        if size > settings.UPLOAD_MAX_SIZE:
+            return Response({"error": "Upload too large"}, status=413)
+        if not metadata.get("filename"):
+            return Response({"error": "filename metadata is required"}, status=400)
+
+        expire_upload_sessions()
+        session = UploadSession.objects.create(
+            filename=metadata["filename"],
+            size=size,
+            title=metadata.get("title", ""),
+            description=metadata.get("description", ""),
+            category=metadata.get("category", ""),
+            created_by=request.user,
+        )
+        create_upload_file(session)
+
+        response = upload_headers(Response(status=201), session)
+        response["Location"] = request.build_absolute_uri(reverse("upload-detail", args=[session.id]))
+        return response
+
+
+class UploadChunkView(APIView):
+    """
+    Receive chunks of an upload session (tus "core" and "checksum").
+
+    ``HEAD`` reports the received prefix in ``Upload-Offset`` and every
+    received range in ``Upload-Ranges``. ``PATCH`` writes the request body at
+    ``Upload-Offset``; unlike strict tus, offsets need not be contiguous, so
+    clients may send chunks in parallel. An optional ``Upload-Checksum``
+    (``sha256 <base64>``) is verified before the chunk is written. When the
+    last missing range arrives, the file is assembled and its Video
+    created, which enqueues transcoding.
+
+    Unfinished sessions expire ``UPLOAD_EXPIRY_HOURS`` after their last
+    chunk (``Upload-Expires``) and are then gone (404).
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get_session(self, upload_id):
+        try:
+            session = UploadSession.objects.get(id=upload_id)
+        except UploadSession.DoesNotExist:
+            return None
+        return None if is_expired(session) else session
+
+    def head(self, request, upload_id, *args, **kwargs):
+        session = self.get_session(upload_id)
+        if session is None:
+            return Response(status=404)
+        response = upload_headers(Response(status=200), session)
+        response["Cache-Control"] = "no-store"
+        return response
+
+    def patch(self, request, upload_id, *args, **kwargs):
+        session = self.get_session(upload_id)
+        if session is None:
+            return Response({"error": "Upload not found"}, status=404)
+        if session.video_id:
+            return upload_headers(Response({"error": "Upload already completed"}, status=409), session)
+        if request.content_type != "application/offset+octet-stream":
+            return Response({"error": "Content-Type must be application/offset+octet-stream"}, status=415)
+
+        try:
+            offset = int(request.headers["Upload-Offset"])
+            length = int(request.headers["Content-Length"])
+            digest, expected = (
+                parse_checksum(request.headers["Upload-Checksum"])
+                if "Upload-Checksum" in request.headers else (None, None)
+            )
+        except (KeyError, ValueError):
+            return Response({"error": "Valid Upload-Offset, Content-Length and Upload-Checksum headers are required"}, status=400)
+
+        if offset < 0 or length <= 0 or offset + length > session.size:
+            return Response({"error": "Chunk outside of the upload"}, status=416)
+        if length > settings.UPLOAD_MAX_CHUNK_SIZE:
+            return Response({"error": "Chunk too large"}, status=413)
+
+        try:
+            written = write_chunk(session, offset, request.stream, length, digest, expected)
+        except ChecksumMismatch:
+            return Response({"error": "Checksum mismatch"}, status=460)
+        if written != length:
+            return Response({"error": "Incomplete chunk"}, status=400)
 
-        return FileResponse(open(thumbnail_path, "rb"), content_type="image/jpeg")
\ No newline at end of file
+        session = record_chunk(session.id, offset, offset + length)
+        return upload_headers(Response(status=204), session)
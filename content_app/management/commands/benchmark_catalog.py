@@ -0,0 +1,124 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from content_app.api.fast_json import orjson, render_json
+from content_app.api.serializers import VIDEO_ROW_FIELDS, VideoSerializer, serialize_video_rows
+from content_app.models import Video
+
+
+WORDS = ["night", "river", "été", "city", "ghost", "last", "signal", "über", "north", "garden", "fire", "夜"]
+
+
+def synthetic_rows(count, seed=0):
+    """
+    Return ``count`` catalog rows as dicts of ``VIDEO_ROW_FIELDS``, newest
+    first.
+    """
+    rng = random.Random(seed)
+    categories = [value for value, _label in Video.CATEGORY_CHOICES]
+    newest = timezone.now()
+    rows = []
+    for index in range(count):
+        rows.append({
+            "id": count - index,
+            "created_at": newest - timedelta(seconds=index * 37, microseconds=rng.randrange(1_000_000)),
+            "title": " ".join(rng.choices(WORDS, k=rng.randint(1, 5))).title(),
+            "description": " ".join(rng.choices(WORDS, k=rng.randint(10, 40))),
+            "category": rng.choice(categories),
+            "status": rng.choice(Video.PLAYABLE_STATUSES),
+        })
+    return rows
+
+
+def model_values(rows):
+    """
+    Return ``(field names, value tuples)`` of ``rows`` as a model query
+    selects them: in the model's field order.
+    """
+    names = [field.attname for field in Video._meta.concrete_fields if field.attname in VIDEO_ROW_FIELDS]
+    return names, [tuple(row[name] for name in names) for row in rows]
+
+
+def values_tuples(rows):
+    """
+    Return ``rows`` as the tuples a ``.values(*VIDEO_ROW_FIELDS)`` query
+    selects.
+    """
+    return [tuple(row[name] for name in VIDEO_ROW_FIELDS) for row in rows]
+
+
+def serializer_path(selected):
+    """
+    Today's path: model instances, ``VideoSerializer`` and DRF's renderer.
+    """
+    names, values = selected
+    videos = [Video.from_db("default", names, row) for row in values]
+    data = VideoSerializer(videos, many=True).data
+    return JSONRenderer().render({"next": None, "results": data})
+
+
+def fast_path(values):
+    """
+    The catalog's path: ``.values()`` dicts, ``serialize_video_rows`` and
+    ``render_json``.
+    """
+    data = serialize_video_rows([dict(zip(VIDEO_ROW_FIELDS, row)) for row in values])
+    return render_json({"next": None, "results": data})
+
+
+def measure(path, selected, repeat):
+    """
+    Return the CPU seconds of every one of ``repeat`` runs of ``path``.
+    """
+    timings = []
+    for _ in range(repeat):
+        started = time.process_time()
+        path(selected)
+        timings.append(time.process_time() - started)
+    return timings
+
+
+class Command(BaseCommand):
+    """
+    Measure the CPU time of serializing one catalog response, today's
+    ``VideoSerializer`` path against the ``.values()`` fast path.
+
+    Both paths start from the row tuples the database would return and end
+    with the rendered JSON bytes: the serializer path builds model
+    instances from them as the ORM does, the fast path dicts as
+    ``.values()`` does; the database itself is not involved.
+    The two bodies are compared and the command fails if they differ by a
+    single byte.
+
+    Usage:
+        python manage.py benchmark_catalog --rows 10000 100000 --repeat 5
+    """
+
+    help = "Benchmark catalog serialization: VideoSerializer against the fast path."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000],
+                            help="Rows per response.")
+        parser.add_argument("--repeat", type=int, default=5, help="Runs per path and size.")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"JSON encoder: {'orjson' if orjson else 'DRF JSONRenderer'}")
+        for count in options["rows"]:
+            rows = synthetic_rows(count)
+            selected, values = model_values(rows), values_tuples(rows)
+            if serializer_path(selected) != fast_path(values):
+                raise CommandError(f"Fast path output differs from VideoSerializer at {count} rows.")
+
+            serializer = statistics.median(measure(serializer_path, selected, options["repeat"]))
+            fast = statistics.median(measure(fast_path, values, options["repeat"]))
+            self.stdout.write(
+                f"{count:>8} rows  serializer {serializer * 1000:9.1f} ms  "
+                f"fast path {fast * 1000:8.1f} ms  "
+                f"{serializer / fast:5.1f}x  ({fast / count * 1e6:.2f} µs/row)"
+            )
@@ -0,0 +1,136 @@
+import asyncio
+import resource
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+READ_SIZE = 16 * 1024
+TIMEOUT_SECONDS = 30
+
+
+def raise_open_files_limit():
+    """
+    Raise the soft open-files limit to the hard one; every simulated client
+    holds a socket.
+    """
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+
+async def download(host, port, target, read_rate, stats):
+    """
+    Fetch ``target`` once over a fresh connection, reading the body at most
+    at ``read_rate`` bytes per second, and record the outcome in ``stats``.
+    """
+    started = time.perf_counter()
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), TIMEOUT_SECONDS)
+        writer.write(f"GET {target} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode("ascii"))
+        await writer.drain()
+        first = await asyncio.wait_for(reader.read(READ_SIZE), TIMEOUT_SECONDS)
+        if not first.startswith(b"HTTP/1.") or first.split(b" ", 2)[1][:1] != b"2":
+            raise ConnectionError(first[:40])
+        stats["ttfb"].append(time.perf_counter() - started)
+        received = len(first)
+        while chunk := await asyncio.wait_for(reader.read(READ_SIZE), TIMEOUT_SECONDS):
+            received += len(chunk)
+            if read_rate:
+                await asyncio.sleep(len(chunk) / read_rate)
+        stats["downloads"] += 1
+        stats["bytes"] += received
+    except (OSError, ConnectionError, asyncio.TimeoutError, IndexError):
+        stats["errors"] += 1
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+async def client(host, port, target, read_rate, deadline, stats):
+    """
+    Download ``target`` over and over until ``deadline``.
+    """
+    while time.monotonic() < deadline:
+        await download(host, port, target, read_rate, stats)
+
+
+async def run_level(host, port, target, concurrency, duration, read_rate):
+    """
+    Run ``concurrency`` clients for ``duration`` seconds and return stats.
+    """
+    stats = {"downloads": 0, "errors": 0, "bytes": 0, "ttfb": []}
+    deadline = time.monotonic() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        client(host, port, target, read_rate, deadline, stats) for _ in range(concurrency)
+    ))
+    stats["elapsed"] = time.perf_counter() - started
+    return stats
+
+
+def percentile(values, fraction):
+    """
+    Return the given percentile of ``values`` (0 if empty).
+    """
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100)[int(fraction * 100) - 1]
+
+
+class Command(BaseCommand):
+    """
+    Measure how many concurrent slow clients the running web server
+    sustains when downloading a media file.
+
+    Each simulated client downloads ``--url`` over a fresh connection again
+    and again, reading at most ``--read-rate`` KiB/s like a mobile player.
+    For every concurrency level the completed downloads, failed requests,
+    throughput and time-to-first-byte percentiles are reported.
+
+    Run it against each deployment profile and compare:
+        SERVER_INTERFACE=wsgi  (gunicorn sync workers)
+        SERVER_INTERFACE=asgi  (gunicorn with uvicorn workers, async views)
+
+    Usage:
+        python manage.py benchmark_delivery \\
+            --url http://localhost:8000/api/video/1/480p/segment_000.ts/ \\
+            --concurrency 10 100 500 --duration 20 --read-rate 256
+    """
+
+    help = "Benchmark concurrent media downloads against a running server."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", required=True, help="Media URL to download.")
+        parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 100, 500],
+                            help="Concurrent clients per run.")
+        parser.add_argument("--duration", type=int, default=20, help="Seconds per run.")
+        parser.add_argument("--read-rate", type=int, default=256,
+                            help="Per-client read rate in KiB/s (0 = unthrottled).")
+
+    def handle(self, *args, **options):
+        url = urlsplit(options["url"])
+        if url.scheme != "http" or not url.hostname:
+            raise CommandError("Only plain http:// URLs are supported.")
+        target = url.path + (f"?{url.query}" if url.query else "")
+        read_rate = options["read_rate"] * 1024
+
+        limit = raise_open_files_limit()
+        if max(options["concurrency"]) > limit - 64:
+            raise CommandError(f"Open-files limit {limit} is too low for the requested concurrency.")
+
+        self.stdout.write(f"{'clients':>8} {'downloads':>10} {'errors':>7} {'MiB/s':>8} "
+                          f"{'ttfb p50':>9} {'ttfb p99':>9}")
+        for concurrency in options["concurrency"]:
+            stats = asyncio.run(run_level(
+                url.hostname, url.port or 80, target, concurrency, options["duration"], read_rate
+            ))
+            self.stdout.write(
+                f"{concurrency:>8} {stats['downloads']:>10} {stats['errors']:>7} "
+                f"{stats['bytes'] / stats['elapsed'] / 1024 ** 2:>8.2f} "
+                f"{percentile(stats['ttfb'], 0.5) * 1000:>7.0f}ms "
+                f"{percentile(stats['ttfb'], 0.99) * 1000:>7.0f}ms"
+            )
@@ -0,0 +1,67 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from rest_framework.test import APIRequestFactory
+
+from content_app.api.views import VideoSearchView
+from content_app.models import Video
+from .benchmark_catalog import synthetic_rows
+from .benchmark_delivery import percentile
+
+
+DEFAULT_QUERIES = ["ni", "nig", "night", "river ci", "ghost fire", "über", "signal north garden", "夜"]
+BATCH_SIZE = 5_000
+
+
+class Command(BaseCommand):
+    """
+    Measure the latency of ``GET /api/video/search/`` against a catalog of
+    synthetic videos in PostgreSQL.
+
+    The videos are inserted and analysed inside a transaction that is
+    rolled back at the end, so the database is left as it was. Every query
+    runs the whole search page (filtering, ranking, pagination and
+    serialization) without the Redis cache in front, ``--repeat`` times
+    after one warm-up run; the median and 95th percentile are reported.
+
+    Usage:
+        python manage.py benchmark_search --rows 100000 --repeat 50 \\
+            --query "ni" "night" "river ci"
+    """
+
+    help = "Benchmark full-text search latency over synthetic videos."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100_000, help="Synthetic videos to insert.")
+        parser.add_argument("--repeat", type=int, default=50, help="Runs per query.")
+        parser.add_argument("--query", nargs="+", default=DEFAULT_QUERIES, help="Search texts to time.")
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        with transaction.atomic():
+            for start in range(0, options["rows"], BATCH_SIZE):
+                rows = synthetic_rows(min(BATCH_SIZE, options["rows"] - start), seed=start)
+                Video.objects.bulk_create(
+                    Video(**{name: value for name, value in row.items() if name != "id"}) for row in rows
+                )
+            with connection.cursor() as cursor:
+                cursor.execute(f"ANALYZE {Video._meta.db_table}")
+            self.stdout.write(f"{Video.objects.count()} videos")
+
+            for text in options["query"]:
+                view = VideoSearchView()
+                request = view.initialize_request(factory.get("/api/video/search/", {"q": text}))
+                response = view.search_page(request)
+                timings = []
+                for _ in range(options["repeat"]):
+                    started = time.perf_counter()
+                    view.search_page(request)
+                    timings.append(time.perf_counter() - started)
+                self.stdout.write(
+                    f"{text!r:>24}  {len(response.data['results']):>3} results  "
+                    f"median {statistics.median(timings) * 1000:6.2f} ms  "
+                    f"p95 {percentile(timings, 0.95) * 1000:6.2f} ms"
+                )
+            transaction.set_rollback(True)
@@ -0,0 +1,121 @@
+import resource
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from content_app.api.hls import probe_source, run_ffmpeg, select_renditions
+from content_app.api.tasks import (
+    AUDIO_FILENAME,
+    build_audio_command,
+    build_rendition_command,
+    build_single_pass_command,
+)
+from content_app.api.transcode_state import STAGING_DIRNAME, staging_dir
+
+
+MODES = ("single_pass", "per_rendition")
+
+
+def encode_ladder(source, probe, renditions, output_dir, mode):
+    """
+    Encode the whole ladder, poster and sprites included, into
+    ``output_dir`` the way ``mode`` does: one ffmpeg process decoding the
+    source once, or one process per rendition.
+
+    Only the ffmpeg commands of the pipeline run; nothing is written to the
+    database, Redis or ``MEDIA_ROOT``.
+    """
+    if mode == "single_pass":
+        for name in renditions:
+            staging_dir(output_dir, name)
+        audio_path = None
+        if probe["has_audio"]:
+            audio_path = output_dir / STAGING_DIRNAME / AUDIO_FILENAME
+            run_ffmpeg(build_audio_command(source, audio_path))
+        run_ffmpeg(build_single_pass_command(
+            source, output_dir / STAGING_DIRNAME, renditions, probe,
+            audio_path=audio_path, preview_dir=output_dir,
+        ))
+        return
+    for index, (name, rendition) in enumerate(renditions.items()):
+        run_ffmpeg(build_rendition_command(
+            source, staging_dir(output_dir, name), rendition, probe,
+            preview_dir=output_dir if index == 0 else None,
+        ))
+
+
+def children_cpu_seconds():
+    """
+    Return the user + system CPU time consumed by finished child processes.
+    """
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Command(BaseCommand):
+    """
+    Compare the HLS encode modes on a synthetic clip.
+
+    Generates a test pattern with a sine tone via ffmpeg's lavfi sources,
+    then encodes its full ladder once per mode and reports wall-clock and
+    child CPU seconds.
+
+    Only the pipeline's ffmpeg commands are run, in a temporary directory:
+    no video status, playable index, manifest cache or progress is touched,
+    and neither the database nor Redis is needed. ``single_pass`` is
+    measured as the one-decode ladder, without the lowest-rung-first
+    publish that ``convert_video_to_hls`` does for new titles.
+
+    Usage:
+        python manage.py benchmark_transcode --duration 20 --repeat 3
+    """
+
+    help = "Benchmark single-pass against per-rendition HLS transcoding."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--duration", type=int, default=20, help="Clip length in seconds.")
+        parser.add_argument("--size", default="1920x1080", help="Clip resolution (WxH).")
+        parser.add_argument("--rate", type=int, default=30, help="Clip frame rate.")
+        parser.add_argument("--repeat", type=int, default=1, help="Runs per mode.")
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory(prefix="videoflix-bench-") as tmp:
+            tmp_path = Path(tmp)
+            source = tmp_path / "source.mp4"
+            self.stdout.write(f"Generating {options['duration']}s {options['size']} clip...")
+            run_ffmpeg([
+                "ffmpeg", "-y",
+                "-f", "lavfi", "-i",
+                f"testsrc2=size={options['size']}:rate={options['rate']}:duration={options['duration']}",
+                "-f", "lavfi", "-i", f"sine=frequency=440:duration={options['duration']}",
+                "-c:v", "libx264", "-preset", "ultrafast",
+                "-c:a", "aac", "-shortest",
+                str(source),
+            ])
+
+            probe = probe_source(source)
+            renditions = select_renditions(probe)
+
+            results = {}
+            for mode in MODES:
+                walls, cpus = [], []
+                for run in range(options["repeat"]):
+                    cpu_before = children_cpu_seconds()
+                    wall_before = time.perf_counter()
+                    encode_ladder(source, probe, renditions, tmp_path / f"{mode}-{run}", mode)
+                    walls.append(time.perf_counter() - wall_before)
+                    cpus.append(children_cpu_seconds() - cpu_before)
+                results[mode] = (min(walls), min(cpus))
+
+        self.stdout.write(f"{'mode':<16}{'wall (s)':>12}{'cpu (s)':>12}")
+        for mode, (wall, cpu) in results.items():
+            self.stdout.write(f"{mode:<16}{wall:>12.2f}{cpu:>12.2f}")
+
+        single_wall, single_cpu = results["single_pass"]
+        fallback_wall, fallback_cpu = results["per_rendition"]
+        self.stdout.write(self.style.SUCCESS(
+            f"single_pass: {fallback_wall / single_wall:.2f}x wall, "
+            f"{fallback_cpu / single_cpu:.2f}x cpu vs per_rendition"
+        ))
@@ -0,0 +1,64 @@
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from content_app.api.manifest_cache import invalidate_manifests
+from content_app.api.segment_index import INDEX_FILENAME, parse_segment_index, write_segment_index
+
+
+def has_current_index(rendition_dir):
+    """
+    Return True if the rendition has a segment index of this version.
+    """
+    try:
+        parse_segment_index((rendition_dir / INDEX_FILENAME).read_bytes())
+    except (OSError, ValueError):
+        return False
+    return True
+
+
+class Command(BaseCommand):
+    """
+    Write the segment index of every published rendition that has none, or
+    one of an older format version.
+
+    Such renditions are indexed in memory from their ``index.m3u8`` on
+    every manifest cache miss; once indexed, their playlists are rendered
+    from ``segments.idx`` like new ones. The entrypoint runs it on start;
+    ``--force`` rebuilds existing indexes too.
+
+    Usage:
+        python manage.py build_segment_indexes [--force]
+    """
+
+    help = "Build missing or outdated segment indexes of published renditions."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Rebuild existing indexes too.")
+
+    def handle(self, *args, **options):
+        videos_dir = Path(settings.MEDIA_ROOT) / "videos"
+        try:
+            video_ids = [name for name in os.listdir(videos_dir) if name.isdigit()]
+        except OSError:
+            video_ids = []
+
+        built = 0
+        for video_id in video_ids:
+            rendition_dirs = [
+                path for path in (videos_dir / video_id).iterdir()
+                if not path.name.startswith(".") and (path / "index.m3u8").exists()
+                and (options["force"] or not has_current_index(path))
+            ]
+            for rendition_dir in rendition_dirs:
+                try:
+                    write_segment_index(rendition_dir)
+                except (OSError, ValueError) as exc:
+                    self.stderr.write(f"Skipped {rendition_dir}: {exc}")
+                    continue
+                built += 1
+            if rendition_dirs:
+                invalidate_manifests(int(video_id))
+        self.stdout.write(f"Built {built} segment index(es).")
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from content_app.api.uploads import expire_upload_sessions
+
+
+class Command(BaseCommand):
+    """
+    Remove unfinished upload sessions whose last chunk arrived more than
+    ``UPLOAD_EXPIRY_HOURS`` ago, together with their partial files.
+
+    Starting a new upload does the same; the entrypoint also runs it on
+    start. Schedule it (e.g. hourly from cron) on hosts that rarely see
+    new uploads.
+
+    Usage:
+        python manage.py expire_uploads
+    """
+
+    help = "Delete expired, unfinished upload sessions and their partial files."
+
+    def handle(self, *args, **options):
+        removed = expire_upload_sessions()
+        self.stdout.write(f"Removed {removed} expired upload session(s).")
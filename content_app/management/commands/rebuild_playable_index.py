@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from content_app.api.playable_index import published_renditions, rebuild_index
+from content_app.models import Video
+
+
+class Command(BaseCommand):
+    """
+    Rebuild the Redis playable index from the database and the media tree.
+
+    Every playable video contributes each rendition directory holding an
+    ``index.m3u8``, which also covers videos transcoded before
+    ``transcode.json`` existed. The entrypoint runs it on start; run it by
+    hand after a Redis data loss.
+
+    Usage:
+        python manage.py rebuild_playable_index
+    """
+
+    help = "Rebuild the Redis index of playable videos and renditions."
+
+    def handle(self, *args, **options):
+        entries = {
+            video_id: published_renditions(video_id)
+            for video_id in Video.objects.filter(status__in=Video.PLAYABLE_STATUSES).values_list("id", flat=True)
+        }
+        members = rebuild_index(entries)
+        self.stdout.write(f"Indexed {len(entries)} video(s), {members} member(s).")
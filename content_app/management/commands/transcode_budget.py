@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from content_app.api.scheduler import encode_budget
+
+
+class Command(BaseCommand):
+    """
+    Print this host's ffmpeg budget.
+
+    ``--processes`` prints only the number of concurrent ffmpeg processes,
+    which the entrypoint uses as the default number of transcode workers:
+    more workers would only wait for a slot while their job timeout runs.
+
+    Usage:
+        python manage.py transcode_budget [--processes]
+    """
+
+    help = "Show how many ffmpeg processes and threads this host runs."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", action="store_true", help="Print only the process count.")
+
+    def handle(self, *args, **options):
+        budget = encode_budget()
+        if options["processes"]:
+            self.stdout.write(str(budget["processes"]))
+            return
+        self.stdout.write(
+            f"{budget['processes']} ffmpeg process(es) x {budget['threads']} thread(s) "
+            f"on CPUs {','.join(map(str, budget['cpus']))}"
+        )
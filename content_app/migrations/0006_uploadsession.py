@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:38
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content_app', '0005_remove_video_thumbnail_url'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField()),
+                ('title', models.CharField(default='', max_length=200)),
+                ('description', models.TextField(blank=True, default='')),
+                ('category', models.CharField(blank=True, choices=[('movie', 'Movie'), ('series', 'Series'), ('documentary', 'Documentary'), ('romance', 'Romance'), ('action', 'Action'), ('comedy', 'Comedy'), ('horror', 'Horror'), ('thriller', 'Thriller'), ('sci-fi', 'Sci-Fi'), ('fantasy', 'Fantasy')], max_length=100)),
+                ('received_ranges', models.JSONField(blank=True, default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('video', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='content_app.video')),
+            ],
+        ),
+    ]
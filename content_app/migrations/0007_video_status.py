@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:41
+
+from django.db import migrations, models
+
+
+def mark_existing_complete(apps, schema_editor):
+    # Videos created before the status field were fully transcoded already.
+    apps.get_model('content_app', 'Video').objects.update(status='complete')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content_app', '0006_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('transcoding', 'Transcoding'), ('playable', 'Playable'), ('complete', 'Complete'), ('failed', 'Failed')], db_index=True, default='queued', max_length=20),
+        ),
+        migrations.RunPython(mark_existing_complete, migrations.RunPython.noop),
+    ]
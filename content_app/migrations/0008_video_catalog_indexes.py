@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content_app', '0007_video_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(condition=models.Q(('status__in', ('playable', 'complete'))), fields=['-created_at', '-id'], name='video_playable_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(condition=models.Q(('status__in', ('playable', 'complete'))), fields=['category', '-created_at', '-id'], name='video_playable_category_idx'),
+        ),
+    ]
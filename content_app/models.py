@@ -1,5 +1,15 @@
+import uuid
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
 from django.conf import settings
+from django.urls import reverse
+
+# Statuses of the videos that are listed and can be watched: ``playable``
+# titles have at least their lowest rendition published, ``complete`` ones
+# the whole ladder. Defined at module level so ``Video.Meta`` can build the
+# conditions of its partial indexes from it.
+PLAYABLE_STATUSES = ('playable', 'complete')
 
 class Video(models.Model):
     """
@@ -19,19 +29,97 @@ class Video(models.Model):
         ('fantasy', 'Fantasy'),
     ]
 
+    QUEUED = 'queued'
+    TRANSCODING = 'transcoding'
+    PLAYABLE = 'playable'
+    COMPLETE = 'complete'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (TRANSCODING, 'Transcoding'),
+        (PLAYABLE, 'Playable'),
+        (COMPLETE, 'Complete'),
+        (FAILED, 'Failed'),
+    ]
+    PLAYABLE_STATUSES = PLAYABLE_STATUSES
+    # Text search configuration of ``search_vector``: no stemming, so the
+    # prefixes a typeahead sends match the words as written.
+    SEARCH_CONFIG = 'simple'
+
     title = models.CharField(max_length=200, default="")
     description = models.TextField(blank=True, default="")
     category = models.CharField(max_length=100, blank=True, choices=CATEGORY_CHOICES)
     thumbnail_url = models.ImageField(upload_to='thumbnails/', blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     file = models.FileField(upload_to='videos/', blank=True, null=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED, db_index=True)
+    # Computed by PostgreSQL on every write, so it never lags behind the
+    # text. Title words rank above description words.
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector("title", weight="A", config=SEARCH_CONFIG)
+            + SearchVector("description", weight="B", config=SEARCH_CONFIG)
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
 
+    class Meta:
+        # Back the catalog's keyset pagination, alone or within a category,
+        # and its full-text search. Partial on the playable statuses, as
+        # only those are ever listed.
+        indexes = [
+            models.Index(
+                fields=["-created_at", "-id"],
+                condition=models.Q(status__in=PLAYABLE_STATUSES),
+                name="video_playable_created_idx",
+            ),
+            models.Index(
+                fields=["category", "-created_at", "-id"],
+                condition=models.Q(status__in=PLAYABLE_STATUSES),
+                name="video_playable_category_idx",
+            ),
+            GinIndex(
+                fields=["search_vector"],
+                condition=models.Q(status__in=PLAYABLE_STATUSES),
+                name="video_playable_search_idx",
+            ),
+        ]
 
     @property
     def thumbnail_url(self):
         if not self.file:
             return None
-        return f"{settings.BASE_URL}/media/thumbnails/{self.id}_thumbnail.jpg"
+        endpoint = reverse("video-thumbnail-variant", args=[self.id])
+        return f"{settings.BASE_URL}{endpoint}?w={settings.THUMBNAIL_CARD_WIDTH}"
 
     def __str__(self):
         return f"{self.title}"
+
+
+class UploadSession(models.Model):
+    """
+    Model tracking a chunked, resumable upload of a source video.
+
+    Chunks may arrive in any order and in parallel; ``received_ranges``
+    holds the merged half-open byte ranges written so far. Once they cover
+    the whole file, the Video is created and linked here.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    title = models.CharField(max_length=200, default="")
+    description = models.TextField(blank=True, default="")
+    category = models.CharField(max_length=100, blank=True, choices=Video.CATEGORY_CHOICES)
+    received_ranges = models.JSONField(default=list, blank=True)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Last received chunk; unfinished sessions expire UPLOAD_EXPIRY_HOURS later.
+    updated_at = models.DateTimeField(auto_now=True)
+    video = models.OneToOneField(Video, on_delete=models.SET_NULL, null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.id})"
@@ -1,3 +1,774 @@
-from django.test import TestCase
+import asyncio
+import base64
+import os
+import shutil
+import tempfile
+from contextlib import nullcontext
+from pathlib import Path
+from unittest import mock
+from django.http import QueryDict
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from redis.exceptions import ConnectionError as RedisConnectionError
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+from content_app.api.catalog_cache import entry_body, not_modified_response
+from content_app.api.compression import ENCODINGS
+from content_app.api.delivery import (
+    IMMUTABLE_CACHE_CONTROL,
+    REVALIDATE_CACHE_CONTROL,
+    UnsatisfiableRange,
+    aserve_file,
+    file_version,
+    parse_ranges,
+    serve_file,
+)
+from content_app.api.filters import MAX_SEARCH_TERMS, search_query
+from content_app.api.hls import codecs_string, select_renditions, write_master_playlist, write_trickplay_track
+from content_app.api.pagination import KeysetPagination, RankedKeysetPagination
+from content_app.api.playable_index import (
+    INDEX_KEY,
+    add_playable,
+    is_playable,
+    local_index,
+    rebuild_index,
+    remove_playable,
+    sync_playable,
+    video_key,
+)
+from content_app.api.progress import get_transcode_status
+from content_app.api.segment_cache import CHUNK_SIZES, SegmentCache
+from content_app.api.segment_index import (
+    build_segment_index,
+    load_rendition_playlist,
+    parse_segment_index,
+    write_segment_index,
+)
+from content_app.api.signing import current_expiry, token_query, verify_segment_token
+from content_app.api.tasks import (
+    AUDIO_ENCODER_ARGS,
+    build_audio_command,
+    build_rendition_command,
+    build_single_pass_command,
+    encode_job_timeout,
+)
+from content_app.api.thumbnails import requested_width
+from content_app.api.transcode_state import load_state, record_rendition, rendition_is_current, save_state
+from content_app.api.uploads import contiguous_offset, merge_range, parse_checksum, parse_upload_metadata
+from content_app.models import Video
 
-# Create your tests here.
+
+def option_values(cmd, option):
+    return [cmd[index + 1] for index, arg in enumerate(cmd) if arg == option]
+
+
+def temp_dir(test_case):
+    path = Path(tempfile.mkdtemp())
+    test_case.addCleanup(shutil.rmtree, path)
+    return path
+
+
+SOURCE_PROBE = {
+    "width": 1920, "height": 1080, "display_width": 1920,
+    "frame_rate": "25/1", "duration": 60.0, "has_audio": True,
+}
+RENDITIONS = {
+    "480p": {"height": 480, "width": 854, "frame_rate": "25/1"},
+    "720p": {"height": 720, "width": 1280, "frame_rate": "25/1"},
+}
+
+
+class ParseRangesTests(SimpleTestCase):
+    def test_no_usable_header_sends_whole_file(self):
+        for header in (None, "", "items=0-1", "bytes=", "bytes=-", "bytes=5-2", "bytes=a-b"):
+            self.assertIsNone(parse_ranges(header, 100), header)
+
+    def test_ranges_are_clipped_in_request_order(self):
+        self.assertEqual(parse_ranges("bytes=0-9", 100), [(0, 9)])
+        self.assertEqual(parse_ranges("bytes=90-", 100), [(90, 99)])
+        self.assertEqual(parse_ranges("bytes=-10", 100), [(90, 99)])
+        self.assertEqual(parse_ranges("bytes=-500", 100), [(0, 99)])
+        self.assertEqual(parse_ranges("bytes=50-500, 0-0", 100), [(50, 99), (0, 0)])
+
+    def test_ranges_outside_the_file_are_dropped(self):
+        self.assertEqual(parse_ranges("bytes=200-300, 10-19", 100), [(10, 19)])
+        with self.assertRaises(UnsatisfiableRange):
+            parse_ranges("bytes=100-", 100)
+
+    def test_too_many_ranges_send_whole_file(self):
+        header = "bytes=" + ",".join(f"{n}-{n}" for n in range(17))
+        self.assertIsNone(parse_ranges(header, 100))
+
+
+class VersionedCacheControlTests(SimpleTestCase):
+    def setUp(self):
+        self.path = temp_dir(self) / "segment_000.ts"
+        self.path.write_bytes(b"\x47" * 188)
+
+    def cache_control(self, params):
+        response = serve_file(RequestFactory().get("/", params), self.path, "video/mp2t", versioned=True)
+        return response["Cache-Control"]
+
+    def test_current_version_is_immutable(self):
+        self.assertEqual(self.cache_control({"v": file_version(self.path.stat())}), IMMUTABLE_CACHE_CONTROL)
+
+    def test_missing_or_stale_version_is_revalidated(self):
+        stale = file_version(self.path.stat())
+        self.path.write_bytes(b"\x47" * 376)
+        for params in ({}, {"v": "1-1"}, {"v": stale}):
+            self.assertEqual(self.cache_control(params), REVALIDATE_CACHE_CONTROL, params)
+
+
+class UploadRangeTests(SimpleTestCase):
+    def test_merge_range_merges_overlapping_and_adjacent(self):
+        ranges = merge_range([], 10, 20)
+        ranges = merge_range(ranges, 30, 40)
+        self.assertEqual(ranges, [[10, 20], [30, 40]])
+        self.assertEqual(merge_range(ranges, 20, 30), [[10, 40]])
+        self.assertEqual(merge_range(ranges, 15, 35), [[10, 40]])
+        self.assertEqual(merge_range(ranges, 0, 5), [[0, 5], [10, 20], [30, 40]])
+
+    def test_contiguous_offset_is_received_prefix(self):
+        self.assertEqual(contiguous_offset([]), 0)
+        self.assertEqual(contiguous_offset([[10, 20]]), 0)
+        self.assertEqual(contiguous_offset([[0, 20], [30, 40]]), 20)
+
+    def test_parse_upload_metadata(self):
+        header = f"filename {base64.b64encode('clip é.mp4'.encode()).decode()},is_confidential"
+        self.assertEqual(parse_upload_metadata(header), {"filename": "clip é.mp4", "is_confidential": ""})
+        with self.assertRaises(ValueError):
+            parse_upload_metadata("filename not-base64!")
+
+    def test_parse_checksum(self):
+        digest, expected = parse_checksum("sha1 " + base64.b64encode(b"\x01" * 20).decode())
+        self.assertEqual(digest.name, "sha1")
+        self.assertEqual(expected, b"\x01" * 20)
+        with self.assertRaises(ValueError):
+            parse_checksum("crc32 AAAA")
+
+
+
+@override_settings(HLS_SEGMENT_FORMAT="ts")
+class TranscodeCommandTests(SimpleTestCase):
+    def single_pass(self, probe=SOURCE_PROBE, **kwargs):
+        return build_single_pass_command(
+            Path("/in/source.mp4"), Path("/out/.staging"), RENDITIONS, probe, **kwargs
+        )
+
+    def test_single_pass_decodes_source_once(self):
+        cmd = self.single_pass(audio_path=Path("/out/.staging/audio.m4a"))
+        self.assertEqual(option_values(cmd, "-i"), ["/in/source.mp4", "/out/.staging/audio.m4a"])
+        graph = cmd[cmd.index("-filter_complex") + 1]
+        self.assertTrue(graph.startswith("[0:v]split=2[v0][v1];"))
+        self.assertIn("[v0]scale=854:480,setsar=1[v0out]", graph)
+        self.assertIn("[v1]scale=1280:720,setsar=1[v1out]", graph)
+        self.assertEqual(option_values(cmd, "-var_stream_map"), ["v:0,a:0,name:480p v:1,a:1,name:720p"])
+        self.assertEqual(cmd[-1], "/out/.staging/%v/index.m3u8")
+
+    def test_single_pass_copies_audio_encoded_once(self):
+        cmd = self.single_pass(audio_path=Path("/out/.staging/audio.m4a"))
+        self.assertEqual(option_values(cmd, "-map"), ["[v0out]", "1:a:0", "[v1out]", "1:a:0"])
+        self.assertEqual(option_values(cmd, "-c:a"), ["copy"])
+
+        audio = build_audio_command(Path("/in/source.mp4"), Path("/out/.staging/audio.m4a"))
+        self.assertEqual(option_values(audio, "-map"), ["0:a:0"])
+        self.assertIn("-vn", audio)
+        self.assertEqual(audio[-1 - len(AUDIO_ENCODER_ARGS):-1], AUDIO_ENCODER_ARGS)
+
+    def test_single_pass_needs_encoded_audio(self):
+        with self.assertRaises(ValueError):
+            self.single_pass()
+
+    def test_single_pass_without_audio(self):
+        cmd = self.single_pass(probe={**SOURCE_PROBE, "has_audio": False})
+        self.assertEqual(cmd.count("-i"), 1)
+        self.assertNotIn("-c:a", cmd)
+        self.assertEqual(cmd[cmd.index("-var_stream_map") + 1], "v:0,name:480p v:1,name:720p")
+
+    def test_single_pass_with_previews_adds_their_branches(self):
+        preview_dir = temp_dir(self)
+        cmd = self.single_pass(audio_path=Path("/out/.staging/audio.m4a"), preview_dir=preview_dir)
+        graph = cmd[cmd.index("-filter_complex") + 1]
+        self.assertTrue(graph.startswith("[0:v]split=4[v0][v1][p][s];"))
+        self.assertIn(str(preview_dir / "trickplay" / "sprite_%03d.jpg"), cmd)
+
+    def test_rendition_command(self):
+        cmd = build_rendition_command(
+            Path("/in/source.mp4"), Path("/out/720p"), RENDITIONS["720p"], SOURCE_PROBE
+        )
+        self.assertEqual(cmd.count("-i"), 1)
+        self.assertEqual(cmd[cmd.index("-vf") + 1], "scale=1280:720,setsar=1")
+        self.assertEqual(option_values(cmd, "-map"), ["0:v:0", "0:a:0"])
+        self.assertEqual(cmd[cmd.index("-r") + 1], "25/1")
+        self.assertEqual(cmd[cmd.index("-hls_segment_filename") + 1], "/out/720p/segment_%03d.ts")
+        self.assertEqual(cmd[-1], "/out/720p/index.m3u8")
+
+    def test_rendition_command_with_previews_shares_the_decode(self):
+        preview_dir = temp_dir(self)
+        cmd = build_rendition_command(
+            Path("/in/source.mp4"), Path("/out/480p"), RENDITIONS["480p"], SOURCE_PROBE, preview_dir=preview_dir
+        )
+        self.assertEqual(cmd.count("-i"), 1)
+        self.assertTrue(cmd[cmd.index("-filter_complex") + 1].startswith("[0:v]split=3[v][p][s];"))
+        self.assertIn("[poster]", cmd)
+        self.assertIn("[sprites]", cmd)
+
+
+class RenditionLadderTests(SimpleTestCase):
+    def test_ladder_fits_the_source(self):
+        self.assertEqual(select_renditions(SOURCE_PROBE), {
+            "480p": {"height": 480, "width": 854, "frame_rate": "25/1"},
+            "720p": {"height": 720, "width": 1280, "frame_rate": "25/1"},
+            "1080p": {"height": 1080, "width": 1920, "frame_rate": "25/1"},
+        })
+
+    def test_nothing_is_upscaled(self):
+        probe = {**SOURCE_PROBE, "height": 720, "display_width": 960, "frame_rate": "30000/1001"}
+        self.assertEqual(select_renditions(probe), {
+            "480p": {"height": 480, "width": 640, "frame_rate": "30000/1001"},
+            "720p": {"height": 720, "width": 960, "frame_rate": "30000/1001"},
+        })
+
+    def test_widths_follow_the_display_aspect_ratio(self):
+        # 1440x1080 anamorphic, displayed as 16:9
+        probe = {**SOURCE_PROBE, "width": 1440}
+        self.assertEqual(select_renditions(probe)["720p"]["width"], 1280)
+
+    def test_short_source_gets_its_own_height(self):
+        probe = {**SOURCE_PROBE, "width": 642, "height": 361, "display_width": 642}
+        self.assertEqual(select_renditions(probe), {"360p": {"height": 360, "width": 640, "frame_rate": "25/1"}})
+
+
+class MasterPlaylistTests(SimpleTestCase):
+    streams = [
+        {"codec_type": "video", "codec_name": "h264", "profile": "High", "level": 31,
+         "width": 1280, "height": 720, "avg_frame_rate": "25/1"},
+        {"codec_type": "audio", "codec_name": "aac", "profile": "LC"},
+    ]
+
+    def test_codecs_string(self):
+        self.assertEqual(codecs_string(self.streams), "avc1.64001F,mp4a.40.2")
+        self.assertEqual(codecs_string([{"codec_name": "h264", "profile": "Main", "level": 40}]), "avc1.4D4028")
+        self.assertEqual(codecs_string([{"codec_name": "h264"}, {"codec_name": "aac"}]), "avc1.640028,mp4a.40.2")
+        self.assertEqual(codecs_string([{"codec_name": "opus"}]), "")
+
+    def write_rendition(self, base_output_dir, name, segment_sizes):
+        output_dir = base_output_dir / name
+        output_dir.mkdir()
+        lines = ["#EXTM3U", "#EXT-X-TARGETDURATION:4"]
+        for index, size in enumerate(segment_sizes):
+            (output_dir / f"segment_{index:03d}.ts").write_bytes(b"\0" * size)
+            lines += ["#EXTINF:4.000000,", f"segment_{index:03d}.ts"]
+        (output_dir / "index.m3u8").write_text("\n".join(lines + ["#EXT-X-ENDLIST", ""]))
+
+    def test_variants_are_measured_and_sorted_by_bandwidth(self):
+        base_output_dir = temp_dir(self)
+        self.write_rendition(base_output_dir, "720p", [500_000, 300_000])
+        self.write_rendition(base_output_dir, "480p", [200_000, 100_000])
+        with mock.patch("content_app.api.hls.ffprobe_streams", return_value={"streams": self.streams}):
+            master_path = write_master_playlist(base_output_dir, ["720p", "480p"])
+
+        self.assertEqual(master_path.read_text().splitlines(), [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            "#EXT-X-INDEPENDENT-SEGMENTS",
+            '#EXT-X-STREAM-INF:BANDWIDTH=400000,AVERAGE-BANDWIDTH=300000,CODECS="avc1.64001F,mp4a.40.2",'
+            "RESOLUTION=1280x720,FRAME-RATE=25.000",
+            "480p/index.m3u8",
+            '#EXT-X-STREAM-INF:BANDWIDTH=1000000,AVERAGE-BANDWIDTH=800000,CODECS="avc1.64001F,mp4a.40.2",'
+            "RESOLUTION=1280x720,FRAME-RATE=25.000",
+            "720p/index.m3u8",
+        ])
+
+
+@override_settings(TRICKPLAY_INTERVAL=10, TRICKPLAY_TILE_WIDTH=160, TRICKPLAY_COLUMNS=5, TRICKPLAY_ROWS=2)
+class TrickplayTrackTests(SimpleTestCase):
+    def write_track(self, probe):
+        base_output_dir = temp_dir(self)
+        (base_output_dir / "trickplay").mkdir()
+        return write_trickplay_track(base_output_dir, probe).read_text().strip().split("\n\n")
+
+    def test_cues_point_at_their_tiles(self):
+        blocks = self.write_track({**SOURCE_PROBE, "duration": 125.0})
+        self.assertEqual(blocks[0], "WEBVTT")
+        cues = blocks[1:]
+        self.assertEqual(len(cues), 13)
+        self.assertEqual(cues[0], "00:00:00.000 --> 00:00:10.000\nsprite_001.jpg#xywh=0,0,160,90")
+        self.assertEqual(cues[6], "00:01:00.000 --> 00:01:10.000\nsprite_001.jpg#xywh=160,90,160,90")
+        self.assertEqual(cues[10], "00:01:40.000 --> 00:01:50.000\nsprite_002.jpg#xywh=0,0,160,90")
+        self.assertEqual(cues[12], "00:02:00.000 --> 00:02:05.000\nsprite_002.jpg#xywh=320,0,160,90")
+
+    def test_tiles_follow_the_display_aspect_ratio(self):
+        blocks = self.write_track({**SOURCE_PROBE, "height": 1080, "display_width": 1440, "duration": 5.0})
+        self.assertEqual(blocks[1:], ["00:00:00.000 --> 00:00:05.000\nsprite_001.jpg#xywh=0,0,160,120"])
+
+
+@override_settings(TRANSCODE_MIN_TIMEOUT=900, TRANSCODE_TIMEOUT_FACTOR=3)
+class EncodeJobTimeoutTests(SimpleTestCase):
+    def test_timeout_scales_with_duration_and_output(self):
+        rendition = {"height": 1080, "width": 1920, "frame_rate": "30/1"}
+        self.assertEqual(encode_job_timeout({"duration": 100.0}, [rendition]), 900 + 600)
+        self.assertEqual(encode_job_timeout({"duration": 1000.0}, [rendition]), 900 + 6000)
+        self.assertEqual(encode_job_timeout({"duration": 100.0}, [rendition, rendition]), 900 + 900)
+
+    def test_previews_and_empty_sources_get_the_base_allowance(self):
+        self.assertEqual(encode_job_timeout({"duration": 100.0}, []), 900 + 300)
+        self.assertEqual(encode_job_timeout({"duration": 0.0}, list(RENDITIONS.values())), 900)
+
+    def test_fractional_frame_rates(self):
+        rendition = {"height": 1080, "width": 1920, "frame_rate": "30000/1001"}
+        self.assertEqual(encode_job_timeout({"duration": 1001.0}, [rendition]), 900 + 3003 + 3000)
+
+
+@mock.patch("content_app.api.transcode_state.state_lock", lambda video_id: nullcontext())
+class RenditionStateTests(SimpleTestCase):
+    def publish(self):
+        base_output_dir = temp_dir(self)
+        output_dir = base_output_dir / "480p"
+        output_dir.mkdir()
+        (output_dir / "segment_000.ts").write_bytes(b"\1" * 1000)
+        (output_dir / "index.m3u8").write_text("#EXTM3U\n#EXTINF:4.0,\nsegment_000.ts\n#EXT-X-ENDLIST\n")
+        record_rendition(1, base_output_dir, "480p", "source", "settings")
+        return base_output_dir
+
+    def test_published_rendition_is_current_without_reading_it(self):
+        base_output_dir = self.publish()
+        with mock.patch("content_app.api.transcode_state.file_sha256") as file_sha256:
+            self.assertTrue(rendition_is_current(base_output_dir, "480p", "source", "settings"))
+        file_sha256.assert_not_called()
+        self.assertFalse(rendition_is_current(base_output_dir, "480p", "other source", "settings"))
+        self.assertFalse(rendition_is_current(base_output_dir, "480p", "source", "other settings"))
+
+    def test_changed_or_missing_segment_is_not_current(self):
+        base_output_dir = self.publish()
+        (base_output_dir / "480p" / "segment_000.ts").write_bytes(b"\1" * 10)
+        self.assertFalse(rendition_is_current(base_output_dir, "480p", "source", "settings"))
+        (base_output_dir / "480p" / "segment_000.ts").unlink()
+        self.assertFalse(rendition_is_current(base_output_dir, "480p", "source", "settings"))
+
+    def test_entries_without_fingerprint_are_checked_by_checksum(self):
+        base_output_dir = self.publish()
+        state = load_state(base_output_dir)
+        del state["renditions"]["480p"]["files"]
+        save_state(base_output_dir, state)
+        self.assertTrue(rendition_is_current(base_output_dir, "480p", "source", "settings"))
+        (base_output_dir / "480p" / "segment_000.ts").write_bytes(b"\2" * 1000)
+        self.assertFalse(rendition_is_current(base_output_dir, "480p", "source", "settings"))
+
+
+class TranscodeStatusTests(SimpleTestCase):
+    def status(self, connection):
+        with mock.patch("content_app.api.progress.get_connection", return_value=connection):
+            return get_transcode_status(1)
+
+    def test_status_hash_is_nested(self):
+        connection = mock.Mock()
+        connection.hgetall.return_value = {
+            b"state": b'"running"',
+            b"progress:720p": b'{"percent": 50.0}',
+            b"stage:probe": b"0.25",
+        }
+        self.assertEqual(self.status(connection), {
+            "state": "running", "progress": {"720p": {"percent": 50.0}}, "stages": {"probe": 0.25},
+        })
+
+    def test_nothing_recorded(self):
+        connection = mock.Mock()
+        connection.hgetall.return_value = {}
+        self.assertEqual(self.status(connection), {})
+
+    def test_redis_outage_reports_no_status(self):
+        connection = mock.Mock()
+        connection.hgetall.side_effect = RedisConnectionError("down")
+        with self.assertLogs("content_app.api.progress", "WARNING"):
+            self.assertEqual(self.status(connection), {})
+
+
+@override_settings(SECRET_KEY="test", SEGMENT_URL_TTL=3600, SEGMENT_URL_BUCKET=300)
+class SegmentTokenTests(SimpleTestCase):
+    def params(self, video_id, rendition, expires):
+        return QueryDict(token_query(video_id, rendition, expires))
+
+    def test_expiry_is_bucketed(self):
+        self.assertEqual(current_expiry(now=1000), 1200 + 3600)
+        self.assertEqual(current_expiry(now=1199), current_expiry(now=1000))
+
+    def test_token_is_valid_until_expiry(self):
+        expires = current_expiry(now=1000)
+        params = self.params(1, "720p", expires)
+        self.assertTrue(verify_segment_token(1, "720p", params, now=1000))
+        self.assertTrue(verify_segment_token(1, "720p", params, now=expires))
+        self.assertFalse(verify_segment_token(1, "720p", params, now=expires + 1))
+
+    def test_token_is_bound_to_its_rendition_and_expiry(self):
+        expires = current_expiry(now=1000)
+        params = self.params(1, "720p", expires)
+        self.assertFalse(verify_segment_token(2, "720p", params, now=1000))
+        self.assertFalse(verify_segment_token(1, "1080p", params, now=1000))
+        forged = params.copy()
+        forged["expires"] = str(expires + 300)
+        self.assertFalse(verify_segment_token(1, "720p", forged, now=1000))
+        self.assertFalse(verify_segment_token(1, "720p", QueryDict("expires=x"), now=1000))
+
+
+def encode_member(value):
+    return value if isinstance(value, bytes) else str(value).encode()
+
+
+class FakeSetConnection:
+    """
+    In-memory stand-in for the Redis set commands of the playable index.
+    """
+
+    def __init__(self):
+        self.sets = {}
+
+    def pipeline(self):
+        return self
+
+    def execute(self):
+        return []
+
+    def sadd(self, key, *values):
+        self.sets.setdefault(key, set()).update(encode_member(value) for value in values)
+
+    def srem(self, key, *values):
+        self.sets.get(key, set()).difference_update(encode_member(value) for value in values)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.sets.pop(key, None)
+
+    def smembers(self, key):
+        return set(self.sets.get(key, ()))
+
+    def sismember(self, key, value):
+        return encode_member(value) in self.sets.get(key, ())
+
+
+class PlayableIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.connection = FakeSetConnection()
+        patcher = mock.patch("content_app.api.playable_index.get_connection", return_value=self.connection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        local_index.clear()
+        self.addCleanup(local_index.clear)
+
+    def test_published_renditions_are_playable(self):
+        add_playable(1, ["480p"])
+        self.assertTrue(is_playable(1))
+        self.assertTrue(is_playable(1, "480p"))
+        self.assertFalse(is_playable(1, "720p"))
+        self.assertFalse(is_playable(2))
+
+    def test_remove_only_touches_the_video(self):
+        add_playable(1, ["480p", "720p"])
+        add_playable(2, ["480p"])
+        remove_playable(1)
+        self.assertEqual(self.connection.smembers(INDEX_KEY), {b"2"})
+        self.assertNotIn(video_key(1), self.connection.sets)
+        self.assertFalse(is_playable(1, "480p"))
+        self.assertTrue(is_playable(2, "480p"))
+
+    @mock.patch("content_app.api.playable_index.invalidate_manifests")
+    def test_leaving_playable_statuses_unindexes(self, invalidate_manifests):
+        add_playable(1, ["480p"])
+        sync_playable(1, Video.FAILED)
+        self.assertFalse(is_playable(1))
+        invalidate_manifests.assert_called_once_with(1)
+
+    def test_entering_playable_statuses_indexes_published_renditions(self):
+        media_root = temp_dir(self)
+        (media_root / "videos" / "1" / "480p").mkdir(parents=True)
+        (media_root / "videos" / "1" / "480p" / "index.m3u8").write_text("#EXTM3U\n")
+        (media_root / "videos" / "1" / ".staging").mkdir()
+        with override_settings(MEDIA_ROOT=media_root):
+            sync_playable(1, Video.COMPLETE)
+        self.assertEqual(self.connection.smembers(video_key(1)), {b"master", b"480p"})
+
+    def test_rebuild_drops_stale_videos(self):
+        add_playable(1, ["480p"])
+        add_playable(2, ["480p"])
+        self.assertEqual(rebuild_index({2: ["480p", "720p"], 3: []}), 3)
+        self.assertEqual(self.connection.smembers(INDEX_KEY), {b"2"})
+        self.assertNotIn(video_key(1), self.connection.sets)
+        self.assertEqual(self.connection.smembers(video_key(2)), {b"master", b"480p", b"720p"})
+
+    def test_rebuild_drops_members_of_the_single_set_index(self):
+        self.connection.sadd(INDEX_KEY, "1:master", "1:480p")
+        rebuild_index({1: ["480p"]})
+        self.assertEqual(self.connection.smembers(INDEX_KEY), {b"1"})
+
+
+class SegmentCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.root = temp_dir(self)
+        overrides = override_settings(
+            SEGMENT_CACHE_MB=8, SEGMENT_CACHE_PATH=str(self.root / "arena"),
+            SEGMENT_CACHE_ADMIT_HITS=2, SEGMENT_CACHE_LEASE=60,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.cache = SegmentCache()
+
+    def write(self, name, size):
+        path = self.root / name
+        path.write_bytes(os.urandom(size))
+        return path
+
+    def read(self, path, start=0, length=None):
+        stat = path.stat()
+        body = self.cache.open_slice(path, stat, start, stat.st_size - start if length is None else length)
+        if body is None:
+            return None
+        with body:
+            return body.read()
+
+    def test_segment_is_admitted_once_hot(self):
+        path = self.write("segment_000.ts", 100 * 1024)
+        self.assertIsNone(self.read(path))
+        self.assertEqual(self.read(path), path.read_bytes())
+        self.assertEqual(self.read(path), path.read_bytes())
+        stats = self.cache.stats()
+        self.assertEqual((stats["misses"], stats["admitted"], stats["hits"]), (2, 1, 1))
+        self.assertEqual((stats["entries"], stats["bytes"]), (1, 100 * 1024))
+
+    def test_ranges_are_cut_from_the_cached_file(self):
+        path = self.write("segment_000.ts", 100 * 1024)
+        data = path.read_bytes()
+        self.read(path)
+        self.read(path)
+        self.assertEqual(self.read(path, 1000, 500), data[1000:1500])
+        self.assertEqual(self.read(path, len(data) - 1, 1), data[-1:])
+        self.assertEqual(self.cache.stats()["entries"], 1)
+
+    def test_ranges_of_files_larger_than_a_chunk_are_cached_per_range(self):
+        path = self.write("media.m4s", CHUNK_SIZES[-1] + 1024)
+        data = path.read_bytes()
+        start, length = 3 * 1024 * 1024, 700 * 1024
+        self.assertIsNone(self.read(path, start, length))
+        self.assertTrue(self.read(path, start, length) == data[start:start + length])
+        self.assertTrue(self.read(path, start, length) == data[start:start + length])
+        self.assertIsNone(self.read(path, start + 1, length))
+        self.assertEqual(self.cache.stats()["bytes"], length)
+        self.read(path)
+        self.assertIsNone(self.read(path))
+
+    def test_rewritten_file_is_not_served_from_the_old_copy(self):
+        path = self.write("segment_000.ts", 100 * 1024)
+        self.read(path)
+        self.read(path)
+        path.write_bytes(os.urandom(90 * 1024))
+        self.assertIsNone(self.read(path))
+        self.assertEqual(self.read(path), path.read_bytes())
+
+        data = os.urandom(90 * 1024)
+        mtime_ns = path.stat().st_mtime_ns
+        path.write_bytes(data)
+        os.utime(path, ns=(mtime_ns + 1000, mtime_ns + 1000))
+        self.assertIsNone(self.read(path))
+        self.assertEqual(self.read(path), data)
+
+    def test_least_recently_used_entry_is_evicted_under_pressure(self):
+        # Each entry takes the one 8 MiB chunk of the single-page arena.
+        first, second = self.write("a.ts", 5 * 1024 * 1024), self.write("b.ts", 5 * 1024 * 1024)
+        with override_settings(SEGMENT_CACHE_LEASE=-1):
+            self.read(first)
+            self.read(first)
+            self.read(second)
+            self.assertTrue(self.read(second) == second.read_bytes())
+            stats = self.cache.stats()
+            self.assertEqual((stats["evicted"], stats["entries"], stats["hits"]), (1, 1, 0))
+            self.assertTrue(self.read(second) == second.read_bytes())
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_leased_entry_is_kept_until_the_lease_ends(self):
+        first, second = self.write("a.ts", 5 * 1024 * 1024), self.write("b.ts", 5 * 1024 * 1024)
+        now = 1_000_000.0
+        with mock.patch("content_app.api.segment_cache.time.time", side_effect=lambda: now):
+            self.read(first)
+            self.read(first)
+            self.read(second)
+            self.assertIsNone(self.read(second))
+            self.assertTrue(self.read(first) == first.read_bytes())
+            now += 61
+            self.assertTrue(self.read(second) == second.read_bytes())
+        self.assertEqual(self.cache.stats()["evicted"], 1)
+
+    def test_async_delivery_streams_hits_from_the_cache(self):
+        path = self.write("segment_000.ts", 100 * 1024)
+
+        async def fetch():
+            response = await aserve_file(
+                RequestFactory().get("/", HTTP_RANGE="bytes=10-19"), path, "video/mp2t", hot_cache=True
+            )
+            return response.status_code, b"".join([chunk async for chunk in response])
+
+        with mock.patch("content_app.api.delivery.segment_cache", self.cache):
+            self.assertEqual(asyncio.run(fetch()), (206, path.read_bytes()[10:20]))
+            self.assertEqual(asyncio.run(fetch()), (206, path.read_bytes()[10:20]))
+        self.assertEqual(self.cache.stats()["hits"], 0)
+        self.assertEqual(self.cache.stats()["admitted"], 1)
+
+
+class SegmentIndexTests(SimpleTestCase):
+    CMAF_PLAYLIST = (
+        '#EXTM3U\n#EXT-X-TARGETDURATION:4\n#EXT-X-MAP:URI="init.mp4"\n'
+        "#EXTINF:4.0,\n#EXT-X-BYTERANGE:1000@0\nmedia.m4s\n"
+        "#EXTINF:4.0,\n#EXT-X-BYTERANGE:900@1000\nmedia.m4s\n"
+    )
+
+    def write_rendition(self, playlist, files=()):
+        output_dir = temp_dir(self)
+        (output_dir / "index.m3u8").write_text(playlist)
+        for name, size in files:
+            (output_dir / name).write_bytes(b"\0" * size)
+        return output_dir
+
+    def assert_round_trip(self, output_dir):
+        index_path = write_segment_index(output_dir)
+        self.assertEqual(parse_segment_index(index_path.read_bytes()), build_segment_index(output_dir))
+
+    def test_ts_rendition_round_trip(self):
+        output_dir = self.write_rendition(
+            "#EXTM3U\n#EXT-X-TARGETDURATION:4\n"
+            "#EXTINF:4.000000,\nsegment_000.ts\n#EXTINF:1.5,\nsegment_001.ts\n#EXT-X-ENDLIST\n",
+            [("segment_000.ts", 1880), ("segment_001.ts", 752)],
+        )
+        self.assert_round_trip(output_dir)
+        index = build_segment_index(output_dir)
+        self.assertEqual(index["segments"], [("segment_000.ts", 4.0, 1880, 0), ("segment_001.ts", 1.5, 752, 0)])
+        self.assertTrue(index["endlist"])
+
+    def test_cmaf_rendition_round_trip(self):
+        output_dir = self.write_rendition(self.CMAF_PLAYLIST, [("init.mp4", 800), ("media.m4s", 1900)])
+        self.assert_round_trip(output_dir)
+        index = build_segment_index(output_dir)
+        self.assertEqual(index["map_uri"], "init.mp4")
+        self.assertTrue(index["byteranges"])
+        self.assertFalse(index["endlist"])
+        self.assertEqual(set(index["versions"]), {"init.mp4", "media.m4s"})
+
+    def test_playlist_names_every_file_with_its_version(self):
+        output_dir = self.write_rendition(self.CMAF_PLAYLIST, [("init.mp4", 800), ("media.m4s", 1900)])
+        write_segment_index(output_dir)
+        entry = load_rendition_playlist(output_dir)
+        init_version = file_version((output_dir / "init.mp4").stat())
+        media_version = file_version((output_dir / "media.m4s").stat())
+        body = entry["body"].decode()
+        self.assertIn(f'#EXT-X-MAP:URI="init.mp4?v={init_version}"', body)
+        self.assertEqual(body.count(f"\nmedia.m4s?v={media_version}\n"), 2)
+        signed = b"&token=t".join(entry["template"]).decode()
+        self.assertIn(f'URI="init.mp4?v={init_version}&token=t"', signed)
+        self.assertEqual(signed.count(f"\nmedia.m4s?v={media_version}&token=t\n"), 2)
+
+    def test_unindexed_rendition_is_indexed_in_memory(self):
+        output_dir = self.write_rendition(self.CMAF_PLAYLIST, [("init.mp4", 800), ("media.m4s", 1900)])
+        unindexed = load_rendition_playlist(output_dir)
+        write_segment_index(output_dir)
+        self.assertEqual(unindexed["body"], load_rendition_playlist(output_dir)["body"])
+
+    def test_foreign_data_is_rejected(self):
+        for data in (b"", b"VFSI", b"XXXX" + b"\0" * 40):
+            with self.assertRaises(ValueError):
+                parse_segment_index(data)
+
+
+class RequestedWidthTests(SimpleTestCase):
+    def width(self, value):
+        return requested_width(RequestFactory().get("/", {"w": value}))
+
+    def test_ascii_width_is_parsed(self):
+        self.assertEqual(self.width("320"), 320)
+        self.assertIsNone(requested_width(RequestFactory().get("/")))
+
+    def test_unusable_width_is_ignored(self):
+        for value in ("0", "-1", "abc", "²", "٣٢٠", "1" * 5000):
+            self.assertIsNone(self.width(value), value[:10])
+
+
+class KeysetCursorTests(SimpleTestCase):
+    def decode(self, pagination, cursor):
+        return pagination.decode_cursor(Request(RequestFactory().get("/", {"cursor": cursor})))
+
+    def test_created_at_cursor_round_trip(self):
+        pagination = KeysetPagination()
+        position = (KeysetPagination().key_from_text("2026-03-01T12:30:00.123456+00:00"), 42)
+        self.assertEqual(self.decode(pagination, pagination.encode_cursor(position)), position)
+
+    def test_rank_cursor_round_trip_is_exact(self):
+        pagination = RankedKeysetPagination()
+        position = (0.1 + 0.2, 7)
+        self.assertEqual(self.decode(pagination, pagination.encode_cursor(position)), position)
+
+    def test_first_page_has_no_cursor(self):
+        self.assertIsNone(KeysetPagination().decode_cursor(Request(RequestFactory().get("/"))))
+
+    def test_malformed_cursor_is_not_found(self):
+        for cursor in ("%%%", base64.urlsafe_b64encode(b"yesterday|1").decode()):
+            with self.assertRaises(NotFound):
+                self.decode(KeysetPagination(), cursor)
+        with self.assertRaises(NotFound):
+            self.decode(RankedKeysetPagination(), base64.urlsafe_b64encode(b"nan|1").decode())
+
+    def test_id_outside_bigint_is_not_found(self):
+        for pk in (2 ** 63, -(2 ** 63) - 1, 10 ** 30):
+            cursor = base64.urlsafe_b64encode(f"2026-03-01T12:30:00+00:00|{pk}".encode()).decode()
+            with self.assertRaises(NotFound):
+                self.decode(KeysetPagination(), cursor)
+
+
+class CatalogEntryTests(SimpleTestCase):
+    def test_entry_of_the_current_version_is_served(self):
+        self.assertEqual(entry_body(b'12:{"next":null}', b"12"), b'{"next":null}')
+
+    def test_entry_of_another_version_is_a_miss(self):
+        self.assertIsNone(entry_body(b'11:{"next":null}', b"12"))
+        self.assertIsNone(entry_body(None, b"12"))
+
+
+class CatalogNotModifiedTests(SimpleTestCase):
+    etag = '"3.1700000000-abc"'
+
+    def revalidate(self, if_none_match, **headers):
+        request = RequestFactory().get("/api/video/", HTTP_IF_NONE_MATCH=if_none_match, **headers)
+        return not_modified_response(request, self.etag, 1700000000)
+
+    def test_identity_copy_revalidates_for_compressing_client(self):
+        response = self.revalidate(self.etag, HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], self.etag)
+
+    def test_compressed_copy_revalidates(self):
+        for encoding in ENCODINGS:
+            response = self.revalidate(f'W/"3.1700000000-abc-{encoding}"', HTTP_ACCEPT_ENCODING=encoding)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response["ETag"], f'"3.1700000000-abc-{encoding}"')
+
+    def test_other_version_is_sent_again(self):
+        self.assertIsNone(self.revalidate('"2.1700000000-abc"'))
+        self.assertIsNone(self.revalidate('"2.1700000000-abc-gzip"', HTTP_ACCEPT_ENCODING="gzip"))
+
+
+class SearchQueryTests(SimpleTestCase):
+    def tsquery(self, text):
+        query = search_query(text)
+        return None if query is None else query.source_expressions[-1].value
+
+    def test_last_word_matches_as_prefix(self):
+        self.assertEqual(self.tsquery("dark kni"), "dark & kni:*")
+
+    def test_finished_or_short_last_word_matches_whole(self):
+        self.assertEqual(self.tsquery("dark knight "), "dark & knight")
+        self.assertEqual(self.tsquery("plan b"), "plan & b")
+
+    def test_tsquery_syntax_only_separates_words(self):
+        self.assertEqual(self.tsquery("a|b & !c:* (d)"), "a & b & c & d")
+
+    def test_no_words_is_no_query(self):
+        for text in ("", "   ", "&|!"):
+            self.assertIsNone(self.tsquery(text))
+
+    def test_terms_are_bounded(self):
+        words = [f"w{n}" for n in range(MAX_SEARCH_TERMS + 2)]
+        self.assertEqual(self.tsquery(" ".join(words)).split(" & "), words[:MAX_SEARCH_TERMS - 1] + ["w7:*"])
@@ -62,6 +62,7 @@ INSTALLED_APPS = [
     'django_filters',
     'django_rq',
     'django.contrib.admin',
+    'django.contrib.postgres',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -134,8 +135,57 @@ RQ_QUEUES = {
         'DEFAULT_TIMEOUT': 900,
         'REDIS_CLIENT_KWARGS': {},
     },
+    'transcode': {
+        'HOST': os.environ.get("REDIS_HOST", default="redis"),
+        'PORT': os.environ.get("REDIS_PORT", default=6379),
+        'DB': os.environ.get("REDIS_DB", default=0),
+        'DEFAULT_TIMEOUT': 900,
+        'REDIS_CLIENT_KWARGS': {},
+    },
 }
 
+# Video transcoding
+# "parallel" enqueues one job per rendition on the transcode queue,
+# "single_pass" decodes the source once for all renditions in one job,
+# "per_rendition" runs the renditions one after another in one job.
+HLS_ENCODE_MODE = os.environ.get("HLS_ENCODE_MODE", default="parallel")
+# "ts" writes one MPEG-TS file per segment, "cmaf" one fragmented-MP4 file
+# per rendition addressed by EXT-X-BYTERANGE.
+HLS_SEGMENT_FORMAT = os.environ.get("HLS_SEGMENT_FORMAT", default="ts")
+
+# ffmpeg CPU budget per host: TRANSCODE_CPU_BUDGET cores (0 = all but
+# TRANSCODE_RESERVED_CPUS, which stay free for web traffic), split into
+# processes of TRANSCODE_THREADS threads. Encodes run niced by TRANSCODE_NICE.
+TRANSCODE_CPU_BUDGET = int(os.environ.get("TRANSCODE_CPU_BUDGET", default=0))
+TRANSCODE_RESERVED_CPUS = int(os.environ.get("TRANSCODE_RESERVED_CPUS", default=1))
+TRANSCODE_THREADS = int(os.environ.get("TRANSCODE_THREADS", default=4))
+TRANSCODE_NICE = int(os.environ.get("TRANSCODE_NICE", default=10))
+TRANSCODE_SLOT_DIR = os.environ.get("TRANSCODE_SLOT_DIR", default="/tmp/videoflix-ffmpeg-slots")
+# Encode job timeouts: TRANSCODE_MIN_TIMEOUT seconds plus
+# TRANSCODE_TIMEOUT_FACTOR seconds per second of source and 1080p30 of output.
+TRANSCODE_MIN_TIMEOUT = int(os.environ.get("TRANSCODE_MIN_TIMEOUT", default=900))
+TRANSCODE_TIMEOUT_FACTOR = float(os.environ.get("TRANSCODE_TIMEOUT_FACTOR", default=3))
+
+# Chunked uploads: maximum size of a whole source video and of one chunk (bytes).
+UPLOAD_MAX_SIZE = int(os.environ.get("UPLOAD_MAX_SIZE", default=50 * 1024 ** 3))
+UPLOAD_MAX_CHUNK_SIZE = int(os.environ.get("UPLOAD_MAX_CHUNK_SIZE", default=64 * 1024 ** 2))
+# Unfinished uploads are removed this many hours after their last chunk.
+UPLOAD_EXPIRY_HOURS = int(os.environ.get("UPLOAD_EXPIRY_HOURS", default=24))
+
+# Trickplay sprite sheets: one tile every TRICKPLAY_INTERVAL seconds,
+# COLUMNS x ROWS tiles of TRICKPLAY_TILE_WIDTH pixels per sheet.
+TRICKPLAY_INTERVAL = int(os.environ.get("TRICKPLAY_INTERVAL", default=10))
+TRICKPLAY_TILE_WIDTH = int(os.environ.get("TRICKPLAY_TILE_WIDTH", default=160))
+TRICKPLAY_COLUMNS = int(os.environ.get("TRICKPLAY_COLUMNS", default=5))
+TRICKPLAY_ROWS = int(os.environ.get("TRICKPLAY_ROWS", default=5))
+
+# Responsive thumbnails derived from the poster: every width (up to the
+# source's) in every format, picked per request from Accept and ?w=.
+# Catalog cards link the THUMBNAIL_CARD_WIDTH variant plus a srcset.
+THUMBNAIL_WIDTHS = [int(width) for width in os.environ.get("THUMBNAIL_WIDTHS", default="320,640,1280").split(",")]
+THUMBNAIL_FORMATS = os.environ.get("THUMBNAIL_FORMATS", default="avif,webp,jpeg").split(",")
+THUMBNAIL_CARD_WIDTH = int(os.environ.get("THUMBNAIL_CARD_WIDTH", default=640))
+
 
 EMAIL_BACKEND = os.getenv("EMAIL_BACKEND", "django.core.mail.backends.smtp.EmailBackend")
 EMAIL_HOST = os.getenv("EMAIL_HOST", "localhost")
@@ -186,6 +236,52 @@ STATIC_ROOT = BASE_DIR / "static"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Playlists kept per web worker in the in-process manifest LRU.
+MANIFEST_CACHE_SIZE = int(os.environ.get("MANIFEST_CACHE_SIZE", default=1024))
+
+# Catalog page size of VideoListView, and the most a client may ask for.
+VIDEO_PAGE_SIZE = int(os.environ.get("VIDEO_PAGE_SIZE", default=50))
+VIDEO_PAGE_SIZE_MAX = int(os.environ.get("VIDEO_PAGE_SIZE_MAX", default=200))
+
+# Seconds catalog pages stay in Redis; a new catalog version replaces
+# them earlier.
+CATALOG_CACHE_TTL = int(os.environ.get("CATALOG_CACHE_TTL", default=3600))
+
+# Compressed catalog response bodies kept per web worker.
+COMPRESSION_CACHE_SIZE = int(os.environ.get("COMPRESSION_CACHE_SIZE", default=256))
+
+# Seconds each web worker caches answers of the Redis playable index.
+PLAYABLE_INDEX_TTL = float(os.environ.get("PLAYABLE_INDEX_TTL", default=5))
+
+# "wsgi" runs gunicorn with sync workers; "asgi" runs uvicorn workers and
+# routes the manifest, segment and thumbnail endpoints to async views.
+SERVER_INTERFACE = os.environ.get("SERVER_INTERFACE", default="wsgi")
+
+# Signed segment URLs: playlists require a login and sign their segment
+# URIs with an HMAC token; segments are served on a valid token alone.
+# Tokens live SEGMENT_URL_TTL seconds (long enough for a VOD playlist
+# loaded once at the start of playback), expiries are rounded to buckets.
+SIGNED_MEDIA_URLS = os.environ.get("SIGNED_MEDIA_URLS", default="True") == "True"
+SEGMENT_URL_TTL = int(os.environ.get("SEGMENT_URL_TTL", default=4 * 3600))
+SEGMENT_URL_BUCKET = int(os.environ.get("SEGMENT_URL_BUCKET", default=300))
+
+# How media views send files: "django" streams them from the worker,
+# "x-accel" (nginx) and "x-sendfile" (Apache, lighttpd) only authorise the
+# request and let the front proxy send the file. For nginx, MEDIA_ROOT must
+# be served by an `internal` location at MEDIA_ACCEL_PREFIX.
+MEDIA_DELIVERY_MODE = os.environ.get("MEDIA_DELIVERY_MODE", default="django")
+MEDIA_ACCEL_PREFIX = os.environ.get("MEDIA_ACCEL_PREFIX", default="/protected-media/")
+
+# Hot segment cache shared by the web workers of a host through a
+# memory-mapped arena file of SEGMENT_CACHE_MB MiB (0 disables it). Keep
+# the file on tmpfs and give it room: Docker's /dev/shm defaults to 64 MiB.
+# Segments are admitted after SEGMENT_CACHE_ADMIT_HITS requests; a hit is
+# kept from eviction for SEGMENT_CACHE_LEASE seconds while it is sent.
+SEGMENT_CACHE_MB = int(os.environ.get("SEGMENT_CACHE_MB", default=0))
+SEGMENT_CACHE_PATH = os.environ.get("SEGMENT_CACHE_PATH", default="/dev/shm/videoflix-segments")
+SEGMENT_CACHE_ADMIT_HITS = int(os.environ.get("SEGMENT_CACHE_ADMIT_HITS", default=2))
+SEGMENT_CACHE_LEASE = float(os.environ.get("SEGMENT_CACHE_LEASE", default=120))
+
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 # Default primary key field type